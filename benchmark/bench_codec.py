@@ -0,0 +1,67 @@
+"""
+比较各编码与压缩方式下推送消息的大小与编解码耗时
+size为单条推送的平均字节数，batch_size为批量推送时平均每条消息的字节数
+
+用法：python benchmark/bench_codec.py [--count 600] [--batch 50] [--level 6]
+"""
+from __future__ import annotations
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from push import codec
+from benchmark.sample import make_messages
+
+def bench(messages: list[dict], encoding: str, compression: str, level: int, batch: int) -> dict:
+    # 单条推送
+    start_time = time.perf_counter()
+    payloads = [codec.compress(codec.encode(msg, encoding), compression, level) for msg in messages]
+    encode_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    for payload in payloads:
+        codec.decode(payload, encoding, compression)
+    decode_time = time.perf_counter() - start_time
+    # 批量推送，整个数组一起压缩
+    batch_size = 0
+    batch_count = 0
+    for i in range(0, len(messages), batch):
+        raw_list = [codec.encode(msg, encoding) for msg in messages[i:i + batch]]
+        batch_size += len(codec.compress(codec.encode_array(raw_list, encoding), compression, level))
+        batch_count += len(raw_list)
+    return {
+        "size": sum([len(payload) for payload in payloads]) / len(payloads),
+        "batch_size": batch_size / batch_count,
+        "encode": encode_time / len(messages) * 1e6,
+        "decode": decode_time / len(messages) * 1e6
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=600, help="消息数量")
+    parser.add_argument("--batch", type=int, default=50, help="批量推送的消息数")
+    parser.add_argument("--level", type=int, default=6, help="压缩等级")
+    args = parser.parse_args()
+    messages = make_messages(args.count)
+    encodings = [encoding for encoding in codec.ENCODINGS if codec.is_available(encoding)]
+    if len(encodings) < len(codec.ENCODINGS):
+        print("未安装msgpack,跳过MessagePack编码\n")
+    results = dict()
+    for encoding in encodings:
+        for compression in codec.COMPRESSIONS:
+            results[(encoding, compression)] = bench(messages, encoding, compression, args.level, args.batch)
+    base = results[("json", "none")]
+    print(f"消息数:{args.count} 批量大小:{args.batch} 压缩等级:{args.level}")
+    print(f"{'format':<18}{'size':>12}{'ratio':>10}{'batch_size':>14}{'ratio':>10}{'encode_us':>12}{'decode_us':>12}")
+    for (encoding, compression), res in results.items():
+        print(
+            f"{encoding + '+' + compression:<18}"
+            f"{res['size']:>12.1f}{res['size'] / base['size']:>10.2f}"
+            f"{res['batch_size']:>14.1f}{res['batch_size'] / base['batch_size']:>10.2f}"
+            f"{res['encode']:>12.1f}{res['decode']:>12.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+推送吞吐量与延迟测试，启动本地的模拟Webhook服务与Websocket客户端，其中部分客户端较慢或推送失败，
+向推送引擎注入模拟的微博、动态与直播消息，统计不同客户端数与订阅数下的推送速率与延迟
+
+用法：python benchmark/bench_delivery.py [--clients 1,4,16] [--uids 10,100,1000] [--messages 2000] [--ws 0.5] [--slow 0.1] [--failing 0.1]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+from aiohttp import web
+
+from push.engine import DeliveryEngine
+from push.stats import LatencyStat
+from push.websocket import AiohttpConnection
+from benchmark.sample import make_messages
+
+HOST = "127.0.0.1"
+SLOW_DELAY = 0.02
+
+class Receiver:
+    """统计同一类客户端收到的消息数与推送延迟"""
+    def __init__(self) -> None:
+        self.latency = LatencyStat(100000)
+        self.received = 0
+
+    def on_message(self, data):
+        msg = json.loads(data)
+        self.received += 1
+        self.latency.add(time.time() - msg["bench_time"])
+
+class Bench:
+    def __init__(self, args: argparse.Namespace, client_count: int, uid_count: int) -> None:
+        self.args = args
+        self.client_count = client_count
+        self.uid_count = uid_count
+        self.push_config_dict: dict = {"clients": {}}
+        self.ws_conn_dict: dict = dict()
+        self.kinds: dict[str, str] = dict()
+        self.receivers = {kind: Receiver() for kind in ("normal", "slow", "failing")}
+        self.ws_tasks: list[asyncio.Task] = []
+        self.port = args.port
+
+    def get_kind(self, i: int) -> str:
+        # 按比例分配慢速与失败的客户端
+        if i < round(self.client_count * self.args.failing):
+            return "failing"
+        if i < round(self.client_count * (self.args.failing + self.args.slow)):
+            return "slow"
+        return "normal"
+
+    async def webhook(self, req: web.Request):
+        kind = req.match_info["kind"]
+        if kind == "failing":
+            return web.Response(status=503)
+        data = await req.read()
+        if kind == "slow":
+            await asyncio.sleep(SLOW_DELAY)
+        self.receivers[kind].on_message(data)
+        return web.Response(text="ok")
+
+    async def ws_handler(self, req: web.Request):
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(req)
+        self.ws_conn_dict[req.match_info["client_name"]] = AiohttpConnection(websocket)
+        async for _ in websocket:
+            pass
+        return websocket
+
+    async def ws_client(self, session: aiohttp.ClientSession, client_name: str, kind: str):
+        async with session.ws_connect(f"http://{HOST}:{self.port}/ws/{client_name}") as websocket:
+            async for message in websocket:
+                if kind == "slow":
+                    await asyncio.sleep(SLOW_DELAY)
+                self.receivers[kind].on_message(message.data)
+
+    def subscribe(self, client_name: str, messages: list[dict]):
+        uids = sorted(set([msg["user"]["uid"] for msg in messages]))
+        # 每个客户端订阅uid_count个用户，订阅不同的用户以模拟不同的订阅分布
+        start = int(client_name.split("_")[-1]) * self.uid_count % len(uids)
+        for uid in (uids[start:] + uids[:start])[:self.uid_count]:
+            for typ in ("weibo", "bili_dyn", "bili_live"):
+                self.push_config_dict.setdefault(typ, {}).setdefault(uid, set()).add(client_name)
+                self.push_config_dict[typ].setdefault("comment", {}).setdefault(uid, set()).add(client_name)
+
+    async def run(self, messages: list[dict]) -> dict:
+        app = web.Application()
+        app.router.add_post("/hook/{kind}", self.webhook)
+        app.router.add_get("/ws/{client_name}", self.ws_handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, HOST, self.port).start()
+        session = aiohttp.ClientSession()
+        ws_count = round(self.client_count * self.args.ws)
+        for i in range(self.client_count):
+            kind = self.get_kind(i)
+            client_name = f"client_{i}"
+            self.kinds[client_name] = kind
+            if kind != "failing" and i >= self.client_count - ws_count:
+                self.push_config_dict["clients"][client_name] = "websocket"
+                self.ws_tasks.append(asyncio.create_task(self.ws_client(session, client_name, kind)))
+            else:
+                self.push_config_dict["clients"][client_name] = f"http://{HOST}:{self.port}/hook/{kind}"
+            self.subscribe(client_name, messages)
+        while len(self.ws_conn_dict) < len(self.ws_tasks):
+            await asyncio.sleep(0.01)
+        engine = DeliveryEngine(self.push_config_dict, self.ws_conn_dict)
+        await engine.start()
+        expected = sum([len(engine.get_clients(msg) - set([name for name, kind in self.kinds.items() if kind != "normal"])) for msg in messages])
+        start_time = time.time()
+        for msg in messages:
+            msg["bench_time"] = time.time()
+            await engine.put(msg)
+            if self.args.rate > 0:
+                await asyncio.sleep(1 / self.args.rate)
+        # 等待正常的客户端收到所有消息
+        deadline = time.time() + self.args.timeout
+        while self.receivers["normal"].received < expected and time.time() < deadline:
+            await asyncio.sleep(0.01)
+        elapsed = time.time() - start_time
+        stats = engine.get_stats()
+        for task in self.ws_tasks:
+            task.cancel()
+        await engine.stop()
+        await session.close()
+        await runner.cleanup()
+        return {
+            "expected": expected,
+            "elapsed": elapsed,
+            "normal": self.receivers["normal"],
+            "slow": self.receivers["slow"],
+            "failed": sum([client["failed"] for client in stats["clients"].values()]),
+            "dropped": sum([client["dropped"] for client in stats["clients"].values()])
+        }
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=str, default="1,4,16", help="客户端数量，多个用,分隔")
+    parser.add_argument("--uids", type=str, default="10", help="每个客户端订阅的用户数，多个用,分隔")
+    parser.add_argument("--messages", type=int, default=2000, help="注入的消息数")
+    parser.add_argument("--rate", type=float, default=0, help="每秒注入的消息数，0为不限制")
+    parser.add_argument("--ws", type=float, default=0.5, help="Websocket客户端的比例")
+    parser.add_argument("--slow", type=float, default=0.1, help="慢速客户端的比例")
+    parser.add_argument("--failing", type=float, default=0.1, help="推送失败的客户端的比例")
+    parser.add_argument("--timeout", type=float, default=60, help="等待推送完成的最长时间（秒）")
+    parser.add_argument("--port", type=int, default=18765, help="模拟服务的端口")
+    parser.add_argument("--verbose", action="store_true", help="输出推送引擎的日志")
+    args = parser.parse_args()
+    if not args.verbose:
+        # 失败的客户端会产生大量错误日志
+        logging.getLogger("crawler").setLevel(logging.CRITICAL)
+    print(f"消息数:{args.messages} Websocket比例:{args.ws} 慢速比例:{args.slow} 失败比例:{args.failing}")
+    print(f"{'clients':>8}{'uids':>8}{'deliveries':>12}{'msg/s':>10}{'p50_ms':>10}{'p99_ms':>10}{'slow_p50':>10}{'slow_p99':>10}{'failed':>8}{'dropped':>8}")
+    for client_count in [int(count) for count in args.clients.split(",")]:
+        for uid_count in [int(count) for count in args.uids.split(",")]:
+            # 每轮使用相同的消息，uid取值范围为订阅数的4倍以便订阅命中
+            messages = make_messages(args.messages)
+            for i, msg in enumerate(messages):
+                msg["user"]["uid"] = str(i % max(uid_count * 4, 1))
+            res = await Bench(args, client_count, uid_count).run(messages)
+            normal = res["normal"].latency.to_dict()
+            slow = res["slow"].latency.to_dict()
+            if res["normal"].received < res["expected"]:
+                print(f"客户端数{client_count} 订阅用户数{uid_count}: 超时，仅收到{res['normal'].received}/{res['expected']}条消息")
+            print(
+                f"{client_count:>8}{uid_count:>8}{res['normal'].received:>12}{res['normal'].received / res['elapsed']:>10.0f}"
+                f"{normal['p50']:>10.2f}{normal['p99']:>10.2f}{slow['p50']:>10.2f}{slow['p99']:>10.2f}"
+                f"{res['failed']:>8}{res['dropped']:>8}"
+            )
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""
+比较用户记录使用dict与使用__slots__记录类（UID共用字符串对象）时的内存占用与遍历耗时，
+记录与推送配置均从JSON解析得到，与从数据库和push_config.json加载时相同，每个用户订阅了微博与评论
+
+用法：python benchmark/bench_memory.py [--users 10000,100000] [--clients 3]
+"""
+from __future__ import annotations
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.record import WeiboRecord, intern_uid
+from benchmark.sample import make_user
+
+def make_json(count: int, client_count: int) -> tuple[str, str]:
+    now = int(time.time())
+    records = dict()
+    push_config = {"weibo": {"comment": {}}}
+    for i in range(count):
+        uid = str(1000000000 + i)
+        user = make_user(int(uid))
+        del user["uid"]
+        records[uid] = {"last_wb_time": now, "update_time": now, "user": user}
+        if i % 10 == 0:
+            records[uid]["cmt_config"] = {"last_wb_cmt_time": now}
+            push_config["weibo"]["comment"][uid] = [f"client_{j}" for j in range(client_count)]
+        push_config["weibo"][uid] = [f"client_{j}" for j in range(client_count)]
+    return json.dumps(records), json.dumps(push_config)
+
+def load_dict(records_json: str, push_config_json: str):
+    records = json.loads(records_json)
+    push_config = json.loads(push_config_json)
+    typ_dict = push_config["weibo"]
+    for x, value in list(typ_dict.items()):
+        if type(value) == dict:
+            typ_dict[x] = {uid: set(clients) for uid, clients in value.items()}
+        else:
+            typ_dict[x] = set(value)
+    return records, push_config
+
+def load_slots(records_json: str, push_config_json: str):
+    records = {intern_uid(uid): WeiboRecord(**record) for uid, record in json.loads(records_json).items()}
+    push_config = json.loads(push_config_json)
+    typ_dict = dict()
+    for x, value in push_config["weibo"].items():
+        if type(value) == dict:
+            typ_dict[x] = {intern_uid(uid): set(clients) for uid, clients in value.items()}
+        else:
+            typ_dict[intern_uid(x)] = set(value)
+    push_config["weibo"] = typ_dict
+    return records, push_config
+
+def measure(load, records_json: str, push_config_json: str) -> tuple[int, object]:
+    gc.collect()
+    tracemalloc.start()
+    data = load(records_json, push_config_json)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, data
+
+def scan(records: dict, rounds: int) -> float:
+    """与监听循环相同的访问方式，遍历所有用户读取时间字段"""
+    start_time = time.perf_counter()
+    for _ in range(rounds):
+        now = time.time()
+        for uid in list(records.keys()):
+            if now - records[uid].get("update_time", 0) > 600 and records[uid]["last_wb_time"] > 0:
+                pass
+    return (time.perf_counter() - start_time) / rounds
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=str, default="10000,100000", help="用户数，多个用,分隔")
+    parser.add_argument("--clients", type=int, default=3, help="订阅每个用户的客户端数")
+    parser.add_argument("--rounds", type=int, default=5, help="遍历耗时的测量次数")
+    args = parser.parse_args()
+    print(f"{'users':>8}{'mode':>8}{'total_MB':>10}{'per_user_B':>12}{'scan_ms':>10}")
+    for count in [int(count) for count in args.users.split(",")]:
+        records_json, push_config_json = make_json(count, args.clients)
+        for mode, load in (("dict", load_dict), ("slots", load_slots)):
+            size, data = measure(load, records_json, push_config_json)
+            scan_time = scan(data[0], args.rounds)
+            print(f"{count:>8}{mode:>8}{size / 1024 / 1024:>10.2f}{size / count:>12.0f}{scan_time * 1000:>10.2f}")
+            del data
+
+if __name__ == "__main__":
+    main()
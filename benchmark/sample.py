@@ -0,0 +1,102 @@
+from __future__ import annotations
+import random
+import time
+
+# 模拟爬虫产生的推送消息，字段结构与各爬虫的解析结果一致
+
+COOKIE = "; ".join([f"key_{i}={''.join(random.choices('0123456789abcdef', k=32))}" for i in range(12)])
+TEXT = "今天的直播就到这里啦，感谢大家的陪伴！下周同一时间不见不散~ #日常# https://t.cn/A6abcdEf "
+
+def make_user(uid: int) -> dict:
+    return {
+        "uid": str(uid),
+        "name": f"用户{uid}",
+        "avatar": f"https://tvax1.sinaimg.cn/crop.0.0.1080.1080.1024/{uid:016x}ly8h0abcdefj20u00u0q5k.jpg",
+        "desc": "个人简介个人简介个人简介，商务合作请私信"
+    }
+
+def make_weibo(uid: int, retweet: bool = False) -> dict:
+    msg = {
+        "type": "weibo",
+        "subtype": "weibo",
+        "id": str(random.randint(4900000000000000, 4999999999999999)),
+        "mid": str(random.randint(4900000000000000, 4999999999999999)),
+        "user": make_user(uid),
+        "text": TEXT * random.randint(1, 4),
+        "pics": [f"https://wx1.sinaimg.cn/large/{random.getrandbits(64):016x}.jpg" for _ in range(random.randint(0, 4))],
+        "followed_only": False,
+        "created_time": int(time.time())
+    }
+    if retweet:
+        msg["retweet"] = make_weibo(uid + 1)
+    return msg
+
+def make_dynamic(uid: int, retweet: bool = False) -> dict:
+    dyn_id = str(random.randint(900000000000000000, 999999999999999999))
+    msg = {
+        "type": "bili_dyn",
+        "subtype": "dynamic",
+        "dyn_type": "DYNAMIC_TYPE_FORWARD" if retweet else "DYNAMIC_TYPE_DRAW",
+        "id": dyn_id,
+        "user": make_user(uid),
+        "link": f"https://t.bilibili.com/{dyn_id}",
+        "created_time": int(time.time()),
+        "text": TEXT * random.randint(1, 3),
+        "pics": [f"https://i0.hdslb.com/bfs/new_dyn/{random.getrandbits(64):016x}.jpg" for _ in range(random.randint(0, 3))],
+        "cookie": COOKIE
+    }
+    if retweet:
+        msg["retweet"] = {
+            "dyn_type": "DYNAMIC_TYPE_AV",
+            "is_retweet": True,
+            "user": make_user(uid + 1),
+            "title": "【视频】标题标题标题",
+            "desc": TEXT,
+            "cover_pic": f"https://i0.hdslb.com/bfs/archive/{random.getrandbits(64):016x}.jpg",
+            "link": f"www.bilibili.com/video/BV1{random.getrandbits(40):010x}",
+            "created_time": int(time.time()) - 3600
+        }
+    return msg
+
+def make_comment(uid: int) -> dict:
+    root = make_dynamic(uid)
+    reply = {
+        "type": "bili_dyn",
+        "subtype": "comment",
+        "id": str(random.randint(100000000000, 999999999999)),
+        "user": make_user(uid + 2),
+        "text": TEXT,
+        "created_time": int(time.time())
+    }
+    return {
+        "type": "bili_dyn",
+        "subtype": "comment",
+        "id": str(random.randint(100000000000, 999999999999)),
+        "user": make_user(uid),
+        "text": TEXT,
+        "created_time": int(time.time()),
+        "reply": reply,
+        "root": root
+    }
+
+def make_live(uid: int) -> dict:
+    return {
+        "type": "bili_live",
+        "subtype": "status",
+        "user": make_user(uid),
+        "pre": 0,
+        "now": 1
+    }
+
+def make_messages(count: int, seed: int = 0) -> list[dict]:
+    """按固定比例生成各类型消息"""
+    random.seed(seed)
+    makers = [
+        lambda uid: make_weibo(uid),
+        lambda uid: make_weibo(uid, retweet=True),
+        lambda uid: make_dynamic(uid),
+        lambda uid: make_dynamic(uid, retweet=True),
+        make_comment,
+        make_live
+    ]
+    return [makers[i % len(makers)](random.randint(10000, 99999999)) for i in range(count)]
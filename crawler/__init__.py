@@ -0,0 +1,3 @@
+from crawler.embed import stream, add_user, remove_user
+
+__all__ = ["stream", "add_user", "remove_user"]
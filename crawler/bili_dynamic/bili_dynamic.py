@@ -4,12 +4,13 @@ import copy
 from datetime import datetime
 import os
 import logging
-from queue import Queue
+from asyncio import Queue
 import random
 import traceback
 from urllib.parse import urlparse
 import httpx
 import json
+from typing import Iterable
 from bs4 import BeautifulSoup
 from bilibili_api.user import User, RelationType
 from bilibili_api import Credential
@@ -17,9 +18,14 @@ from bilibili_api.exceptions.ResponseCodeException import ResponseCodeException
 from bilibili_api.comment import CommentResourceType, OrderType, get_comments
 
 from util.logger import init_logger
+from util.store import RecordTable, get_store
+from util.record import DynRecord
+from util.seen import get_seen
+from util.warm import wait_poll, set_poll_time
 
 record_path = os.path.join(os.path.dirname(__file__), "record.json")
 dyn_record_dict = None
+dyn_record_table: RecordTable = None
 logger = init_logger()
 
 def link_process(link: str) -> str:
@@ -61,18 +67,24 @@ def update_user(record: dict, typ: str, user: dict, msg_list: list):
         record["user"] = {}
     if "uid" in _user:
         del _user["uid"]
+    diff = dict()
     for key, value in record["user"].items():
         if key in _user and value != _user[key]:
-            msg_list.append({
-                "type": typ,
-                "subtype": key,
-                "user": user,
+            diff[key] = {
                 "pre": value,
                 "now": _user[key]
-            })
+            }
         elif not key in _user:
             _user[key] = value
             user[key] = value
+    if diff:
+        # 同时变化的多个字段合并为一条消息
+        msg_list.append({
+            "type": typ,
+            "subtype": "profile",
+            "user": user,
+            "diff": diff
+        })
     record["user"] = _user
 
 def get_dyn_oid_type(card: dict) -> tuple(int, CommentResourceType):
@@ -238,9 +250,12 @@ async def get_dynamic(bili_ua: str, bili_cookie: str, detail_enable: bool, comme
     cards_data = cards_data['data']['items']
     # with open("bili_dynamic.json", "w", encoding="utf-8") as f:
     #     f.write(json.dumps(cards_data, ensure_ascii=False, indent=4))
+    seen = get_seen("bili_dyn", "dynamic")
     now_dyn_time_dict = dict()
     for dyn_uid in dyn_user_dict:
         now_dyn_time_dict[dyn_uid] = dyn_user_dict[dyn_uid]["last_dyn_time"]
+    # 记录发生变化的用户，保存时只比较这些用户
+    changed_uid_set = set()
     for card in cards_data:
         uid = str(card['modules']['module_author']['mid'])
         if (not uid in dyn_user_dict): # 不是推送的人
@@ -274,27 +289,33 @@ async def get_dynamic(bili_ua: str, bili_cookie: str, detail_enable: bool, comme
         # if(detail_enable):
         #     update_user(dyn_user_dict[uid], "bili_dyn", user, dyn_list)
         #     dyn_user_dict[uid]["update_time"] = int(datetime.now().timestamp())
-        if (not dyn_user_dict[uid]["last_dyn_time"] < created_time):# 不是新动态
+        dyn_id = str(card['id_str'])
+        if (not seen.is_new(dyn_id, created_time, dyn_user_dict[uid]["last_dyn_time"])):# 不是新动态
             continue
+        # 解析期间其它监听可能获取到同一条动态，先标记为已推送
+        seen.add(dyn_id)
         # 以下是处理新动态的内容
         if now_dyn_time_dict[uid] < created_time:
             now_dyn_time_dict[uid] = created_time
+            changed_uid_set.add(uid)
         try:
             dyn = await parse_bili_dyn(card, user)
         except:
+            seen.discard(dyn_id)
             logger.info(f"一条B站动态解析错误，可能不是动态消息，已跳过")
             logger.debug(f"B站动态解析出错！错误信息：\n{traceback.format_exc()}\n原始动态：{card}")
             continue
         dyn_list.append(dyn)
-    for dyn_uid in now_dyn_time_dict.keys():
+    for dyn_uid in changed_uid_set:
         dyn_user_dict[dyn_uid]["last_dyn_time"] = now_dyn_time_dict[dyn_uid]
-    save_dyn_record()
+    save_dyn_record(changed_uid_set)
     dyn_list.reverse() # 按时间从前往后排序
     return dyn_list
 
 async def get_bili_users_detail(bili_ua: str, bili_cookie: str, uid_list: list[str]):
     global dyn_record_dict
     msg_list: list[dict] = []
+    updated_uid_list: list[str] = []
     dyn_user_dict: dict = dyn_record_dict["user"]
     if(len(dyn_user_dict) == 0):
         return msg_list
@@ -331,9 +352,10 @@ async def get_bili_users_detail(bili_ua: str, bili_cookie: str, uid_list: list[s
         update_user(dyn_user_dict[uid], "bili_dyn", user, msg_list)
         # 记录更新时间
         dyn_user_dict[uid]["update_time"] = int(datetime.now().timestamp())
+        updated_uid_list.append(uid)
     if not len(uid_list) == 0:
         logger.error(f"B站批量查询用户详情结果不完整!\n遗漏的UID列表:{uid_list}")
-    save_dyn_record()
+    save_dyn_record(updated_uid_list)
     return msg_list
 
 async def listen_bili_user_detail(dyn_config_dict: dict, msg_queue: Queue):
@@ -356,7 +378,7 @@ async def listen_bili_user_detail(dyn_config_dict: dict, msg_queue: Queue):
                 msg_list = await get_bili_users_detail(bili_ua, bili_cookie, update_uid_list)
                 if(msg_list):
                     for msg in msg_list:
-                        msg_queue.put(msg)
+                        await msg_queue.put(msg)
             except:
                 errmsg = traceback.format_exc()
                 logger.error(f"B站用户信息抓取出错!\n{errmsg}")
@@ -371,7 +393,7 @@ async def listen_dynamic(dyn_config_dict: dict, msg_queue: Queue):
     interval = dyn_config_dict["interval"]
     detail_enable = dyn_config_dict["detail_enable"]
     comment_limit = dyn_config_dict["comment_limit"]
-    await asyncio.sleep(1)
+    await wait_poll("bili_dyn_listener", interval)
     logger.info("开始抓取B站动态...")
     while(True):
         logger.debug("执行抓取B站动态")
@@ -383,12 +405,13 @@ async def listen_dynamic(dyn_config_dict: dict, msg_queue: Queue):
                     # attach_cookie(dyn)
                     dyn["ua"] = bili_ua
                     dyn["cookie"] = bili_cookie
-                    msg_queue.put(dyn)
+                    await msg_queue.put(dyn)
             else:
                 logger.debug(f"获取的B站动态列表：{dyn_list}")
         except:
             errmsg = traceback.format_exc()
             logger.error(f"B站动态抓取出错!\n{errmsg}")
+        set_poll_time("bili_dyn_listener")
         await asyncio.sleep(random.random()*15 + interval)
 
 async def get_dynamic_comment(dyn: dict, dyn_uid: str):
@@ -397,6 +420,7 @@ async def get_dynamic_comment(dyn: dict, dyn_uid: str):
     dyn_user_dict: dict = dyn_record_dict["user"]
     last_dyn_cmt_time = dyn_user_dict[dyn_uid]["cmt_config"].get("last_dyn_cmt_time", int(datetime.now().timestamp()))
     now_dyn_cmt_time = last_dyn_cmt_time
+    seen = get_seen("bili_dyn", "comment")
     resp = await get_comments(oid=dyn["oid"], type_=CommentResourceType(dyn["oid_type"]), order=OrderType.LIKE)
     comments = resp["replies"]
     if("upper" in resp and "top" in resp["upper"] and resp["upper"]["top"]):
@@ -404,7 +428,8 @@ async def get_dynamic_comment(dyn: dict, dyn_uid: str):
     if comments:
         for comment in comments:
             cmt = await parse_bili_dyn_cmt(comment)
-            if cmt["user"]["uid"] == dyn_uid and last_dyn_cmt_time < cmt["created_time"]:
+            if cmt["user"]["uid"] == dyn_uid and seen.is_new(cmt["id"], cmt["created_time"], last_dyn_cmt_time):
+                seen.add(cmt["id"])
                 if now_dyn_cmt_time < cmt["created_time"]:
                     now_dyn_cmt_time = cmt["created_time"]
                 _cmt = copy.deepcopy(cmt)
@@ -413,7 +438,8 @@ async def get_dynamic_comment(dyn: dict, dyn_uid: str):
             if "replies" in comment and not comment["replies"] is None:
                 for inner_comment in comment["replies"]:
                     inner_cmt = await parse_bili_dyn_cmt(inner_comment)
-                    if inner_cmt["user"]["uid"] == dyn_uid and last_dyn_cmt_time < inner_cmt["created_time"]:
+                    if inner_cmt["user"]["uid"] == dyn_uid and seen.is_new(inner_cmt["id"], inner_cmt["created_time"], last_dyn_cmt_time):
+                        seen.add(inner_cmt["id"])
                         if now_dyn_cmt_time < inner_cmt["created_time"]:
                             now_dyn_cmt_time = inner_cmt["created_time"]
                         inner_cmt["reply"] = cmt
@@ -428,7 +454,7 @@ async def listen_dynamic_comment(dyn_config_dict: dict, msg_queue: Queue):
     dyn_ua = dyn_config_dict["ua"]
     interval = dyn_config_dict["comment_interval"]
     limit = dyn_config_dict["comment_limit"]
-    await asyncio.sleep(1)
+    await wait_poll("bili_dyn_comment_listener", interval)
     # logger.info("更新抓取评论用户的B站动态列表...")
     # uid_list = list(dyn_record_dict["user"].keys())
     # for uid in uid_list:
@@ -459,7 +485,7 @@ async def listen_dynamic_comment(dyn_config_dict: dict, msg_queue: Queue):
                     update_user(dyn_record_dict["user"][uid], "bili_dyn", dyn_list[0]["user"], msg_list)
                     if(msg_list):
                         for msg in msg_list:
-                            msg_queue.put(msg)
+                            await msg_queue.put(msg)
                 except:
                     errmsg = traceback.format_exc()
                     logger.error(f"UID:{uid}的B站用户动态列表更新失败！\n{errmsg}")
@@ -477,7 +503,7 @@ async def listen_dynamic_comment(dyn_config_dict: dict, msg_queue: Queue):
                         now_dyn_cmt_time = max(now_dyn_cmt_time, cmt_time)
                         if(cmt_list):
                             for cmt in cmt_list:
-                                msg_queue.put(cmt)
+                                await msg_queue.put(cmt)
                     except ResponseCodeException as e:
                         if e.code == -404:
                             logger.error(f"B站动态评论抓取出错，ID为{dyn['id']}的动态可能已被删除")
@@ -490,7 +516,8 @@ async def listen_dynamic_comment(dyn_config_dict: dict, msg_queue: Queue):
                         errmsg = traceback.format_exc()
                         logger.error(f"B站动态评论抓取出错！错误信息：\n{errmsg}")
                 dyn_record_dict["user"][uid]["cmt_config"]["last_dyn_cmt_time"] = now_dyn_cmt_time
-                save_dyn_record()
+                save_dyn_record([uid])
+                set_poll_time("bili_dyn_comment_listener")
                 await asyncio.sleep(random.random()*5 + interval)
         if not is_cmt:
             await asyncio.sleep(interval)
@@ -524,10 +551,8 @@ async def add_dyn_user(dyn_uid: str, config_dict: dict) -> dict:
         try:
             await bili_follow(dyn_uid, config_dict)
             logger.info(f"成功关注B站用户！")
-            dyn_record_dict["user"][dyn_uid] = {
-                "last_dyn_time": int(datetime.now().timestamp())
-            }
-            save_dyn_record()
+            dyn_record_dict["user"][dyn_uid] = DynRecord(last_dyn_time=int(datetime.now().timestamp()))
+            save_dyn_record([dyn_uid])
         except ResponseCodeException as e:
             if(e.code != 22001 and e.code != 22014):
                 if(e.code == -101):
@@ -537,10 +562,8 @@ async def add_dyn_user(dyn_uid: str, config_dict: dict) -> dict:
                 resp = {"code": 8, "msg": "Follow bilibili user failed"}
             else:
                 logger.info(f"无需关注本账号！")
-                dyn_record_dict["user"][dyn_uid] = {
-                    "last_dyn_time": int(datetime.now().timestamp())
-                }
-                save_dyn_record()
+                dyn_record_dict["user"][dyn_uid] = DynRecord(last_dyn_time=int(datetime.now().timestamp()))
+                save_dyn_record([dyn_uid])
         except:
             errmsg = traceback.format_exc()
             logger.error(f"B站关注用户发生错误！\n{errmsg}")
@@ -560,7 +583,7 @@ async def add_dyn_cmt_user(dyn_uid: str, config_dict: dict, is_top: bool = False
                 "last_dyn_cmt_time": int(datetime.now().timestamp())
             }
             dyn_record_dict["user"][dyn_uid]["cmt_config"] = cmt_config
-            save_dyn_record()
+            save_dyn_record([dyn_uid])
         except:
             errmsg = traceback.format_exc()
             logger.error(f"B站动态添加抓取评论用户发生错误！错误信息：\n{errmsg}")
@@ -572,7 +595,7 @@ async def remove_dyn_user(dyn_uid: str, config_dict: dict):
     resp = {"code": 0, "msg": "Success" }
     if(dyn_uid in dyn_record_dict["user"]):
         del dyn_record_dict["user"][dyn_uid]
-        save_dyn_record()
+        save_dyn_record([dyn_uid])
     return resp
 
 async def remove_dyn_cmt_user(dyn_uid: str, config_dict: dict):
@@ -580,36 +603,55 @@ async def remove_dyn_cmt_user(dyn_uid: str, config_dict: dict):
     resp = {"code": 0, "msg": "Success" }
     if(dyn_uid in dyn_record_dict["user"] and "cmt_config" in dyn_record_dict["user"][dyn_uid]):
         del dyn_record_dict["user"][dyn_uid]["cmt_config"]
-        save_dyn_record()
+        save_dyn_record([dyn_uid])
     return resp
 
 def load_dyn_record():
-    global dyn_record_dict
+    global dyn_record_dict, dyn_record_table
     if(not dyn_record_dict is None):
         return
     try:
-        with open(record_path, "r", encoding="UTF-8") as f:
-            dyn_record_dict = json.loads(f.read())
+        # 首次启动时自动从record.json导入
+        dyn_record_table = get_store().get_table("bili_dyn", record_path, DynRecord)
+        dyn_record_dict = {
+            "user": dyn_record_table.load()
+        }
+        reset_uid_list = []
         for uid in dyn_record_dict["user"].keys():
             if(not type(dyn_record_dict["user"][uid]["last_dyn_time"]) == int):
                 dyn_record_dict["user"][uid]["last_dyn_time"] = int(datetime.now().timestamp())
+                reset_uid_list.append(uid)
                 logger.info(f"UID为{uid}的B站用户动态时间配置不正确，已重设为当前时间")
             if("cmt_config" in dyn_record_dict["user"][uid] and (not type(dyn_record_dict["user"][uid]["cmt_config"]["last_dyn_cmt_time"]) == int)):
                 dyn_record_dict["user"][uid]["cmt_config"]["last_dyn_cmt_time"] = int(datetime.now().timestamp())
+                reset_uid_list.append(uid)
                 logger.info(f"UID为{uid}的B站用户动态评论时间配置不正确，已重设为当前时间")
-    except FileNotFoundError:
-        dyn_record_dict = {
-            "user": dict()
-        }
-        save_dyn_record()
-        logger.info(f"未找到B站动态记录文件，已自动创建")
+        # 重设的时间也需要写入，否则重启后仍是不正确的值
+        if(reset_uid_list):
+            save_dyn_record(reset_uid_list)
     except:
         dyn_record_dict = {
             "user": dict()
         }
-        logger.error(f"读取B站动态记录文件错误\n{traceback.format_exc()}")
+        logger.error(f"读取B站动态记录错误\n{traceback.format_exc()}")
         
 
-def save_dyn_record():
-    with open(record_path, "w", encoding="UTF-8") as f:
-        f.write(json.dumps(dyn_record_dict))
\ No newline at end of file
+def save_dyn_record(uids: Iterable[str] = None):
+    """只比较uids中的用户，只写入变化的字段，写入在后台线程中进行"""
+    if(not dyn_record_table is None):
+        dyn_record_table.save(dyn_record_dict["user"], uids)
+
+def get_dyn_users(uid_list: list[str]) -> dict[str, dict]:
+    """从内存中的记录返回B站用户信息与最后更新时间，没有记录或尚未获取到用户信息的用户不返回"""
+    user_dict = dict()
+    if(dyn_record_dict is None):
+        return user_dict
+    for uid in uid_list:
+        record = dyn_record_dict["user"].get(uid, None)
+        if(record is None or not "user" in record):
+            continue
+        user_dict[uid] = {
+            "user": record["user"],
+            "update_time": record.get("update_time", None)
+        }
+    return user_dict
\ No newline at end of file
@@ -3,19 +3,30 @@ import asyncio
 import copy
 from datetime import datetime
 import os
-from queue import Queue
+from asyncio import Queue
 import random
 import traceback
 from urllib.parse import urlparse
 import httpx
 import json
 import logging
+import time
+from typing import Iterable
 
 from util.logger import init_logger
+from util.store import RecordTable, get_store
+from util.record import LiveRecord
+from util.warm import wait_poll, set_poll_time, register, get_saved
 
 record_path = os.path.join(os.path.dirname(__file__), "record.json")
 live_record_dict = None
+live_record_table: RecordTable = None
 status_unknown_uid_dict = {}
+# 直播状态的版本号，任一用户的直播状态变化时加1，与启动时间一起作为GET /live/status的ETag
+status_version = 0
+status_epoch = int(time.time())
+# 各用户最后一次成功查询到直播状态的时间，只保存在内存中，避免每次抓取都写入数据库
+status_time_dict: dict[str, int] = {}
 logger = init_logger()
 
 def link_process(link: str) -> str:
@@ -54,20 +65,52 @@ def update_user(record: dict, typ: str, user: dict, msg_list: list):
         del _user["uid"]
     if "room_id" in _user:
         del _user["room_id"]
+    diff = dict()
     for key, value in record["user"].items():
         if key in _user and value != _user[key]:
-            msg_list.append({
-                "type": typ,
-                "subtype": key,
-                "user": user,
+            diff[key] = {
                 "pre": value,
                 "now": _user[key]
-            })
+            }
             logger.info(f"{user['name']}的B站直播状态 {key}:{value} -> {_user[key]}")
         elif not key in _user:
             _user[key] = value
             user[key] = value
+    if diff:
+        # 同时变化的多个字段合并为一条消息
+        msg_list.append({
+            "type": typ,
+            "subtype": "profile",
+            "user": user,
+            "diff": diff
+        })
+    is_changed = record["user"] != _user
+    if is_changed:
+        bump_status_version()
     record["user"] = _user
+    return is_changed
+
+def bump_status_version():
+    global status_version
+    status_version += 1
+
+def get_status_etag() -> str:
+    return f'"{status_epoch}-{status_version}"'
+
+def get_live_status(uid_list: list[str] = None, live_only: bool = False) -> dict[str, dict]:
+    """从内存中的记录返回直播状态，uid_list为None时返回全部用户，没有记录或尚未抓取到直播状态的用户不返回"""
+    live_status_dict = dict()
+    if(live_record_dict is None):
+        return live_status_dict
+    live_user_dict: dict = live_record_dict["user"]
+    for live_uid in (live_user_dict.keys() if uid_list is None else uid_list):
+        record = live_user_dict.get(live_uid, None)
+        if(record is None or not "user" in record):
+            continue
+        if(live_only and record["user"].get("status", "0") != "1"):
+            continue
+        live_status_dict[live_uid] = record["user"]
+    return live_status_dict
 
 async def get_live(uid_list: list[str]):
     global live_record_dict
@@ -88,6 +131,7 @@ async def get_live(uid_list: list[str]):
         logger.error(f"B站直播状态请求返回值异常! code:{res['code']} msg:{res['message']}")
         return live_list
     status_dict = res['data']
+    changed_uid_list: list[str] = []
     for live_uid in uid_list:
         if not live_uid in status_dict: # 结果中无对应UID
             if not live_uid in live_user_dict or not "user" in live_user_dict[live_uid]:
@@ -105,19 +149,21 @@ async def get_live(uid_list: list[str]):
                     user["status"] = "0" # 设置为下播
         else:
             user = parse_live_user(status_dict[live_uid])
+            status_time_dict[live_uid] = int(datetime.now().timestamp())
             if live_uid in status_unknown_uid_dict:
                 if status_unknown_uid_dict[live_uid]["count"] > 3:
                     logger.info(f"UID:{live_uid}的用户直播信息查询恢复正常")
                 del status_unknown_uid_dict[live_uid]
-        update_user(live_user_dict[live_uid], "bili_live", user, live_list)
-    save_live_record()
+        if update_user(live_user_dict[live_uid], "bili_live", user, live_list):
+            changed_uid_list.append(live_uid)
+    save_live_record(changed_uid_list)
     return live_list
 
 async def listen_live(live_config_dict: dict, msg_queue: Queue):
     global live_record_dict
     load_live_record()
     interval = live_config_dict["interval"]
-    await asyncio.sleep(1)
+    await wait_poll("bili_live_listener", interval)
     logger.info("开始抓取B站直播状态...")
     while(True):
         logger.debug("执行抓取B站直播状态")
@@ -129,10 +175,11 @@ async def listen_live(live_config_dict: dict, msg_queue: Queue):
                 logger.debug(f"获取的B站直播状态列表：{live_list}")
                 if(live_list):
                     for live in live_list:
-                        msg_queue.put(live)
+                        await msg_queue.put(live)
             except:
                 errmsg = traceback.format_exc()
                 logger.error(f"B站直播状态抓取出错!\n{errmsg}")
+            set_poll_time("bili_live_listener")
             await asyncio.sleep(random.random()*15 + interval)
         await asyncio.sleep(5)
 
@@ -167,8 +214,8 @@ async def add_live_user(live_uid: str, config_dict: dict):
             room_detail = await check_live_user(live_uid)
             if room_detail['roomid'] == 0:
                 resp = {"code": 11, "msg": "user has no live room"}
-            live_record_dict["user"][live_uid] = dict()
-            save_live_record()
+            live_record_dict["user"][live_uid] = LiveRecord()
+            save_live_record([live_uid])
     except:
         errmsg = traceback.format_exc()
         logger.error(f"添加B站直播用户发生错误！\n{errmsg}")
@@ -180,28 +227,48 @@ async def remove_live_user(live_uid: str, config_dict: dict):
     resp = {"code": 0, "msg": "Success" }
     if(live_uid in live_record_dict["user"]):
         del live_record_dict["user"][live_uid]
-        save_live_record()
+        status_time_dict.pop(live_uid, None)
+        bump_status_version()
+        save_live_record([live_uid])
     return resp
 
 def load_live_record():
-    global live_record_dict
+    global live_record_dict, live_record_table
     if(not live_record_dict is None):
         return
     try:
-        with open(record_path, "r", encoding="UTF-8") as f:
-            live_record_dict = json.loads(f.read())
-    except FileNotFoundError:
+        # 首次启动时自动从record.json导入
+        live_record_table = get_store().get_table("bili_live", record_path, LiveRecord)
         live_record_dict = {
-            "user": dict()
+            "user": live_record_table.load()
         }
-        save_live_record()
-        logger.info(f"未找到B站直播记录文件，已自动创建")
+        # 恢复上次退出时查询不到直播状态的次数，重启后不会重新计数
+        for live_uid, value in get_saved("bili_live/status_unknown", {}).items():
+            if(live_uid in live_record_dict["user"]):
+                status_unknown_uid_dict[live_uid] = value
+        register("bili_live/status_unknown", lambda: status_unknown_uid_dict)
     except:
         live_record_dict = {
             "user": dict()
         }
-        logger.error(f"读取B站直播记录文件错误\n{traceback.format_exc()}")
+        logger.error(f"读取B站直播记录错误\n{traceback.format_exc()}")
+
+def save_live_record(uids: Iterable[str] = None):
+    """只比较uids中的用户，只写入变化的字段，写入在后台线程中进行"""
+    if(not live_record_table is None):
+        live_record_table.save(live_record_dict["user"], uids)
 
-def save_live_record():
-    with open(record_path, "w", encoding="UTF-8") as f:
-        f.write(json.dumps(live_record_dict))
\ No newline at end of file
+def get_live_users(uid_list: list[str]) -> dict[str, dict]:
+    """从内存中的记录返回直播间信息与最后一次查询到直播状态的时间，没有记录或尚未查询到直播状态的用户不返回"""
+    user_dict = dict()
+    if(live_record_dict is None):
+        return user_dict
+    for live_uid in uid_list:
+        record = live_record_dict["user"].get(live_uid, None)
+        if(record is None or not "user" in record):
+            continue
+        user_dict[live_uid] = {
+            "user": record["user"],
+            "update_time": status_time_dict.get(live_uid, record.get("update_time", None))
+        }
+    return user_dict
\ No newline at end of file
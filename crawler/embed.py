@@ -0,0 +1,162 @@
+from __future__ import annotations
+import asyncio
+from typing import AsyncIterator
+
+from util.logger import init_logger
+from util.config import get_config_dict, get_value
+from util.record import intern_uid
+from crawler.weibo.weibo import listen_weibo, listen_weibo_user_detail, listen_weibo_comment, add_wb_user, add_wb_cmt_user, remove_wb_user, remove_wb_cmt_user
+from crawler.bili_live.bili_live import listen_live, add_live_user, remove_live_user
+from crawler.bili_dynamic.bili_dynamic import listen_dynamic, listen_bili_user_detail, listen_dynamic_comment, add_dyn_user, add_dyn_cmt_user, remove_dyn_user, remove_dyn_cmt_user
+from push.engine import PROFILE_MODES, split_profile
+
+logger = init_logger()
+
+TYPES = ("weibo", "bili_dyn", "bili_live")
+
+def start_listeners(typ: str, type_config_dict: dict, msg_queue) -> dict[str, asyncio.Task]:
+    """启动一种类型的所有爬虫协程，msg_queue只需提供async put方法"""
+    tasks = dict()
+    if(typ == "bili_live"):
+        tasks["bili_live_listener"] = asyncio.create_task(listen_live(type_config_dict, msg_queue))
+    elif(typ == "bili_dyn"):
+        tasks["bili_dyn_listener"] = asyncio.create_task(listen_dynamic(type_config_dict, msg_queue))
+        if(type_config_dict["detail_enable"]):
+            tasks["bili_dyn_detail_listener"] = asyncio.create_task(listen_bili_user_detail(type_config_dict, msg_queue))
+        if(type_config_dict["comment_enable"]):
+            tasks["bili_dyn_comment_listener"] = asyncio.create_task(listen_dynamic_comment(type_config_dict, msg_queue))
+    elif(typ == "weibo"):
+        tasks["weibo_listener"] = asyncio.create_task(listen_weibo(type_config_dict, msg_queue))
+        if(type_config_dict["detail_enable"]):
+            tasks["weibo_detail_listener"] = asyncio.create_task(listen_weibo_user_detail(type_config_dict, msg_queue))
+        if(type_config_dict["comment_enable"]):
+            tasks["weibo_comment_listener"] = asyncio.create_task(listen_weibo_comment(type_config_dict, msg_queue))
+    return tasks
+
+class Subscription:
+    def __init__(self, types: list[str], subtypes: list[str], uids: list[str], queue_size: int, profile_mode: str = "legacy") -> None:
+        self.types = None if types is None else set(types)
+        self.subtypes = None if subtypes is None else set(subtypes)
+        self.uids = None if uids is None else set([str(uid) for uid in uids])
+        self.profile_mode = profile_mode
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(queue_size)
+        self.dropped = 0
+
+    def match(self, msg: dict) -> bool:
+        if not self.types is None and not msg["type"] in self.types:
+            return False
+        if not self.subtypes is None and not msg["subtype"] in self.subtypes:
+            return False
+        if not self.uids is None and not msg["user"]["uid"] in self.uids:
+            return False
+        return True
+
+    def put(self, msg: dict):
+        if self.queue.full():
+            # 与推送队列的drop_oldest相同，消费过慢时丢弃最早的消息
+            self.queue.get_nowait()
+            self.dropped += 1
+            logger.warning(f"库模式订阅的消息队列已满,丢弃最早的消息")
+        self.queue.put_nowait(msg)
+
+class Hub:
+    """库模式下所有订阅共享的消息分发中心，爬虫按需启动，最后一个订阅结束后停止"""
+    def __init__(self, config_dict: dict) -> None:
+        self.config_dict = config_dict
+        self.subscriptions: set[Subscription] = set()
+        self.tasks: dict[str, asyncio.Task] = dict()
+        self.started_types: set[str] = set()
+
+    async def put(self, msg: dict):
+        # 拆分后的旧格式消息由所有legacy订阅共享，按拆分后的subtype匹配
+        legacy_msgs: list[dict] = None
+        for subscription in list(self.subscriptions):
+            msgs = [msg]
+            if subscription.profile_mode == "legacy" and msg.get("subtype") == "profile":
+                if legacy_msgs is None:
+                    legacy_msgs = split_profile(msg)
+                msgs = legacy_msgs
+            for _msg in msgs:
+                if subscription.match(_msg):
+                    subscription.put(_msg)
+
+    def ensure_started(self, types: list[str]):
+        for typ in (TYPES if types is None else types):
+            if typ in self.started_types:
+                continue
+            if not typ in TYPES:
+                raise ValueError(f"Invalid type: {typ}")
+            if not self.config_dict.get(typ, {}).get("enable", False):
+                if not types is None:
+                    logger.warning(f"配置文件中未开启{typ}的爬虫,无法获取该类型的消息")
+                continue
+            self.tasks.update(start_listeners(typ, self.config_dict[typ], self))
+            self.started_types.add(typ)
+            logger.info(f"库模式已启动{typ}的爬虫")
+
+    async def stop(self):
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        self.tasks.clear()
+        self.started_types.clear()
+        logger.info("库模式的爬虫已停止")
+
+hub: Hub = None
+
+async def stream(types: list[str] = None, uids: list[str] = None, subtypes: list[str] = None, queue_size: int = 1000, config_dict: dict = None, profile: str = None) -> AsyncIterator[dict]:
+    """
+    在当前事件循环中运行爬虫并逐条返回消息，不经过序列化与推送，
+    uids需要先通过add_user添加，返回的消息由所有订阅共享，不应修改，
+    profile与HTTP API的profile选项相同，默认使用配置文件中的profile_mode，
+    提前结束时应调用aclose()关闭生成器，以便及时停止爬虫
+    """
+    global hub
+    if profile is None:
+        profile = get_value("push", "profile_mode", "legacy")
+    if not profile in PROFILE_MODES:
+        raise ValueError(f"Invalid profile mode: {profile}")
+    if hub is None:
+        hub = Hub(get_config_dict() if config_dict is None else config_dict)
+    hub.ensure_started(types)
+    subscription = Subscription(types, subtypes, uids, queue_size, profile)
+    hub.subscriptions.add(subscription)
+    try:
+        while True:
+            yield await subscription.queue.get()
+    finally:
+        hub.subscriptions.discard(subscription)
+        if not hub.subscriptions:
+            await hub.stop()
+            hub = None
+
+async def add_user(typ: str, uid: str, subtype: str = None, is_top: bool = False, config_dict: dict = None) -> dict:
+    """添加要抓取的用户，与HTTP API的add命令相同，返回{"code": 0, "msg": "Success"}表示成功"""
+    config_dict = get_config_dict() if config_dict is None else config_dict
+    uid = intern_uid(uid)
+    if(typ == "weibo"):
+        if(subtype == "comment"):
+            return await add_wb_cmt_user(uid, config_dict[typ])
+        return await add_wb_user(uid, config_dict[typ])
+    elif(typ == "bili_dyn"):
+        if(subtype == "comment"):
+            return await add_dyn_cmt_user(uid, config_dict[typ], is_top)
+        return await add_dyn_user(uid, config_dict[typ])
+    elif(typ == "bili_live"):
+        return await add_live_user(uid, config_dict[typ])
+    return {"code": 3, "msg": "Invalid type"}
+
+async def remove_user(typ: str, uid: str, subtype: str = None, config_dict: dict = None) -> dict:
+    config_dict = get_config_dict() if config_dict is None else config_dict
+    uid = intern_uid(uid)
+    if(typ == "weibo"):
+        if(subtype == "comment"):
+            return await remove_wb_cmt_user(uid, config_dict[typ])
+        return await remove_wb_user(uid, config_dict[typ])
+    elif(typ == "bili_dyn"):
+        if(subtype == "comment"):
+            return await remove_dyn_cmt_user(uid, config_dict[typ])
+        return await remove_dyn_user(uid, config_dict[typ])
+    elif(typ == "bili_live"):
+        return await remove_live_user(uid, config_dict[typ])
+    return {"code": 3, "msg": "Invalid type"}
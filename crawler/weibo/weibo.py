@@ -9,9 +9,10 @@ import traceback
 import jsons
 from datetime import datetime
 from urllib.parse import urlparse
-from queue import Queue
+from asyncio import Queue
 from http.cookiejar import CookieJar
 from functools import partial
+from typing import Iterable
 from httpx import UnsupportedProtocol, ReadTimeout, ConnectError, ConnectTimeout, RemoteProtocolError, ReadError
 from bs4 import BeautifulSoup
 
@@ -19,9 +20,14 @@ from util.logger import init_logger
 from util.network import Network, cookiejar_to_dict
 from util.config import set_value, get_config_dict
 from util.exception import get_exception_list
+from util.store import RecordTable, get_store
+from util.record import WeiboRecord
+from util.seen import get_seen
+from util.warm import wait_poll, set_poll_time
 
 record_path = os.path.join(os.path.dirname(__file__), "record.json")
 wb_record_dict = None
+wb_record_table: RecordTable = None
 weibo_client: Network = None
 logger = init_logger()
 
@@ -168,17 +174,22 @@ def update_user(record: dict, typ: str, user: dict, msg_list: list):
         del _user["uid"]
     # debug
     is_updated = False
+    diff = dict()
     for key, value in _user.items():
         if key in record["user"] and record["user"][key] != value:
             is_updated = True # debug
-            msg_list.append({
-                "type": typ,
-                "subtype": key,
-                "user": user,
+            diff[key] = {
                 "pre": record["user"][key],
                 "now": value
-            })
+            }
     if is_updated:
+        # 同时变化的多个字段合并为一条消息
+        msg_list.append({
+            "type": typ,
+            "subtype": "profile",
+            "user": user,
+            "diff": diff
+        })
         logger.info(f"微博用户信息更新 prev:{record['user']} now:{_user}")
     record["user"] = _user
     return is_updated #
@@ -301,9 +312,12 @@ async def get_weibo(wb_cookie: str, wb_ua: str, detail_enable: bool, comment_lim
             return 1, wb_list
     if res['ok']:
         weibos = res['data']['statuses']
+        seen = get_seen("weibo", "weibo")
         now_wb_time_dict: dict[int] = dict()
         for wb_uid in wb_user_dict.keys():
             now_wb_time_dict[wb_uid] = wb_user_dict[wb_uid]["last_wb_time"]
+        # 记录发生变化的用户，保存时只比较这些用户
+        changed_uid_set = set()
         for i in range(len(weibos)):
             w = weibos[i]
             # 获取用户简介
@@ -322,19 +336,25 @@ async def get_weibo(wb_cookie: str, wb_ua: str, detail_enable: bool, comment_lim
                 if update_user(wb_user_dict[uid], "weibo", user, wb_list): # debug case
                     logger.info(f"get_weibo 用户信息更新 uid:{uid} user:{user} 原微博:{w}\n")
                 wb_user_dict[uid]["update_time"] = int(datetime.now().timestamp())
-            if not (wb_user_dict[uid]["last_wb_time"] < created_time): # 不是新微博
+                changed_uid_set.add(uid)
+            weibo_id = str(w["id"])
+            if not seen.is_new(weibo_id, created_time, wb_user_dict[uid]["last_wb_time"]): # 不是新微博
                 continue
+            # 解析期间用户详情监听可能获取到同一条微博，先标记为已推送
+            seen.add(weibo_id)
             # 以下是处理新微博的内容
             try:
                 weibo = await parse_weibo(w, headers)
                 wb_list.append(weibo)
                 if now_wb_time_dict[uid] < created_time:
                     now_wb_time_dict[uid] = created_time
+                    changed_uid_set.add(uid)
             except:
+                seen.discard(weibo_id)
                 logger.error(f"获取新微博时解析微博失败！原微博：\n{w}")
-        for uid in now_wb_time_dict.keys():
+        for uid in changed_uid_set:
             wb_user_dict[uid]["last_wb_time"] = now_wb_time_dict[uid]
-        save_wb_record()
+        save_wb_record(changed_uid_set)
     else:
         logger.error(f"微博请求返回值异常！\nraw:{json.dumps(res, ensure_ascii=False)}")
     wb_list.reverse()
@@ -349,7 +369,7 @@ async def listen_weibo(wb_config_dict: dict, msg_queue: Queue):
     detail_enable = wb_config_dict["detail_enable"]
     comment_limit = wb_config_dict["comment_limit"]
     init_network_client(wb_cookie, wb_ua)
-    await asyncio.sleep(1)
+    await wait_poll("weibo_listener", interval)
     logger.info("开始抓取微博...")
     while(True):
         logger.debug("执行抓取微博")
@@ -363,10 +383,11 @@ async def listen_weibo(wb_config_dict: dict, msg_queue: Queue):
             if(wb_list):
                 for wb in wb_list:
                     attach_cookie(wb)
-                    msg_queue.put(wb)
+                    await msg_queue.put(wb)
         except:
             errmsg = traceback.format_exc()
             logger.error(f"微博抓取出错!\n{errmsg}")
+        set_poll_time("weibo_listener")
         await asyncio.sleep(random.random()*15 + interval + interval_add)
 
 async def get_weibo_user_detail(weibo_ua: str, weibo_cookie: str, uid: str):
@@ -403,7 +424,7 @@ async def get_weibo_user_detail(weibo_ua: str, weibo_cookie: str, uid: str):
         return []
     update_user(wb_user_dict[uid], "weibo", user, msg_list)
     wb_user_dict[uid]["update_time"] = int(datetime.now().timestamp())
-    save_wb_record()
+    save_wb_record([uid])
     return msg_list
 
 async def listen_weibo_user_detail(wb_config_dict: dict, msg_queue: Queue):
@@ -437,21 +458,24 @@ async def listen_weibo_user_detail(wb_config_dict: dict, msg_queue: Queue):
                                 if(msg_list):
                                     for msg in msg_list:
                                         attach_cookie(msg)
-                                        msg_queue.put(msg)
+                                        await msg_queue.put(msg)
                             msg_list = []
+                            seen = get_seen("weibo", "weibo")
                             now_wb_time = wb_user_dict[uid]["last_wb_time"]
                             for wb in wb_list:
-                                if wb_user_dict[uid]["last_wb_time"] < wb["created_time"]:
+                                # 与listen_weibo共用已推送的ID，同一条微博只推送一次
+                                if seen.is_new(wb["id"], wb["created_time"], wb_user_dict[uid]["last_wb_time"]):
                                     now_wb_time = max(now_wb_time, wb["created_time"])
                                     msg_list.append(wb)
+                                    seen.add(wb["id"])
                             if(msg_list):
                                 for msg in msg_list:
                                     attach_cookie(msg)
-                                    msg_queue.put(msg)
+                                    await msg_queue.put(msg)
                             logger.debug(f"微博列表与用户详情更新结束 UID：{uid} now:{now_wb_time}")
                             wb_user_dict[uid]["last_wb_time"] = now_wb_time
                             wb_user_dict[uid]["update_time"] = int(datetime.now().timestamp())
-                            save_wb_record()
+                            save_wb_record([uid])
                         else:
                             logger.info(f"UID:{uid}的微博用户微博列表未成功更新")
                     except:
@@ -486,6 +510,7 @@ async def get_weibo_comment(weibo_ua: str, weibo_cookie: str, weibo: dict, wb_ui
     wb_user_dict: dict = wb_record_dict["user"]
     last_wb_cmt_time = wb_user_dict[wb_uid]["cmt_config"].get("last_wb_cmt_time", int(datetime.now().timestamp()))
     now_wb_cmt_time = last_wb_cmt_time
+    seen = get_seen("weibo", "comment")
     headers = {
         'DNT': "1",
         'MWeibo-Pwa': "1",
@@ -541,7 +566,8 @@ async def get_weibo_comment(weibo_ua: str, weibo_cookie: str, weibo: dict, wb_ui
                 comment_id = str(comment['id'])
                 comment_uid = str(comment['user']['id'])
                 cmt = await parse_comment(comment, headers)
-                if comment_uid == wb_uid and last_wb_cmt_time < created_time:
+                if comment_uid == wb_uid and seen.is_new(comment_id, created_time, last_wb_cmt_time):
+                    seen.add(comment_id)
                     if now_wb_cmt_time < created_time:
                         now_wb_cmt_time = created_time
                     _cmt = copy.deepcopy(cmt)
@@ -554,7 +580,8 @@ async def get_weibo_comment(weibo_ua: str, weibo_cookie: str, weibo: dict, wb_ui
                         inner_created_time = int(get_created_time(inner_comment['created_at']).timestamp())
                         inner_comment_id = str(inner_comment['id'])
                         inner_comment_uid = str(inner_comment['user']['id'])
-                        if inner_comment_uid == wb_uid and last_wb_cmt_time < inner_created_time:
+                        if inner_comment_uid == wb_uid and seen.is_new(inner_comment_id, inner_created_time, last_wb_cmt_time):
+                            seen.add(inner_comment_id)
                             inner_cmt = await parse_comment(inner_comment, headers)
                             inner_cmt["reply"] = cmt
                             inner_cmt["root"] = weibo
@@ -579,7 +606,7 @@ async def listen_weibo_comment(wb_config_dict: dict, msg_queue: Queue):
     interval = wb_config_dict["comment_interval"]
     limit = wb_config_dict["comment_limit"]
     init_network_client(wb_cookie, wb_ua)
-    await asyncio.sleep(1)
+    await wait_poll("weibo_comment_listener", interval)
     logger.info("开始抓取微博评论...")
     while(True):
         uid_list = list(wb_record_dict["user"].keys())
@@ -601,7 +628,7 @@ async def listen_weibo_comment(wb_config_dict: dict, msg_queue: Queue):
                         if(msg_list):
                             for msg in msg_list:
                                 attach_cookie(msg)
-                                msg_queue.put(msg)
+                                await msg_queue.put(msg)
                     else:
                         logger.info(f"UID:{uid}的微博用户微博列表未成功更新")
                         continue
@@ -633,13 +660,14 @@ async def listen_weibo_comment(wb_config_dict: dict, msg_queue: Queue):
                         if(cmt_list):
                             for cmt in cmt_list:
                                 attach_cookie(cmt)
-                                msg_queue.put(cmt)
+                                await msg_queue.put(cmt)
                     except:
                         errmsg = traceback.format_exc()
                         logger.error(f"微博评论抓取出错!错误信息:\n{errmsg}")
                     await asyncio.sleep(random.random()*3 + 5)
                 wb_record_dict["user"][uid]["cmt_config"]["last_wb_cmt_time"] = now_wb_cmt_time
-                save_wb_record()
+                save_wb_record([uid])
+                set_poll_time("weibo_comment_listener")
                 await asyncio.sleep(random.random()*5 + interval + interval_add)
         if not is_cmt:
             await asyncio.sleep(interval)
@@ -715,16 +743,12 @@ async def add_wb_user(wb_uid: str, config_dict: dict) -> tuple[bool, str]:
                     resp = {"code": 9, "msg": "Follow weibo user failed"}
                 else:
                     logger.info(f"无需关注本账号！")
-                    wb_record_dict["user"][wb_uid] = {
-                        "last_wb_time": int(datetime.now().timestamp())
-                    }
-                    save_wb_record()
+                    wb_record_dict["user"][wb_uid] = WeiboRecord(last_wb_time=int(datetime.now().timestamp()))
+                    save_wb_record([wb_uid])
             else:
                 logger.info(f"成功关注微博用户！")
-                wb_record_dict["user"][wb_uid] = {
-                    "last_wb_time": int(datetime.now().timestamp())
-                }
-                save_wb_record()
+                wb_record_dict["user"][wb_uid] = WeiboRecord(last_wb_time=int(datetime.now().timestamp()))
+                save_wb_record([wb_uid])
         except:
             errmsg = traceback.format_exc()
             logger.error(f"微博关注用户发生错误！\n{errmsg}")
@@ -745,7 +769,7 @@ async def add_wb_cmt_user(wb_uid: str, config_dict: dict) -> tuple[bool, str]:
                 "last_wb_cmt_time": int(datetime.now().timestamp())
             }
             wb_record_dict["user"][wb_uid]["cmt_config"] = cmt_config
-            save_wb_record()
+            save_wb_record([wb_uid])
         except:
             errmsg = traceback.format_exc()
             logger.error(f"微博添加抓取评论用户发生错误！错误信息：\n{errmsg}")
@@ -757,7 +781,7 @@ async def remove_wb_user(wb_uid: str, config_dict: dict):
     resp = {"code": 0, "msg": "Success" }
     if(wb_uid in wb_record_dict["user"]):
         del wb_record_dict["user"][wb_uid]
-        save_wb_record()
+        save_wb_record([wb_uid])
     return resp
 
 async def remove_wb_cmt_user(wb_uid: str, config_dict: dict):
@@ -765,34 +789,37 @@ async def remove_wb_cmt_user(wb_uid: str, config_dict: dict):
     resp = {"code": 0, "msg": "Success" }
     if(wb_uid in wb_record_dict["user"] and "cmt_config" in wb_record_dict["user"][wb_uid]):
         del wb_record_dict["user"][wb_uid]["cmt_config"]
-        save_wb_record()
+        save_wb_record([wb_uid])
     return resp
 
 def load_wb_record():
-    global wb_record_dict
+    global wb_record_dict, wb_record_table
     if(not wb_record_dict is None):
         return
     try:
-        with open(record_path, "r", encoding="UTF-8") as f:
-            wb_record_dict = jsons.loads(f.read())
+        # 首次启动时自动从record.json导入
+        wb_record_table = get_store().get_table("weibo", record_path, WeiboRecord)
+        wb_record_dict = {
+            "user": wb_record_table.load()
+        }
+        reset_uid_list = []
         for uid in wb_record_dict["user"].keys():
             if(not type(wb_record_dict["user"][uid]["last_wb_time"]) == int):
                 wb_record_dict["user"][uid]["last_wb_time"] = int(datetime.now().timestamp())
+                reset_uid_list.append(uid)
                 logger.info(f"UID为{uid}的微博用户动态时间配置不正确，已重设为当前时间")
             if("cmt_config" in wb_record_dict["user"][uid] and (not type(wb_record_dict["user"][uid]["cmt_config"]["last_wb_cmt_time"]) == int)):
                 wb_record_dict["user"][uid]["cmt_config"]["last_wb_cmt_time"] = int(datetime.now().timestamp())
+                reset_uid_list.append(uid)
                 logger.info(f"UID为{uid}的微博用户动态评论时间配置不正确，已重设为当前时间")
-    except FileNotFoundError:
-        wb_record_dict = {
-            "user": dict()
-        }
-        save_wb_record()
-        logger.info(f"未找到微博动态记录文件，已自动创建")
+        # 重设的时间也需要写入，否则重启后仍是不正确的值
+        if(reset_uid_list):
+            save_wb_record(reset_uid_list)
     except:
         wb_record_dict = {
             "user": dict()
         }
-        logger.error(f"读取微博动态记录文件错误\n{traceback.format_exc()}")
+        logger.error(f"读取微博动态记录错误\n{traceback.format_exc()}")
 
 def save_wb_cookie(cookies: CookieJar):
     cookie_dict = cookiejar_to_dict(cookies)
@@ -816,6 +843,22 @@ def init_network_client(cookie_str: str = None, ua_str: str = None):
         # weibo_client.set_save_cookie_func(partial(save_wb_cookie))
         logger.debug("微博HTTP客户端初始化完成")
 
-def save_wb_record():
-    with open(record_path, "w", encoding="UTF-8") as f:
-        f.write(jsons.dumps(wb_record_dict))
\ No newline at end of file
+def save_wb_record(uids: Iterable[str] = None):
+    """只比较uids中的用户，只写入变化的字段，写入在后台线程中进行"""
+    if(not wb_record_table is None):
+        wb_record_table.save(wb_record_dict["user"], uids)
+
+def get_wb_users(uid_list: list[str]) -> dict[str, dict]:
+    """从内存中的记录返回微博用户信息与最后更新时间，没有记录或尚未获取到用户信息的用户不返回"""
+    user_dict = dict()
+    if(wb_record_dict is None):
+        return user_dict
+    for uid in uid_list:
+        record = wb_record_dict["user"].get(uid, None)
+        if(record is None or not "user" in record):
+            continue
+        user_dict[uid] = {
+            "user": record["user"],
+            "update_time": record.get("update_time", None)
+        }
+    return user_dict
\ No newline at end of file
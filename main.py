@@ -2,27 +2,37 @@
 
 from __future__ import annotations
 import asyncio
-import signal
 import jsons
-import threading
-import queue
 import logging
 import websockets
-import requests
 import traceback
+from datetime import datetime
 from aiohttp import web
 from aiohttp.web_request import Request
 
 import util.config
 from util.logger import init_logger
-from crawler.weibo.weibo import listen_weibo, add_wb_user, add_wb_cmt_user, remove_wb_user, remove_wb_cmt_user, listen_weibo_user_detail, listen_weibo_comment
-from crawler.bili_live.bili_live import listen_live, add_live_user, remove_live_user
-from crawler.bili_dynamic.bili_dynamic import listen_dynamic, add_dyn_user, add_dyn_cmt_user, remove_dyn_user, remove_dyn_cmt_user, listen_bili_user_detail, listen_dynamic_comment
+from util.store import close_store
+from util.journal import Journal
+from util.record import intern_uid
+from util import warm
+from crawler.weibo.weibo import add_wb_user, add_wb_cmt_user, remove_wb_user, remove_wb_cmt_user, get_wb_users
+from crawler.bili_live.bili_live import add_live_user, remove_live_user, get_live_status, get_status_etag, get_live_users
+from crawler.bili_dynamic.bili_dynamic import add_dyn_user, add_dyn_cmt_user, remove_dyn_user, remove_dyn_cmt_user, get_dyn_users
+from crawler.embed import start_listeners
+from push.engine import DeliveryEngine, OVERFLOW_POLICIES, PROFILE_MODES
+from push import codec
+from push.projection import Projection
+from push.filter import SubscriptionFilter, get_filter_key
+from push.websocket import WebsocketConnection, StandaloneConnection, AiohttpConnection
+from push.sse import SSEConnection
+from push import unix
 
 logger: logging.Logger = None
 routes = web.RouteTableDef()
-msg_queue = queue.Queue(maxsize=-1) # infinity length
+delivery_engine: DeliveryEngine = None
 push_config_dict = dict()
+push_config_journal: Journal = None
 ws_conn_dict = dict()
 ws_server = None
 
@@ -35,30 +45,33 @@ def cookie_to_dict(cookie: str):
     return cookie_dict
 
 def load_config():
-    global push_config_dict, config_dict
+    global push_config_dict, config_dict, push_config_journal
     config_dict = util.config.get_config_dict()
+    push_config_journal = Journal("push_config.json", util.config.get_value("store", "push_config_compact", 1000))
     try:
-        with open("push_config.json", "r", encoding="UTF-8") as f:
-            push_config_dict = jsons.loads(f.read())
-            for typ in push_config_dict.keys():
-                if(typ == "clients"):
-                    continue
-                if(type(push_config_dict[typ]) == dict):
-                    for x in push_config_dict[typ].keys():
-                        if(type(push_config_dict[typ][x]) == dict):
-                            for uid in push_config_dict[typ][x].keys():
-                                push_config_dict[typ][x][uid] = set(push_config_dict[typ][x][uid])
-                        else:
-                            push_config_dict[typ][x] = set(push_config_dict[typ][x])
-                else:
-                    push_config_dict[typ] = set(push_config_dict[typ])
+        # 快照push_config.json加上之后的修改日志push_config.json.journal
+        push_config_dict = push_config_journal.load()
+        for typ in push_config_dict.keys():
+            if(typ in ("clients", "client_options", "filters")):
+                continue
+            if(type(push_config_dict[typ]) == dict):
+                # UID与爬虫记录中的UID共用同一个字符串对象
+                type_dict = dict()
+                for x, value in push_config_dict[typ].items():
+                    if(type(value) == dict):
+                        type_dict[x] = {intern_uid(uid): set(clients) for uid, clients in value.items()}
+                    else:
+                        type_dict[intern_uid(x)] = set(value)
+                push_config_dict[typ] = type_dict
+            else:
+                push_config_dict[typ] = set(push_config_dict[typ])
         # print(push_config_dict)
     except:
         pass
 
-def save_push_config():
-    with open("push_config.json", "w", encoding="UTF-8") as f:
-        f.write(jsons.dumps(push_config_dict))
+def save_push_config(*paths: list[str]):
+    """只追加被修改的键，paths为修改的键在push_config_dict中的路径"""
+    push_config_journal.append(push_config_dict, list(paths))
 
 async def check_params(req: Request, required_params: list[str]):
     if(type(req) != dict):
@@ -78,6 +91,86 @@ async def check_params(req: Request, required_params: list[str]):
         params[param] = str(params[param])
     return (params, {"code": 0, "msg": "Success" })
 
+def check_client_options(params: dict):
+    options = dict()
+    try:
+        if "queue_size" in params:
+            options["queue_size"] = int(params["queue_size"])
+            if options["queue_size"] <= 0:
+                raise ValueError("queue_size")
+        if "overflow" in params:
+            options["overflow"] = str(params["overflow"])
+            if not options["overflow"] in OVERFLOW_POLICIES:
+                raise ValueError("overflow")
+        if "ttl" in params:
+            options["ttl"] = int(params["ttl"])
+            if options["ttl"] < 0:
+                raise ValueError("ttl")
+        if "batch" in params:
+            options["batch"] = params["batch"] in (True, "true", 1, "1")
+        if "batch_window" in params:
+            options["batch_window"] = float(params["batch_window"])
+            if options["batch_window"] <= 0:
+                raise ValueError("batch_window")
+        if "batch_size" in params:
+            options["batch_size"] = int(params["batch_size"])
+            if options["batch_size"] <= 0:
+                raise ValueError("batch_size")
+        if "ack" in params:
+            options["ack"] = params["ack"] in (True, "true", 1, "1")
+        if "window" in params:
+            options["window"] = int(params["window"])
+            if options["window"] <= 0:
+                raise ValueError("window")
+        if "encoding" in params:
+            options["encoding"] = str(params["encoding"])
+            if not options["encoding"] in codec.ENCODINGS:
+                raise ValueError("encoding")
+        if "compression" in params:
+            options["compression"] = str(params["compression"])
+            if not options["compression"] in codec.COMPRESSIONS:
+                raise ValueError("compression")
+        if "profile" in params:
+            options["profile"] = str(params["profile"])
+            if not options["profile"] in PROFILE_MODES:
+                raise ValueError("profile")
+        if "projection" in params:
+            Projection(params["projection"])
+            options["projection"] = params["projection"]
+    except (ValueError, TypeError):
+        return (None, {"code": 19, "msg": "Invalid client option"})
+    if not codec.is_available(options.get("encoding", "json")):
+        return (None, {"code": 22, "msg": "Unsupported encoding"})
+    return (options, {"code": 0, "msg": "Success" })
+
+def set_client(client_name: str, url: str, options: dict):
+    if not "clients" in push_config_dict:
+        push_config_dict["clients"] = dict()
+    if not "client_options" in push_config_dict:
+        push_config_dict["client_options"] = dict()
+    push_config_dict["clients"][client_name] = url
+    push_config_dict["client_options"][client_name] = options
+    save_push_config(["clients", client_name], ["client_options", client_name])
+    if(not delivery_engine is None):
+        delivery_engine.update_client(client_name)
+
+def set_filter(typ: str, subtype: str, uid: str, client_name: str, spec: dict):
+    """spec为None时删除过滤条件"""
+    if not "filters" in push_config_dict:
+        push_config_dict["filters"] = dict()
+    key = get_filter_key(typ, subtype, uid)
+    client_dict: dict = push_config_dict["filters"].get(key, {})
+    if spec is None:
+        client_dict.pop(client_name, None)
+    else:
+        client_dict[client_name] = spec
+    if client_dict:
+        push_config_dict["filters"][key] = client_dict
+    else:
+        push_config_dict["filters"].pop(key, None)
+    if(not delivery_engine is None):
+        delivery_engine.update_filters()
+
 @routes.post("/init")
 async def init(req):
     required_params = ("client_name", "url")
@@ -85,10 +178,16 @@ async def init(req):
     if(not params is None):
         client_name: str = params["client_name"]
         url: str = params["url"]
-        if not "clients" in push_config_dict:
-            push_config_dict["clients"] = dict()
-        push_config_dict["clients"][client_name] = url
-        save_push_config()
+        options, resp = check_client_options(params)
+        if(unix.is_unix_url(url)):
+            try:
+                unix.parse_unix_url(url)
+                if(not unix.is_supported()):
+                    resp = {"code": 24, "msg": "Unix domain socket is not supported"}
+            except ValueError:
+                resp = {"code": 24, "msg": "Invalid unix socket url"}
+        if(not options is None and resp["code"] == 0):
+            set_client(client_name, url, options)
         logger.debug(f"HTTP服务收到init命令\nparams:{jsons.dumps(params, ensure_ascii=False)}\nresp:{jsons.dumps(resp, ensure_ascii=False)}")
     return web.json_response(resp)
 
@@ -98,14 +197,23 @@ async def add(req):
     params, resp = await check_params(req, required_params)
     if(not params is None):
         typ: str = params["type"]
-        uid: str = params["uid"]
+        uid: str = intern_uid(params["uid"])
         subtype: str = params.get("subtype", None)
         is_top: bool = params.get("is_top", False)
+        spec: dict = params.get("filter", None)
         if subtype and subtype == typ:
             subtype = None
         client_name: str = params["client_name"]
+        try:
+            if(not spec is None):
+                SubscriptionFilter(spec)
+            is_valid_filter = True
+        except ValueError:
+            is_valid_filter = False
         if not uid.isdigit():
             resp = {"code": 2, "msg": "Invalid UID"}
+        elif not is_valid_filter:
+            resp = {"code": 23, "msg": "Invalid filter"}
         elif not typ in config_dict:
             resp = {"code": 3, "msg": "Invalid type"}
         elif not config_dict[typ]["enable"]:
@@ -147,7 +255,11 @@ async def add(req):
                     push_config_dict[typ][uid].add(client_name)
             else:
                 push_config_dict[typ][uid].add(client_name)
-            save_push_config()
+            if(resp['code'] == 0):
+                # 不携带filter时保留原有的过滤条件，filter为null时删除过滤条件
+                if("filter" in params):
+                    set_filter(typ, subtype, uid, client_name, spec)
+                save_push_config([typ, subtype, uid] if subtype else [typ, uid], ["filters", get_filter_key(typ, subtype, uid)])
         logger.debug(f"HTTP服务收到add命令\nparams:{jsons.dumps(params, ensure_ascii=False)}\nresp:{jsons.dumps(resp, ensure_ascii=False)}")
     return web.json_response(resp)
 
@@ -157,7 +269,7 @@ async def remove(req):
     params, resp = await check_params(req, required_params)
     if(not params is None):
         typ: str = params["type"]
-        uid: str = params["uid"]
+        uid: str = intern_uid(params["uid"])
         client_name: str = params["client_name"]
         subtype: str = params.get("subtype", None)
         if subtype and subtype == typ:
@@ -188,6 +300,9 @@ async def remove(req):
                     del push_config_dict[typ][subtype][uid]
             else:
                 push_config_dict[typ][subtype][uid].remove(client_name)
+            if(resp['code'] == 0):
+                set_filter(typ, subtype, uid, client_name, None)
+            save_push_config([typ, subtype, uid], ["filters", get_filter_key(typ, subtype, uid)])
         elif client_name in push_config_dict[typ][uid]:
             if(len(push_config_dict[typ][uid]) == 1):
                 if(typ == "weibo"):
@@ -200,51 +315,163 @@ async def remove(req):
                     del push_config_dict[typ][uid]
             else:
                 push_config_dict[typ][uid].remove(client_name)
-            save_push_config()
+            if(resp['code'] == 0):
+                set_filter(typ, None, uid, client_name, None)
+            save_push_config([typ, uid], ["filters", get_filter_key(typ, None, uid)])
         logger.debug(f"HTTP服务收到remove命令\nparams:{jsons.dumps(params, ensure_ascii=False)}\nresp:{jsons.dumps(resp, ensure_ascii=False)}")
     return web.json_response(resp)
 
-def send_msg(client_name: str, msg: dict):
-    http_url = push_config_dict["clients"][client_name]
-    ws_conn = ws_conn_dict.get(client_name, None)
-    if(ws_conn is None and http_url == "websocket"):
-        logger.error(f"client_name:{client_name} 未连接Websocket服务,无法推送消息!\n消息内容:\n{jsons.dumps(msg, ensure_ascii=False)}")
-        return
-    if(not ws_conn is None):
-        try:
-            asyncio.get_event_loop().run_until_complete(ws_conn.send(jsons.dumps(msg)))
-            return
-        except:
-            errmsg = traceback.format_exc()
-            logger.error(f"Websocket消息推送发生错误!\nclient_name:{client_name}\n{errmsg}")
-    if(not http_url == "websocket"):
-        try:
-            resp = requests.post(url=http_url, json=msg)
-        except:
-            errmsg = traceback.format_exc()
-            logger.error(f"HTTP消息推送发生错误!\nclient_name:{client_name} url:{http_url}\n{errmsg}")
+@routes.get("/stats")
+async def stats(req):
+    if(delivery_engine is None):
+        return web.json_response({"code": 20, "msg": "Delivery engine is not running"})
+    return web.json_response({"code": 0, "msg": "Success", "data": delivery_engine.get_stats()})
 
-def msg_sender():
-    asyncio.set_event_loop(asyncio.new_event_loop())
-    while True:
-        try:
-            msg = msg_queue.get(block = True, timeout = None)
-            msg_queue.task_done()
-            msg_type = msg["type"]
-            subtype = msg["subtype"]
-            uid = msg["user"]["uid"]
-            logger.debug(f"消息推送线程接收到消息:\n{msg}")
-            if not subtype in push_config_dict[msg_type]:
-                for client_name in push_config_dict[msg_type][uid]:
-                    send_msg(client_name, msg)
-            else:
-                for client_name in push_config_dict[msg_type][subtype][uid]:
-                    send_msg(client_name, msg)
-        except:
-            errmsg = traceback.format_exc()
-            logger.error(f"消息推送线程发生错误!错误信息:{errmsg}\n消息内容:{msg}")
+@routes.get("/history")
+async def history(req: Request):
+    params = dict(req.query)
+    types, subtypes, uids = [[value for value in params.get(key, "").split(",") if value] for key in ("type", "subtype", "uid")]
+    start = params.get("start", "0")
+    end = params.get("end", str(int(datetime.now().timestamp())))
+    limit = params.get("limit", "100")
+    cursor = params.get("cursor", None)
+    if(delivery_engine is None):
+        resp = {"code": 20, "msg": "Delivery engine is not running"}
+    elif(delivery_engine.archive is None):
+        resp = {"code": 26, "msg": "Archive is not enabled"}
+    elif(not start.isdigit() or not end.isdigit() or not limit.isdigit() or not 0 < int(limit) <= 1000):
+        resp = {"code": 25, "msg": "Invalid history query"}
+    elif(not cursor is None and (len(cursor.split("_")) != 2 or not all([part.isdigit() for part in cursor.split("_")]))):
+        resp = {"code": 25, "msg": "Invalid history query"}
+    else:
+        resp = {"code": 0, "msg": "Success"}
+    logger.debug(f"HTTP服务收到history请求\nparams:{jsons.dumps(params, ensure_ascii=False)}\nresp:{jsons.dumps(resp, ensure_ascii=False)}")
+    if(resp["code"] != 0):
+        return web.json_response(resp)
+    texts, next_cursor = await delivery_engine.archive.query(types, subtypes, uids, int(start), int(end), cursor, int(limit))
+    headers = {"Content-Type": "application/x-ndjson"}
+    if(not next_cursor is None):
+        # 没有该响应头表示已经是最后一页
+        headers["X-Next-Cursor"] = next_cursor
+    response = web.StreamResponse(headers=headers)
+    await response.prepare(req)
+    for i in range(0, len(texts), 100):
+        await response.write("".join([text + "\n" for text in texts[i:i+100]]).encode("UTF-8"))
+    await response.write_eof()
+    return response
+
+@routes.get("/live/status")
+async def live_status(req: Request):
+    params = dict(req.query)
+    uid_list = [intern_uid(uid) for uid in params.get("uid", "").split(",") if uid] or None
+    live_only = params.get("live", "false")
+    if(not config_dict["bili_live"]["enable"]):
+        resp = {"code": 28, "msg": "Bilibili live crawler is not enabled"}
+    elif(not live_only in ("true", "false", "1", "0")):
+        resp = {"code": 27, "msg": "Invalid live status query"}
+    else:
+        resp = {"code": 0, "msg": "Success"}
+    logger.debug(f"HTTP服务收到live/status请求\nparams:{jsons.dumps(params, ensure_ascii=False)}\nresp:{jsons.dumps(resp, ensure_ascii=False)}")
+    if(resp["code"] != 0):
+        return web.json_response(resp)
+    # 直播状态没有变化时不重复返回
+    etag = get_status_etag()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if(etag in [tag.strip() for tag in req.headers.get("If-None-Match", "").split(",")]):
+        return web.Response(status=304, headers=headers)
+    resp["data"] = get_live_status(uid_list, live_only in ("true", "1"))
+    return web.json_response(resp, headers=headers)
+
+# 一次查询最多的UID数
+MAX_USERS_QUERY = 5000
+USER_GETTERS = {
+    "weibo": get_wb_users,
+    "bili_dyn": get_dyn_users,
+    "bili_live": get_live_users
+}
+
+@routes.get("/users")
+@routes.post("/users")
+async def users(req: Request):
+    if(req.method == "GET"):
+        params, resp = await check_params(dict(req.query), [])
+    else:
+        params, resp = await check_params(req, [])
+    if(not params is None):
+        types = params.get("type", list(USER_GETTERS.keys()))
+        uids = params.get("uid", [])
+        # URL参数中多个值用,分隔，JSON参数也可以使用数组
+        if(type(types) == str):
+            types = [typ for typ in types.split(",") if typ]
+        if(type(uids) == str):
+            uids = [uid for uid in uids.split(",") if uid]
+        if(type(types) != list or type(uids) != list):
+            resp = {"code": 29, "msg": "Invalid users query"}
+        elif(not types or not all([typ in USER_GETTERS for typ in types])):
+            resp = {"code": 29, "msg": "Invalid users query"}
+        elif(not 0 < len(uids) <= MAX_USERS_QUERY):
+            resp = {"code": 29, "msg": "Invalid users query"}
+        elif(not all([type(uid) == str and uid.isdigit() for uid in uids])):
+            # 不是数字的UID不会被添加，不必查询，也避免任意字符串被驻留
+            resp = {"code": 29, "msg": "Invalid users query"}
+        else:
+            uid_list = [intern_uid(uid) for uid in uids]
+            resp["data"] = {typ: USER_GETTERS[typ](uid_list) for typ in types if config_dict[typ]["enable"]}
+    logger.debug(f"HTTP服务收到users请求\nparams:{jsons.dumps(params, ensure_ascii=False)}\nresp:{jsons.dumps({'code': resp['code'], 'msg': resp['msg']}, ensure_ascii=False)}")
+    return web.json_response(resp)
+
+@routes.get("/stream")
+async def stream(req: Request):
+    params = dict(req.query)
+    client_name = params.get("client_name", None)
+    # 浏览器的EventSource重连时通过Last-Event-ID请求头携带最后收到的消息序号
+    resume_seq = req.headers.get("Last-Event-ID", params.get("last_event_id", None))
+    options, resp = check_client_options(params)
+    if(client_name is None):
+        resp = {"code": 1, "msg": "Missing Parameter {client_name}"}
+    elif(delivery_engine is None):
+        resp = {"code": 20, "msg": "Delivery engine is not running"}
+    elif(client_name in ws_conn_dict and ws_conn_dict[client_name].open):
+        resp = {"code": 13, "msg": "Client name already exists"}
+    elif(not resume_seq is None and not str(resume_seq).isdigit()):
+        resp = {"code": 21, "msg": "Invalid sequence number"}
+    logger.debug(f"HTTP服务收到stream请求\nparams:{jsons.dumps(params, ensure_ascii=False)}\nresp:{jsons.dumps(resp, ensure_ascii=False)}")
+    if(resp["code"] != 0):
+        return web.json_response(resp)
+    _options = dict(push_config_dict.get("client_options", {}).get(client_name, {}))
+    _options.update(options)
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    await response.prepare(req)
+    sse_conn = SSEConnection(response)
+    ws_conn_dict[client_name] = sse_conn
+    set_client(client_name, "sse", _options)
+    delivery_engine.resume(client_name, None if resume_seq is None else int(resume_seq))
+    try:
+        await sse_conn.serve(config_dict["server"].get("sse_keepalive", 15), config_dict["server"].get("sse_retry", 3000))
+    except ConnectionResetError:
+        logger.debug(f"client_name:{client_name}的SSE连接已断开")
+    except:
+        errmsg = traceback.format_exc()
+        logger.error(f"client_name:{client_name}的SSE连接发生错误!错误信息:\n{errmsg}")
+    finally:
+        if(ws_conn_dict.get(client_name) is sse_conn):
+            del ws_conn_dict[client_name]
+    return response
 
 async def receiver(websocket):
+    await ws_receiver(StandaloneConnection(websocket))
+
+async def ws_handler(req):
+    websocket = web.WebSocketResponse()
+    await websocket.prepare(req)
+    await ws_receiver(AiohttpConnection(websocket))
+    return websocket
+
+async def ws_receiver(websocket: WebsocketConnection):
     global ws_conn_dict
     client_name = None
     try:
@@ -260,12 +487,26 @@ async def receiver(websocket):
                     elif(_client_name in ws_conn_dict and ws_conn_dict[_client_name].open):
                         resp = {"code": 13, "msg": "Client name already exists"}
                     else:
-                        client_name = _client_name
-                        ws_conn_dict[client_name] = websocket
-                        if not "clients" in push_config_dict:
-                            push_config_dict["clients"] = dict()
-                        push_config_dict["clients"][client_name] = "websocket"
-                        save_push_config()
+                        options, resp = check_client_options(params)
+                        resume_seq = params.get("resume_seq", None)
+                        if(not resume_seq is None and not str(resume_seq).isdigit()):
+                            resp = {"code": 21, "msg": "Invalid sequence number"}
+                        elif(not options is None):
+                            client_name = _client_name
+                            ws_conn_dict[client_name] = websocket
+                            set_client(client_name, "websocket", options)
+                            if(not delivery_engine is None):
+                                delivery_engine.resume(client_name, None if resume_seq is None else int(resume_seq))
+                elif(cmd_type == "ack"):
+                    if(client_name is None):
+                        resp = {"code": 14, "msg": "Not initialized"}
+                    elif(not "seq" in params or not str(params["seq"]).isdigit()):
+                        resp = {"code": 21, "msg": "Invalid sequence number"}
+                    else:
+                        if(not delivery_engine is None):
+                            delivery_engine.ack(client_name, int(params["seq"]))
+                        # ack命令不回复
+                        continue
                 elif(cmd_type == "exit"):
                     if(client_name is None):
                         resp = {"code": 14, "msg": "Not initialized"}
@@ -285,7 +526,7 @@ async def receiver(websocket):
         errmsg = traceback.format_exc()
         logger.error(f"client_name:{client_name}的Websocket连接发生错误!错误信息:\n{errmsg}")
     finally:
-        if(not client_name is None):
+        if(not client_name is None and ws_conn_dict.get(client_name) is websocket):
             del ws_conn_dict[client_name]
 
 async def cookie_update(interval: int):
@@ -298,52 +539,73 @@ async def cookie_update(interval: int):
             logger.error(f"Cookie保存至配置文件时出错!错误信息:\n{traceback.format_exc()}")
 
 async def start_tasks(app):
-    if(config_dict["bili_live"]["enable"]):
-        app["bili_live_listener"] = asyncio.create_task(listen_live(config_dict["bili_live"], msg_queue))
-    if(config_dict["bili_dyn"]["enable"]):
-        app["bili_dyn_listener"] = asyncio.create_task(listen_dynamic(config_dict["bili_dyn"], msg_queue))
-        if(config_dict["bili_dyn"]["detail_enable"]):
-            app["bili_dyn_detail_listener"] = asyncio.create_task(listen_bili_user_detail(config_dict["bili_dyn"], msg_queue))
-        if(config_dict["bili_dyn"]["comment_enable"]):
-            app["bili_dyn_comment_listener"] = asyncio.create_task(listen_dynamic_comment(config_dict["bili_dyn"], msg_queue))
-    if(config_dict["weibo"]["enable"]):
-        app["weibo_listener"] = asyncio.create_task(listen_weibo(config_dict["weibo"], msg_queue))
-        if(config_dict["weibo"]["detail_enable"]):
-            app["weibo_detail_listener"] = asyncio.create_task(listen_weibo_user_detail(config_dict["weibo"], msg_queue))
-        if(config_dict["weibo"]["comment_enable"]):
-            app["weibo_comment_listener"] = asyncio.create_task(listen_weibo_comment(config_dict["weibo"], msg_queue))
-    if(config_dict["websocket"]["enable"]):
+    global delivery_engine
+    delivery_engine = DeliveryEngine(push_config_dict, ws_conn_dict)
+    await delivery_engine.start()
+    await delivery_engine.restore(warm.get_saved("push_queue", {}))
+    warm.register("push_queue", delivery_engine.get_unsent)
+    app["listeners"] = dict()
+    for typ in ("bili_live", "bili_dyn", "weibo"):
+        if(config_dict[typ]["enable"]):
+            app["listeners"].update(start_listeners(typ, config_dict[typ], delivery_engine))
+    if(config_dict["websocket"]["enable"] and not config_dict["websocket"].get("embedded", False)):
         global ws_server
-        ws_server = await websockets.serve(receiver, config_dict["websocket"]["host"], config_dict["websocket"]["port"])
+        ws_server = await websockets.serve(receiver, config_dict["websocket"]["host"], config_dict["websocket"]["port"], write_limit=config_dict["websocket"].get("write_limit", 2 ** 16))
         logger.info("Websocket服务已开启")
     if(config_dict["cookie_update"]["enable"]):
         app["cookie_update"] = asyncio.create_task(cookie_update(config_dict["cookie_update"]["interval"]))
 
-async def cleanup_tasks(app):
+async def shutdown_tasks(app):
+    logger.info("Crawler退出")
+    # 先停止爬虫，不再产生新消息，在shutdown_timeout内推送完队列中的消息，未推送的消息保存后在下次启动时推送
+    tasks = list(app.get("listeners", {}).values())
+    if("cookie_update" in app):
+        tasks.append(app["cookie_update"])
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if(not delivery_engine is None):
+        shutdown_timeout = config_dict["server"].get("shutdown_timeout", 10)
+        if(await delivery_engine.drain(shutdown_timeout)):
+            logger.info("推送队列中的消息已推送完毕")
+        else:
+            logger.warning(f"{shutdown_timeout}秒内未能推送完队列中的消息,未推送的消息将在下次启动时推送")
+        # 先停止推送协程再保存，保存后队列不会再变化，aiohttp也不必等待推送协程结束
+        await delivery_engine.stop_channels()
+    warm.save_state()
     global ws_server
     if(not ws_server is None):
         ws_server.close()
+        await ws_server.wait_closed()
+        ws_server = None
         logger.info("Websocket服务已关闭")
+    for ws_conn in list(ws_conn_dict.values()):
+        if(isinstance(ws_conn, (AiohttpConnection, SSEConnection))):
+            await ws_conn.close()
 
-def exit_handler(signum, frame):
-    logger.info("Crawler退出")
-    exit(0)
+async def cleanup_tasks(app):
+    if(not delivery_engine is None):
+        await delivery_engine.stop()
+    push_config_journal.close(push_config_dict)
+    close_store()
 
 def main():
-    signal.signal(signal.SIGINT, exit_handler)
-    signal.signal(signal.SIGTERM, exit_handler)
     load_config()
     global logger
     logger = init_logger()
 
-    sender = threading.Thread(target = msg_sender)
-    sender.start()
-
     app = web.Application()
     app.add_routes(routes)
+    if(config_dict["websocket"]["enable"] and config_dict["websocket"].get("embedded", False)):
+        # Websocket服务与HTTP服务共用端口
+        app.router.add_get(config_dict["websocket"].get("path", "/ws"), ws_handler)
+        logger.info("Websocket服务已开启")
     app.on_startup.append(start_tasks)
+    app.on_shutdown.append(shutdown_tasks)
     app.on_cleanup.append(cleanup_tasks)
-    web.run_app(app, host=config_dict["server"]["host"], port=config_dict["server"]["port"], handle_signals=False)
+    # 由aiohttp在事件循环中处理SIGINT与SIGTERM，不会在协程内部抛出异常，之后依次执行shutdown_tasks与cleanup_tasks
+    # shutdown_tasks之后aiohttp等待剩余的协程与连接结束的最长时间
+    web.run_app(app, host=config_dict["server"]["host"], port=config_dict["server"]["port"], handle_signals=True, shutdown_timeout=config_dict["server"].get("shutdown_timeout", 10))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,168 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from util.logger import init_logger
+
+logger = init_logger()
+
+DB_SUFFIX = ".db"
+# 推送给客户端的Cookie与UA不写入存档
+EXCLUDED_KEYS = ("cookie", "ua")
+MAX_OPEN_DAYS = 4
+
+def get_day(timestamp: int) -> str:
+    return time.strftime("%Y-%m-%d", time.localtime(timestamp))
+
+def parse_cursor(cursor: str) -> tuple[int, int]:
+    """cursor为上一页最后一条消息的created_time与id，格式为{created_time}_{id}"""
+    created_time, row_id = cursor.split("_")
+    return (int(created_time), int(row_id))
+
+class Archive:
+    """
+    推送消息的本地存档，按消息的created_time每天一个SQLite文件，每条消息为一行，内容为zlib压缩的JSON，
+    以type、uid与created_time建立索引，没有created_time的消息（如直播状态、用户信息变化）使用存档时间，
+    写入与查询都在单独的线程中进行
+    """
+    def __init__(self, path: str, max_days: int, compress_level: int) -> None:
+        self.path = path
+        self.max_days = max_days
+        self.compress_level = compress_level
+        os.makedirs(self.path, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="archive")
+        # 只在存档线程中访问
+        self.conns: dict[str, sqlite3.Connection] = dict()
+        self.lock = threading.Lock()
+        self.pending: list[tuple[str, str, str, int, dict, str]] = []
+        self.scheduled = False
+        self.archived = 0
+        self.executor.submit(self.prune)
+
+    def get_conn(self, day: str) -> sqlite3.Connection:
+        conn = self.conns.pop(day, None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.path, day + DB_SUFFIX))
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS msg (id INTEGER PRIMARY KEY, type TEXT NOT NULL, subtype TEXT NOT NULL, uid TEXT NOT NULL, created_time INTEGER NOT NULL, data BLOB NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS msg_time ON msg (created_time)")
+            conn.execute("CREATE INDEX IF NOT EXISTS msg_type_uid ON msg (type, uid, created_time)")
+            conn.commit()
+            if len(self.conns) >= MAX_OPEN_DAYS:
+                self.conns.pop(next(iter(self.conns))).close()
+        # 最近使用的连接放在最后
+        self.conns[day] = conn
+        return conn
+
+    def get_days(self) -> list[str]:
+        return sorted([name[:-len(DB_SUFFIX)] for name in os.listdir(self.path) if name.endswith(DB_SUFFIX)])
+
+    def append(self, msg: dict, text: str = None):
+        """text为推送时已序列化的消息，不含Cookie与UA时直接复用，否则在存档线程中重新序列化"""
+        # 进入推送队列的消息不会再被修改，序列化与压缩都在存档线程中进行，不占用事件循环
+        created_time = msg.get("created_time", None)
+        if not type(created_time) == int:
+            created_time = int(time.time())
+        row = (msg["type"], msg.get("subtype", msg["type"]), msg.get("user", {}).get("uid", ""), created_time, msg, text)
+        with self.lock:
+            self.pending.append(row)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.executor.submit(self.flush)
+
+    def flush(self):
+        """在存档线程中执行，积累的消息按日期分组，每天一个事务写入"""
+        with self.lock:
+            rows = self.pending
+            self.pending = []
+            self.scheduled = False
+        day_rows: dict[str, list[tuple]] = dict()
+        for typ, subtype, uid, created_time, msg, text in rows:
+            if text is None or any([key in msg for key in EXCLUDED_KEYS]):
+                text = json.dumps({key: value for key, value in msg.items() if not key in EXCLUDED_KEYS}, ensure_ascii=False)
+            day_rows.setdefault(get_day(created_time), []).append((typ, subtype, uid, created_time, zlib.compress(text.encode("UTF-8"), self.compress_level)))
+        for day, values in day_rows.items():
+            try:
+                is_new_day = not os.path.exists(os.path.join(self.path, day + DB_SUFFIX))
+                with self.get_conn(day) as conn:
+                    conn.executemany("INSERT INTO msg (type, subtype, uid, created_time, data) VALUES (?, ?, ?, ?, ?)", values)
+                self.archived += len(values)
+                if is_new_day:
+                    self.prune()
+            except:
+                logger.error(f"写入消息存档{day}错误\n{traceback.format_exc()}")
+
+    def prune(self):
+        """删除超过max_days天的存档文件"""
+        if self.max_days <= 0:
+            return
+        oldest_day = get_day(int(time.time()) - self.max_days * 86400)
+        for day in self.get_days():
+            if day >= oldest_day:
+                break
+            conn = self.conns.pop(day, None)
+            if not conn is None:
+                conn.close()
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(os.path.join(self.path, day + DB_SUFFIX + suffix))
+                except FileNotFoundError:
+                    pass
+            logger.info(f"已删除过期的消息存档{day}")
+
+    async def query(self, types: list[str], subtypes: list[str], uids: list[str], start: int, end: int, cursor: str, limit: int) -> tuple[list[str], str]:
+        """按created_time从早到晚返回最多limit条消息的JSON文本，以及下一页的cursor，没有下一页时cursor为None"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._query, types, subtypes, uids, start, end, cursor, limit)
+
+    def _query(self, types: list[str], subtypes: list[str], uids: list[str], start: int, end: int, cursor: str, limit: int) -> tuple[list[str], str]:
+        after = None if cursor is None else parse_cursor(cursor)
+        start_day = get_day(start if after is None else max(start, after[0]))
+        end_day = get_day(end)
+        texts: list[str] = []
+        last_row = None
+        for day in self.get_days():
+            if day < start_day or day > end_day:
+                continue
+            conditions = ["created_time >= ?", "created_time <= ?"]
+            params: list = [start, end]
+            if not after is None:
+                conditions.append("(created_time > ? OR (created_time = ? AND id > ?))")
+                params.extend([after[0], after[0], after[1]])
+            for column, values in (("type", types), ("subtype", subtypes), ("uid", uids)):
+                if values:
+                    conditions.append(f"{column} IN ({','.join(['?'] * len(values))})")
+                    params.extend(values)
+            params.append(limit - len(texts))
+            rows = self.get_conn(day).execute(f"SELECT id, created_time, data FROM msg WHERE {' AND '.join(conditions)} ORDER BY created_time, id LIMIT ?", params).fetchall()
+            for row_id, created_time, data in rows:
+                texts.append(zlib.decompress(data).decode("UTF-8"))
+                last_row = (created_time, row_id)
+            if len(texts) >= limit:
+                return (texts, f"{last_row[0]}_{last_row[1]}")
+        return (texts, None)
+
+    def get_stats(self) -> dict:
+        return {
+            "archived": self.archived,
+            "pending": len(self.pending)
+        }
+
+    def close(self):
+        self.executor.submit(self.flush)
+        self.executor.submit(self.close_conns)
+        self.executor.shutdown(wait=True)
+
+    def close_conns(self):
+        for conn in self.conns.values():
+            conn.close()
+        self.conns.clear()
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import random
+import time
+
+from util.logger import init_logger
+
+logger = init_logger()
+
+class CircuitBreaker:
+    """
+    单个推送目标的熔断器，连续失败threshold次后断开，断开期间不再向该目标推送，
+    断开时间结束后允许一次试探推送，成功则恢复，失败则以翻倍的时间再次断开
+    """
+    def __init__(self, name: str, threshold: int, open_time: float, max_open_time: float) -> None:
+        self.name = name
+        self.threshold = max(threshold, 1)
+        self.open_time = open_time
+        self.max_open_time = max_open_time
+        self.state = "closed"
+        self.failures = 0
+        self.open_count = 0
+        self.open_until = 0.0
+        self.total_failures = 0
+        self.total_opens = 0
+        self.retried = 0
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() < self.open_until:
+                return False
+            self.state = "half_open"
+        return True
+
+    def get_delay(self) -> float:
+        """距离允许下一次推送的时间（秒）"""
+        if self.state != "open":
+            return 0.0
+        return max(self.open_until - time.monotonic(), 0.0)
+
+    def on_success(self):
+        if self.state != "closed":
+            logger.info(f"推送目标{self.name}已恢复")
+        self.state = "closed"
+        self.failures = 0
+        self.open_count = 0
+
+    def on_failure(self):
+        self.failures += 1
+        self.total_failures += 1
+        if self.state == "half_open" or self.failures >= self.threshold:
+            open_time = min(self.open_time * 2 ** self.open_count, self.max_open_time)
+            self.state = "open"
+            self.open_count += 1
+            self.total_opens += 1
+            self.open_until = time.monotonic() + open_time
+            logger.warning(f"推送目标{self.name}连续推送失败{self.failures}次,暂停推送{open_time}秒")
+
+    def to_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "total_failures": self.total_failures,
+            "opens": self.total_opens,
+            "retried": self.retried,
+            "retry_after": round(self.get_delay(), 3)
+        }
+
+def get_backoff(attempt: int, base: float, max_delay: float) -> float:
+    """第attempt次重试前的等待时间，指数增长并加入随机抖动，避免多个目标同时重试"""
+    delay = min(base * 2 ** attempt, max_delay)
+    return delay * (0.5 + random.random() / 2)
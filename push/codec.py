@@ -0,0 +1,59 @@
+from __future__ import annotations
+import gzip
+import json
+import struct
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ENCODINGS = ("json", "msgpack")
+COMPRESSIONS = ("none", "gzip", "deflate")
+CONTENT_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack"
+}
+
+def is_available(encoding: str) -> bool:
+    """msgpack为可选依赖，未安装时不能使用"""
+    return encoding == "json" or (encoding == "msgpack" and not msgpack is None)
+
+def encode(msg: dict, encoding: str) -> bytes:
+    if encoding == "msgpack":
+        return msgpack.packb(msg, use_bin_type=True)
+    return json.dumps(msg, ensure_ascii=False).encode("UTF-8")
+
+def decode(data: bytes, encoding: str, compression: str = "none"):
+    data = decompress(data, compression)
+    if encoding == "msgpack":
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data)
+
+def encode_array(payloads: list[bytes], encoding: str) -> bytes:
+    """将已编码的多条消息拼接为数组，无需重新编码"""
+    if encoding == "msgpack":
+        return msgpack.Packer().pack_array_header(len(payloads)) + b"".join(payloads)
+    return b"[" + b",".join(payloads) + b"]"
+
+def compress(data: bytes, compression: str, level: int = 6) -> bytes:
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=level)
+    elif compression == "deflate":
+        return zlib.compress(data, level)
+    return data
+
+def decompress(data: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        return gzip.decompress(data)
+    elif compression == "deflate":
+        return zlib.decompress(data)
+    return data
+
+def pack_seq(seq: int, payload: bytes) -> bytes:
+    """二进制消息帧，前8字节为大端序的消息序号"""
+    return struct.pack(">Q", seq) + payload
+
+def unpack_seq(frame: bytes) -> tuple[int, bytes]:
+    return (struct.unpack(">Q", frame[:8])[0], frame[8:])
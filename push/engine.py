@@ -0,0 +1,950 @@
+from __future__ import annotations
+import asyncio
+import collections
+import json
+import time
+import traceback
+from urllib.parse import urlparse
+import aiohttp
+
+from util.logger import init_logger
+from util.config import get_value, get_config_dict
+from push.stats import LatencyStat, SerializeStat
+from push.websocket import broadcast
+from push.sse import SSEConnection
+from push.unix import UnixSink, is_unix_url, parse_unix_url
+from push import codec
+from push.projection import Projection
+from push.filter import FilterIndex, get_filter_key
+from push.lanes import LaneQueue, LANES, DEFAULT_LANE
+from push.breaker import CircuitBreaker, get_backoff
+from push.outbox import Outbox
+from push.archive import Archive
+
+logger = init_logger()
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+# aggregate：用户信息变化时推送一条带有diff的profile消息 legacy：每个变化的字段推送一条消息
+PROFILE_MODES = ("aggregate", "legacy")
+# 通过长连接推送的客户端的url
+CONNECTION_URLS = ("websocket", "sse")
+
+def split_profile(msg: dict) -> list[dict]:
+    """将profile消息拆分为每个变化的字段一条的旧格式消息"""
+    return [{
+        "type": msg["type"],
+        "subtype": key,
+        "user": msg["user"],
+        "pre": value["pre"],
+        "now": value["now"]
+    } for key, value in msg["diff"].items()]
+
+class Envelope:
+    """进入推送队列的消息，由订阅该消息的所有客户端共享，只序列化一次"""
+    __slots__ = ("msg", "enqueue_time", "offset", "_text", "_body", "_payloads", "_views", "_children", "_stat")
+
+    def __init__(self, msg: dict, stat: SerializeStat, offset: int = None) -> None:
+        self.msg = msg
+        self.enqueue_time = time.time()
+        self.offset = offset
+        self._text: str = None
+        self._body: bytes = None
+        self._payloads: dict[tuple[str, str], bytes] = None
+        self._views: dict[str, Envelope] = None
+        self._children: list[Envelope] = None
+        self._stat = stat
+
+    def reuse(self, getter, *args):
+        # 只统计外部调用，没有产生新的序列化时计为一次复用，body、frame等内部调用text时不重复计数
+        encoded = self._stat.encoded
+        result = getter(*args)
+        if self._stat.encoded == encoded:
+            self._stat.reused += 1
+        return result
+
+    def get_text(self) -> str:
+        if self._text is None:
+            start_time = time.perf_counter()
+            self._text = json.dumps(self.msg, ensure_ascii=False)
+            self._stat.encode_time += time.perf_counter() - start_time
+            self._stat.encoded += 1
+        return self._text
+
+    def get_body(self) -> bytes:
+        if self._body is None:
+            self._body = self.get_text().encode("UTF-8")
+        return self._body
+
+    @property
+    def text(self) -> str:
+        return self.reuse(self.get_text)
+
+    def frame(self, seq: int) -> str:
+        """带序号的Websocket消息帧，消息本身仍复用同一份序列化结果"""
+        return f'{{"seq":{seq},"msg":{self.reuse(self.get_text)}}}'
+
+    @property
+    def body(self) -> bytes:
+        return self.reuse(self.get_body)
+
+    def project(self, projection: Projection) -> Envelope:
+        """按客户端的字段裁剪规则生成的消息，在序列化之前裁剪，规则相同的客户端共享同一份结果"""
+        if projection is None:
+            return self
+        if self._views is None:
+            self._views = dict()
+        view = self._views.get(projection.key)
+        if view is None:
+            view = Envelope(projection.apply(self.msg), self._stat, self.offset)
+            view.enqueue_time = self.enqueue_time
+            self._views[projection.key] = view
+        return view
+
+    def expand(self) -> list[Envelope]:
+        """将profile消息拆分为每个字段一条的旧格式消息，只有最后一条消息带有offset"""
+        if self._children is None:
+            self._children = []
+            for msg in split_profile(self.msg):
+                child = Envelope(msg, self._stat)
+                child.enqueue_time = self.enqueue_time
+                self._children.append(child)
+            if self._children:
+                self._children[-1].offset = self.offset
+        return self._children
+
+    def payload(self, encoding: str, compression: str, level: int = 6) -> bytes:
+        """按客户端协商的编码与压缩方式生成的消息内容，相同格式的客户端共享同一份结果"""
+        return self.reuse(self.get_payload, encoding, compression, level)
+
+    def get_payload(self, encoding: str, compression: str, level: int) -> bytes:
+        if encoding == "json" and compression == "none":
+            return self.get_body()
+        if self._payloads is None:
+            self._payloads = dict()
+        key = (encoding, compression)
+        payload = self._payloads.get(key)
+        if payload is None:
+            if compression == "none":
+                start_time = time.perf_counter()
+                payload = codec.encode(self.msg, encoding)
+                self._stat.encode_time += time.perf_counter() - start_time
+            else:
+                raw = self.get_payload(encoding, "none", level)
+                start_time = time.perf_counter()
+                payload = codec.compress(raw, compression, level)
+                self._stat.compress_time += time.perf_counter() - start_time
+            self._stat.encoded += 1
+            self._payloads[key] = payload
+        return payload
+
+    def is_expired(self, ttl: int) -> bool:
+        if ttl <= 0:
+            return False
+        created_time = self.msg.get("created_time", self.enqueue_time)
+        return time.time() - created_time > ttl
+
+class ClientChannel:
+    """单个客户端的推送通道，每个客户端拥有独立的有界队列与协程，互不阻塞"""
+    def __init__(self, engine: DeliveryEngine, client_name: str) -> None:
+        self.engine = engine
+        self.client_name = client_name
+        self.buffer = LaneQueue(engine.lane_weights)
+        self.not_empty = asyncio.Event()
+        self.not_full = asyncio.Event()
+        self.not_full.set()
+        self.task: asyncio.Task = None
+        self.dropped = 0
+        self.expired = 0
+        self.delivered = 0
+        self.failed = 0
+        self.requeued = 0
+        self.batch_latency = LatencyStat()
+        self.batch_count = 0
+        self.batch_msg_count = 0
+        # 以下状态仅在开启消息发件箱时使用
+        self.outbox: Outbox = engine.outbox
+        self.pending: set[int] = set()
+        self.offline = False
+        self.resume_event = asyncio.Event()
+        # 以下状态仅在Websocket客户端开启ack时使用
+        self.seq = 0
+        self.acked_seq = 0
+        self.inflight: collections.OrderedDict[int, Envelope] = collections.OrderedDict()
+        self.ring: collections.deque[tuple[int, Envelope]] = collections.deque(maxlen=engine.ring_size)
+        self.resend: collections.deque[tuple[int, Envelope]] = collections.deque()
+        self.window_open = asyncio.Event()
+        self.window_open.set()
+        # 已从队列取出、正在推送的消息，退出时未推送完成的消息会被保存
+        self.taken: list[Envelope] = []
+        if not self.outbox is None:
+            self.committed = self.outbox.get_committed(client_name)
+            self.last_offset = self.committed
+            self.catching_up = self.committed < self.outbox.next_offset - 1
+        else:
+            self.catching_up = False
+        self.configure()
+
+    def configure(self):
+        options = self.engine.get_client_options(self.client_name)
+        self.maxsize: int = options["queue_size"]
+        self.overflow: str = options["overflow"]
+        self.ttl: int = options["ttl"]
+        self.batch: bool = options["batch"]
+        self.batch_window: float = options["batch_window"]
+        self.batch_size: int = options["batch_size"]
+        self.ack: bool = options["ack"]
+        self.window: int = options["window"]
+        self.encoding: str = options["encoding"]
+        self.compression: str = options["compression"]
+        self.profile_mode: str = options["profile"]
+        self.projection: Projection = None
+        if options.get("projection"):
+            try:
+                self.projection = Projection(options["projection"])
+            except ValueError:
+                logger.error(f"client_name:{self.client_name}的字段裁剪规则无效,推送完整消息")
+        self.window_open.set()
+        while len(self.buffer) > self.maxsize:
+            self.buffer.drop()
+            self.dropped += 1
+        if len(self.buffer) < self.maxsize:
+            self.not_full.set()
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if not self.task is None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def expand(self, envelope: Envelope) -> list[Envelope]:
+        if self.profile_mode == "aggregate" or envelope.msg.get("subtype") != "profile":
+            return [envelope]
+        return self.engine.expand_profile(self.client_name, envelope)
+
+    async def put(self, envelope: Envelope):
+        if self.offline or self.catching_up:
+            # 消息已写入发件箱，恢复推送时再从发件箱读取
+            return
+        for envelope in self.expand(envelope):
+            await self.put_one(envelope)
+
+    async def put_one(self, envelope: Envelope):
+        if not envelope.offset is None:
+            self.last_offset = envelope.offset
+        if self.overflow == "block":
+            while len(self.buffer) >= self.maxsize:
+                self.not_full.clear()
+                await self.not_full.wait()
+        elif len(self.buffer) >= self.maxsize:
+            self.dropped += 1
+            if self.overflow == "drop_newest":
+                logger.warning(f"client_name:{self.client_name}的推送队列已满,丢弃新消息")
+                return
+            self.pending.discard(self.buffer.drop().offset)
+            logger.warning(f"client_name:{self.client_name}的推送队列已满,丢弃优先级最低的最早消息")
+        self.buffer.append(envelope, self.engine.get_lane(envelope.msg))
+        if not envelope.offset is None:
+            self.pending.add(envelope.offset)
+        self.not_empty.set()
+
+    async def get(self) -> Envelope:
+        while not self.buffer:
+            self.not_empty.clear()
+            await self.not_empty.wait()
+        envelope = self.buffer.popleft()
+        self.not_full.set()
+        return envelope
+
+    async def get_batch(self) -> list[Envelope]:
+        # 在batch_window时间内最多收集batch_size条消息
+        envelopes = [await self.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(envelopes) < self.batch_size:
+            if self.buffer:
+                envelopes.append(self.buffer.popleft())
+                self.not_full.set()
+                continue
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            self.not_empty.clear()
+            try:
+                await asyncio.wait_for(self.not_empty.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+        return envelopes
+
+    def check_expired(self, envelope: Envelope) -> bool:
+        if envelope.is_expired(self.ttl):
+            self.pending.discard(envelope.offset)
+            self.expired += 1
+            logger.debug(f"client_name:{self.client_name}的消息已过期,不再推送\n消息内容:{envelope.msg}")
+            return True
+        return False
+
+    async def deliver(self, envelopes: list[Envelope], is_batch: bool) -> bool:
+        try:
+            if is_batch:
+                is_success = await self.engine.deliver_batch(self.client_name, envelopes)
+                self.batch_count += 1
+                self.batch_msg_count += len(envelopes)
+                self.batch_latency.add(time.time() - envelopes[0].enqueue_time)
+            else:
+                is_success = await self.engine.deliver(self.client_name, envelopes[0])
+        except asyncio.CancelledError:
+            raise
+        except:
+            is_success = False
+            errmsg = traceback.format_exc()
+            logger.error(f"client_name:{self.client_name}的消息推送发生错误!错误信息:{errmsg}\n消息内容:{[envelope.msg for envelope in envelopes]}")
+        if is_success:
+            self.delivered += len(envelopes)
+            for envelope in envelopes:
+                self.pending.discard(envelope.offset)
+        return is_success
+
+    def requeue(self, envelopes: list[Envelope]):
+        # 没有发件箱时推送失败的消息放回队列头部，等待推送目标恢复后按原顺序重新推送
+        for envelope in reversed(envelopes):
+            self.buffer.appendleft(envelope, self.engine.get_lane(envelope.msg))
+        self.requeued += len(envelopes)
+        self.not_empty.set()
+
+    def is_connected(self) -> bool:
+        if not self.engine.push_config_dict["clients"].get(self.client_name) in CONNECTION_URLS:
+            return True
+        ws_conn = self.engine.ws_conn_dict.get(self.client_name, None)
+        return not ws_conn is None and ws_conn.open
+
+    async def wait_connected(self):
+        while not self.is_connected():
+            self.resume_event.clear()
+            await self.resume_event.wait()
+
+    def is_ack_mode(self) -> bool:
+        # SSE客户端始终带有序号推送，发送成功即视为已确认
+        url = self.engine.push_config_dict["clients"].get(self.client_name)
+        return (self.ack and url == "websocket") or url == "sse"
+
+    def is_auto_ack(self) -> bool:
+        return self.engine.push_config_dict["clients"].get(self.client_name) == "sse"
+
+    async def get_ack(self) -> tuple[int, Envelope]:
+        while True:
+            # 窗口有空位后再取出消息，等待期间客户端重连时重发的消息仍先于新消息发送
+            while len(self.inflight) >= self.window:
+                self.window_open.clear()
+                await self.window_open.wait()
+            # 优先重发客户端重连前未确认的消息
+            if self.resend:
+                return self.resend.popleft()
+            if self.buffer:
+                envelope = self.buffer.popleft()
+                self.not_full.set()
+                return (None, envelope)
+            self.not_empty.clear()
+            await self.not_empty.wait()
+
+    async def deliver_ack(self, envelope: Envelope, seq: int = None) -> bool:
+        # 未确认的消息数达到窗口大小时停止发送，等待客户端确认
+        while len(self.inflight) >= self.window:
+            self.window_open.clear()
+            await self.window_open.wait()
+        if seq is None:
+            self.seq += 1
+            seq = self.seq
+            self.ring.append((seq, envelope))
+        self.inflight[seq] = envelope
+        if await self.engine.deliver(self.client_name, envelope, seq):
+            self.delivered += 1
+            if self.is_auto_ack():
+                self.on_ack(seq)
+            return True
+        self.failed += 1
+        return False
+
+    def on_ack(self, seq: int):
+        # 重发后inflight中的序号不一定递增，确认序号及之前的消息全部移除
+        for inflight_seq in [inflight_seq for inflight_seq in self.inflight.keys() if inflight_seq <= seq]:
+            self.pending.discard(self.inflight.pop(inflight_seq).offset)
+        while self.resend and self.resend[0][0] <= seq:
+            self.pending.discard(self.resend.popleft()[1].offset)
+        self.acked_seq = max(self.acked_seq, seq)
+        self.window_open.set()
+
+    def get_committed(self) -> int:
+        """已推送消息的offset水位，水位之前的消息均已推送或被丢弃"""
+        if self.offline or self.catching_up:
+            return self.committed
+        elif self.pending:
+            return min(self.pending) - 1
+        return self.last_offset
+
+    def go_offline(self):
+        # 推送失败后清空内存中的队列，恢复后从发件箱中未确认的位置重新推送
+        self.committed = self.get_committed()
+        self.offline = True
+        self.buffer.clear()
+        self.pending.clear()
+        self.inflight.clear()
+        self.ring.clear()
+        self.resend.clear()
+        self.window_open.set()
+        self.not_full.set()
+        logger.info(f"client_name:{self.client_name}推送失败,暂停推送,未推送的消息保存在发件箱中")
+
+    def resume(self, resume_seq: int = None):
+        if self.is_ack_mode() and not self.offline:
+            # 从客户端指定的序号或最后确认的序号之后重发环形缓冲区中的消息
+            # 客户端已确认的消息不再重发，SSE发送成功即视为确认，客户端可能没有收到，以客户端指定的序号为准
+            if resume_seq is None or (resume_seq < self.acked_seq and not self.is_auto_ack()):
+                resume_seq = self.acked_seq
+            self.inflight.clear()
+            self.resend = collections.deque([(seq, envelope) for seq, envelope in self.ring if seq > resume_seq])
+            if self.ring and self.ring[0][0] > resume_seq + 1:
+                logger.warning(f"client_name:{self.client_name}请求的序号{resume_seq}已超出缓冲区范围,部分消息无法重发")
+            self.window_open.set()
+            self.not_empty.set()
+        self.resume_event.set()
+
+    async def wait_resume(self):
+        self.resume_event.clear()
+        if self.engine.push_config_dict["clients"][self.client_name] in CONNECTION_URLS:
+            await self.resume_event.wait()
+        else:
+            try:
+                await asyncio.wait_for(self.resume_event.wait(), self.engine.get_retry_delay(self.client_name))
+            except asyncio.TimeoutError:
+                pass
+        self.offline = False
+        self.catching_up = True
+
+    async def catch_up(self) -> bool:
+        logger.info(f"client_name:{self.client_name}开始从发件箱恢复推送 offset:{self.committed + 1}")
+        for offset, msg in self.outbox.read(self.committed + 1):
+            if self.client_name in self.engine.get_clients(msg):
+                for envelope in self.expand(Envelope(msg, self.engine.serialize_stat, offset)):
+                    if self.check_expired(envelope):
+                        continue
+                    if self.is_ack_mode():
+                        is_success = await self.deliver_ack(envelope)
+                    else:
+                        is_success = await self.deliver([envelope], self.batch)
+                    if not is_success:
+                        self.failed += 1
+                        self.catching_up = False
+                        self.go_offline()
+                        return False
+            self.committed = offset
+        self.catching_up = False
+        self.last_offset = self.committed
+        logger.info(f"client_name:{self.client_name}已从发件箱恢复推送")
+        return True
+
+    async def run(self):
+        while True:
+            if self.offline:
+                await self.wait_resume()
+            if self.catching_up:
+                await self.catch_up()
+                continue
+            if self.is_ack_mode():
+                seq, envelope = await self.get_ack()
+                if not seq is None or not self.check_expired(envelope):
+                    if not await self.deliver_ack(envelope, seq):
+                        if not self.outbox is None:
+                            self.go_offline()
+                        else:
+                            # 等待客户端重连后从环形缓冲区重发
+                            self.resume_event.clear()
+                            await self.resume_event.wait()
+                continue
+            # 推送目标熔断期间消息暂存在队列中，不占用推送
+            await self.engine.wait_destination(self.client_name)
+            if self.batch:
+                envelopes = await self.get_batch()
+            else:
+                envelopes = [await self.get()]
+            envelopes = [envelope for envelope in envelopes if not self.check_expired(envelope)]
+            if not envelopes:
+                continue
+            self.taken = envelopes
+            is_success = await self.deliver(envelopes, self.batch)
+            self.taken = []
+            if is_success:
+                continue
+            if not self.outbox is None:
+                self.failed += len(envelopes)
+                self.go_offline()
+            else:
+                self.requeue(envelopes)
+                # 熔断的推送目标在下次循环中等待恢复，未连接的客户端等待重新连接
+                await self.wait_connected()
+
+    def is_drained(self) -> bool:
+        """内存中没有未推送或未确认的消息"""
+        return not self.buffer and not self.taken and not self.inflight and not self.resend
+
+    def is_blocked(self) -> bool:
+        """推送目标熔断、连接未建立或已暂停推送，短时间内无法推送"""
+        return self.offline or self.engine.is_parked(self.client_name) or not self.is_connected()
+
+    def get_unsent(self) -> list[dict]:
+        """未推送以及已发送但未确认的消息"""
+        unacked = dict(self.inflight)
+        unacked.update(self.resend)
+        envelopes = [unacked[seq] for seq in sorted(unacked.keys())] + self.taken + self.buffer.get_all()
+        return [envelope.msg for envelope in envelopes]
+
+    def get_stats(self) -> dict:
+        stats = {
+            "queued": len(self.buffer),
+            "offline": self.offline,
+            "parked": self.engine.is_parked(self.client_name),
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "requeued": self.requeued,
+            "dropped": self.dropped,
+            "expired": self.expired
+        }
+        if self.is_ack_mode():
+            stats["ack"] = {
+                "window": self.window,
+                "seq": self.seq,
+                "acked_seq": self.acked_seq,
+                "inflight": len(self.inflight)
+            }
+        if self.batch:
+            stats["batch"] = {
+                "window": self.batch_window,
+                "size": self.batch_size,
+                "count": self.batch_count,
+                "avg_size": round(self.batch_msg_count / self.batch_count, 2) if self.batch_count else 0.0,
+                "latency": self.batch_latency.to_dict()
+            }
+        stats["lanes"] = self.buffer.get_stats()
+        return stats
+
+class DeliveryEngine:
+    """运行在aiohttp事件循环上的消息推送引擎，提供与asyncio.Queue相同的put接口供爬虫调用"""
+    def __init__(self, push_config_dict: dict, ws_conn_dict: dict) -> None:
+        self.push_config_dict = push_config_dict
+        self.ws_conn_dict = ws_conn_dict
+        self.timeout = aiohttp.ClientTimeout(total=get_value("push", "timeout", 10))
+        self.limit_per_host = get_value("push", "limit_per_host", 8)
+        self.default_options = {
+            "queue_size": get_value("push", "queue_size", 1000),
+            "overflow": get_value("push", "overflow", "drop_oldest"),
+            "ttl": get_value("push", "ttl", 0),
+            "batch": get_value("push", "batch", False),
+            "batch_window": float(get_value("push", "batch_window", 1)),
+            "batch_size": get_value("push", "batch_size", 50),
+            "ack": False,
+            "window": get_value("push", "ack_window", 100),
+            "encoding": get_value("push", "encoding", "json"),
+            "compression": get_value("push", "compression", "none"),
+            "profile": get_value("push", "profile_mode", "legacy")
+        }
+        self.compress_level = get_value("push", "compress_level", 6)
+        if not codec.is_available(self.default_options["encoding"]):
+            logger.error(f"未安装msgpack,默认编码方式改为json")
+            self.default_options["encoding"] = "json"
+        self.ring_size = get_value("push", "ring_size", 1000)
+        self.lane_weights = {
+            "high": get_value("push", "high_weight", 8),
+            "normal": get_value("push", "normal_weight", 3),
+            "low": get_value("push", "low_weight", 1)
+        }
+        # 键为type或type/subtype，值为优先级
+        self.priority_dict: dict[str, str] = dict()
+        for key, lane in get_config_dict().get("priority", {}).items():
+            if lane in LANES:
+                self.priority_dict[key] = lane
+            else:
+                logger.error(f"消息类型{key}的优先级{lane}无效,使用默认优先级{DEFAULT_LANE}")
+        self.channels: dict[str, ClientChannel] = dict()
+        self.sessions: dict[str, aiohttp.ClientSession] = dict()
+        self.serialize_stat = SerializeStat()
+        self.filter_index = FilterIndex(push_config_dict)
+        self.outbox: Outbox = None
+        self.outbox_task: asyncio.Task = None
+        self.retry_interval = get_value("outbox", "retry_interval", 30)
+        self.retries = get_value("push", "retries", 3)
+        self.backoff_base = float(get_value("push", "backoff_base", 0.5))
+        self.backoff_max = float(get_value("push", "backoff_max", 30))
+        self.breakers: dict[str, CircuitBreaker] = dict()
+        self.unix_sinks: dict[str, UnixSink] = dict()
+        # 向多个Unix domain socket推送时部分失败的消息与已发送成功的socket，重试同一批消息时只发送给失败的socket
+        self.unix_partial: dict[str, tuple[list[bytes], set[str]]] = dict()
+        self.archive: Archive = None
+        if get_value("archive", "enable", False):
+            self.archive = Archive(
+                get_value("archive", "path", "archive"),
+                get_value("archive", "max_days", 30),
+                get_value("archive", "compress_level", 6)
+            )
+        if get_value("outbox", "enable", False):
+            self.outbox = Outbox(
+                get_value("outbox", "path", "outbox"),
+                get_value("outbox", "segment_size", 16 * 1024 * 1024),
+                max(get_value("outbox", "max_segments", 64), 1),
+                get_value("outbox", "fsync", "never")
+            )
+
+    async def start(self):
+        for client_name in self.push_config_dict.get("clients", {}).keys():
+            self.get_channel(client_name)
+        if not self.outbox is None:
+            self.outbox_task = asyncio.create_task(self.outbox_flusher(get_value("outbox", "flush_interval", 5)))
+
+    async def stop(self):
+        await self.stop_channels()
+        if not self.outbox is None:
+            self.flush_outbox()
+            self.outbox.close()
+        if not self.archive is None:
+            self.archive.close()
+        self.channels.clear()
+        for session in list(self.sessions.values()):
+            await session.close()
+        self.sessions.clear()
+        for sink in list(self.unix_sinks.values()):
+            await sink.close()
+        self.unix_sinks.clear()
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        等待所有客户端的队列推送完毕，超过timeout秒返回False，
+        未推送完的客户端都无法推送（推送目标熔断、连接未建立）时不再等待，同样返回False
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            channels = [channel for channel in self.channels.values() if not channel.is_drained()]
+            if not channels:
+                return True
+            if all([channel.is_blocked() for channel in channels]) or time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+
+    async def stop_channels(self):
+        """停止所有客户端的推送协程，队列中的消息保留在内存中"""
+        if not self.outbox_task is None:
+            self.outbox_task.cancel()
+        for channel in list(self.channels.values()):
+            await channel.stop()
+
+    def get_unsent(self) -> dict[str, list[dict]]:
+        """开启消息发件箱时未推送的消息已保存在发件箱中"""
+        if not self.outbox is None:
+            return dict()
+        unsent_dict = dict()
+        for client_name, channel in self.channels.items():
+            msgs = channel.get_unsent()
+            if msgs:
+                unsent_dict[client_name] = msgs
+        return unsent_dict
+
+    async def restore(self, unsent_dict: dict[str, list[dict]]):
+        """重新推送上次退出时未推送的消息"""
+        for client_name, msgs in unsent_dict.items():
+            if not client_name in self.push_config_dict.get("clients", {}):
+                continue
+            channel = self.get_channel(client_name)
+            for msg in msgs:
+                await channel.put(Envelope(msg, self.serialize_stat))
+            logger.info(f"client_name:{client_name}已恢复上次退出时未推送的{len(msgs)}条消息")
+
+    def flush_outbox(self):
+        for client_name, channel in self.channels.items():
+            self.outbox.commit(client_name, channel.get_committed())
+        self.outbox.save_offsets()
+        self.outbox.compact(list(self.push_config_dict.get("clients", {}).keys()))
+
+    async def outbox_flusher(self, interval: int):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.flush_outbox()
+            except:
+                logger.error(f"消息发件箱offset保存出错!错误信息:\n{traceback.format_exc()}")
+
+    def resume(self, client_name: str, resume_seq: int = None):
+        """客户端恢复连接后继续推送未推送或未确认的消息"""
+        channel = self.channels.get(client_name)
+        if not channel is None:
+            channel.resume(resume_seq)
+
+    def ack(self, client_name: str, seq: int):
+        channel = self.channels.get(client_name)
+        if not channel is None:
+            channel.on_ack(seq)
+
+    def get_stats(self) -> dict:
+        return {
+            "clients": {client_name: channel.get_stats() for client_name, channel in self.channels.items()},
+            "destinations": {url: breaker.to_dict() for url, breaker in self.breakers.items()},
+            "serialize": self.serialize_stat.to_dict(),
+            "archive": None if self.archive is None else self.archive.get_stats()
+        }
+
+    def get_client_options(self, client_name: str) -> dict:
+        options = dict(self.default_options)
+        options.update(self.push_config_dict.get("client_options", {}).get(client_name, {}))
+        return options
+
+    def update_client(self, client_name: str):
+        channel = self.channels.get(client_name)
+        if channel is None:
+            # 初始化后还没有收到消息的客户端也显示在统计信息中
+            self.get_channel(client_name)
+        else:
+            channel.configure()
+
+    def get_channel(self, client_name: str) -> ClientChannel:
+        channel = self.channels.get(client_name)
+        if channel is None:
+            channel = ClientChannel(self, client_name)
+            self.channels[client_name] = channel
+        channel.start()
+        return channel
+
+    def get_session(self, url: str) -> aiohttp.ClientSession:
+        # 每个目标主机复用一个长连接会话
+        res = urlparse(url)
+        host = f"{res.scheme}://{res.netloc}"
+        session = self.sessions.get(host)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit_per_host=self.limit_per_host, keepalive_timeout=60)
+            session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self.sessions[host] = session
+        return session
+
+    def expand_profile(self, client_name: str, envelope: Envelope) -> list[Envelope]:
+        # 拆分后的消息按其各自的subtype匹配客户端的过滤条件
+        msg = envelope.msg
+        key = get_filter_key(msg["type"], None, msg["user"]["uid"])
+        return [child for child in envelope.expand() if client_name in self.filter_index.apply(child.msg, key, {client_name})]
+
+    def update_filters(self):
+        self.filter_index.invalidate()
+
+    def get_clients(self, msg: dict) -> set[str]:
+        msg_type = msg["type"]
+        subtype = msg["subtype"]
+        uid = msg["user"]["uid"]
+        type_dict = self.push_config_dict.get(msg_type, {})
+        if not subtype in type_dict:
+            client_names = type_dict.get(uid, set())
+            key = get_filter_key(msg_type, None, uid)
+        else:
+            client_names = type_dict[subtype].get(uid, set())
+            key = get_filter_key(msg_type, subtype, uid)
+        # 不满足客户端过滤条件的消息不会被序列化与推送
+        return self.filter_index.apply(msg, key, client_names)
+
+    async def put(self, msg: dict):
+        try:
+            logger.debug(f"消息推送引擎接收到消息:\n{msg}")
+            envelope = Envelope(msg, self.serialize_stat)
+            client_names = list(self.get_clients(msg))
+            if client_names and not self.outbox is None:
+                envelope.offset = self.outbox.append(envelope.text)
+            if not self.archive is None:
+                # 没有客户端订阅的消息也写入存档，有客户端订阅时推送也需要序列化，存档复用同一份结果
+                self.archive.append(msg, envelope.text if client_names else None)
+            for client_name in client_names:
+                await self.get_channel(client_name).put(envelope)
+        except:
+            errmsg = traceback.format_exc()
+            logger.error(f"消息推送引擎分发消息发生错误!错误信息:{errmsg}\n消息内容:{msg}")
+
+    def get_breaker(self, url: str) -> CircuitBreaker:
+        breaker = self.breakers.get(url)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                url,
+                get_value("push", "breaker_threshold", 5),
+                float(get_value("push", "breaker_open_time", 30)),
+                float(get_value("push", "breaker_max_open_time", 600))
+            )
+            self.breakers[url] = breaker
+        return breaker
+
+    def get_client_breaker(self, client_name: str) -> CircuitBreaker:
+        """通过Websocket推送的客户端没有熔断器"""
+        http_url = self.push_config_dict["clients"].get(client_name, "websocket")
+        if http_url in CONNECTION_URLS or client_name in self.ws_conn_dict:
+            return None
+        return self.get_breaker(http_url)
+
+    async def wait_destination(self, client_name: str):
+        breaker = self.get_client_breaker(client_name)
+        if not breaker is None and breaker.get_delay() > 0:
+            logger.info(f"client_name:{client_name}的推送目标已熔断,{round(breaker.get_delay(), 1)}秒后重试")
+            await asyncio.sleep(breaker.get_delay())
+
+    def is_parked(self, client_name: str) -> bool:
+        breaker = self.get_client_breaker(client_name)
+        return not breaker is None and breaker.get_delay() > 0
+
+    def get_retry_delay(self, client_name: str) -> float:
+        breaker = self.get_client_breaker(client_name)
+        if not breaker is None and breaker.get_delay() > 0:
+            return breaker.get_delay()
+        return self.retry_interval
+
+    def get_lane(self, msg: dict) -> str:
+        lane = self.priority_dict.get(f"{msg['type']}/{msg['subtype']}")
+        if lane is None:
+            lane = self.priority_dict.get(msg["type"], DEFAULT_LANE)
+        return lane
+
+    def get_codec(self, client_name: str) -> tuple[str, str]:
+        channel = self.channels.get(client_name)
+        if channel is None or self.push_config_dict["clients"].get(client_name) == "sse":
+            return ("json", "none")
+        return (channel.encoding, channel.compression)
+
+    def get_projection(self, client_name: str) -> Projection:
+        channel = self.channels.get(client_name)
+        if channel is None:
+            return None
+        return channel.projection
+
+    async def post(self, client_name: str, http_url: str, body: bytes) -> bool:
+        """失败后以指数退避重试最多retries次，推送目标熔断时不再重试"""
+        breaker = self.get_breaker(http_url)
+        for attempt in range(self.retries + 1):
+            if not breaker.allow():
+                return False
+            if attempt > 0:
+                breaker.retried += 1
+            if await self.post_once(client_name, http_url, body):
+                breaker.on_success()
+                return True
+            breaker.on_failure()
+            if attempt < self.retries and breaker.allow():
+                await asyncio.sleep(get_backoff(attempt, self.backoff_base, self.backoff_max))
+        return False
+
+    async def post_once(self, client_name: str, http_url: str, body: bytes) -> bool:
+        encoding, compression = self.get_codec(client_name)
+        headers = {"Content-Type": codec.CONTENT_TYPES[encoding]}
+        if compression != "none":
+            headers["Content-Encoding"] = compression
+        try:
+            async with self.get_session(http_url).post(http_url, data=body, headers=headers) as resp:
+                await resp.read()
+                if resp.status >= 500:
+                    logger.error(f"HTTP消息推送返回值异常!\nclient_name:{client_name} url:{http_url} status:{resp.status}")
+                    return False
+            return True
+        except asyncio.CancelledError:
+            raise
+        except:
+            errmsg = traceback.format_exc()
+            logger.error(f"HTTP消息推送发生错误!\nclient_name:{client_name} url:{http_url}\n{errmsg}")
+            return False
+
+    async def send_unix(self, client_name: str, url: str, payloads: list[bytes]) -> bool:
+        breaker = self.get_breaker(url)
+        if not breaker.allow():
+            return False
+        sent_paths: set[str] = set()
+        partial = self.unix_partial.pop(client_name, None)
+        if not partial is None and partial[0] == payloads:
+            sent_paths = partial[1]
+        try:
+            for path in parse_unix_url(url):
+                if path in sent_paths:
+                    continue
+                sink = self.unix_sinks.get(path)
+                if sink is None:
+                    sink = UnixSink(path)
+                    self.unix_sinks[path] = sink
+                await sink.send(payloads)
+                sent_paths.add(path)
+            breaker.on_success()
+            return True
+        except asyncio.CancelledError:
+            raise
+        except:
+            errmsg = traceback.format_exc()
+            logger.error(f"Unix domain socket消息推送发生错误!\nclient_name:{client_name} url:{url}\n{errmsg}")
+            if sent_paths:
+                self.unix_partial[client_name] = (payloads, sent_paths)
+            breaker.on_failure()
+            return False
+
+    async def deliver(self, client_name: str, envelope: Envelope, seq: int = None) -> bool:
+        http_url = self.push_config_dict["clients"][client_name]
+        ws_conn = self.ws_conn_dict.get(client_name, None)
+        if(ws_conn is None and http_url in CONNECTION_URLS):
+            logger.error(f"client_name:{client_name} 未连接Websocket服务或SSE,无法推送消息!\n消息内容:\n{envelope.get_text()}")
+            return False
+        envelope = envelope.project(self.get_projection(client_name))
+        encoding, compression = self.get_codec(client_name)
+        if(not ws_conn is None):
+            try:
+                if isinstance(ws_conn, SSEConnection):
+                    # SSE只能发送文本，不使用客户端的编码与压缩方式
+                    await ws_conn.send_event(envelope.text, seq)
+                elif encoding == "json" and compression == "none":
+                    await ws_conn.send(envelope.text if seq is None else envelope.frame(seq))
+                else:
+                    # 二进制编码或压缩后的消息以二进制帧发送
+                    payload = envelope.payload(encoding, compression, self.compress_level)
+                    await ws_conn.send(payload if seq is None else codec.pack_seq(seq, payload))
+                return True
+            except asyncio.CancelledError:
+                raise
+            except:
+                errmsg = traceback.format_exc()
+                logger.error(f"Websocket消息推送发生错误!\nclient_name:{client_name}\n{errmsg}")
+        if(is_unix_url(http_url)):
+            return await self.send_unix(client_name, http_url, [envelope.payload(encoding, compression, self.compress_level)])
+        if(not http_url in CONNECTION_URLS):
+            return await self.post(client_name, http_url, envelope.payload(encoding, compression, self.compress_level))
+        return False
+
+    async def deliver_batch(self, client_name: str, envelopes: list[Envelope]) -> bool:
+        # 批量模式仅对HTTP与Unix domain socket推送生效，HTTP推送以数组的形式一次性推送
+        http_url = self.push_config_dict["clients"][client_name]
+        if(http_url in CONNECTION_URLS or client_name in self.ws_conn_dict):
+            is_success = True
+            for envelope in envelopes:
+                is_success = await self.deliver(client_name, envelope) and is_success
+            return is_success
+        projection = self.get_projection(client_name)
+        encoding, compression = self.get_codec(client_name)
+        if(is_unix_url(http_url)):
+            # Unix domain socket的每条消息单独成帧，一次写入
+            return await self.send_unix(client_name, http_url, [envelope.project(projection).payload(encoding, compression, self.compress_level) for envelope in envelopes])
+        body = codec.encode_array([envelope.project(projection).payload(encoding, "none") for envelope in envelopes], encoding)
+        return await self.post(client_name, http_url, codec.compress(body, compression, self.compress_level))
+
+    async def broadcast(self, msg: dict, client_names: list[str] = None):
+        """不经过推送队列，立即向已连接Websocket的客户端发送消息，消息只序列化一次"""
+        if client_names is None:
+            client_names = list(self.ws_conn_dict.keys())
+        envelope = Envelope(msg, self.serialize_stat)
+        # 按字段裁剪规则、编码与压缩方式分组，每组只生成一份消息内容
+        groups: dict[tuple, list] = dict()
+        for client_name in client_names:
+            if client_name in self.ws_conn_dict:
+                projection = self.get_projection(client_name)
+                key = (None if projection is None else projection.key, ) + self.get_codec(client_name)
+                groups.setdefault(key, [projection, []])[1].append(self.ws_conn_dict[client_name])
+        for (_, encoding, compression), (projection, connections) in groups.items():
+            view = envelope.project(projection)
+            if encoding == "json" and compression == "none":
+                await broadcast(connections, view.text)
+            else:
+                await broadcast(connections, view.payload(encoding, compression, self.compress_level))
@@ -0,0 +1,152 @@
+from __future__ import annotations
+import collections
+import re
+
+from util.logger import init_logger
+
+logger = init_logger()
+
+class Automaton:
+    """Aho-Corasick多模式匹配自动机，一次扫描文本即可找出所有出现的关键词，耗时与关键词数量无关"""
+    def __init__(self, keywords: list[str]) -> None:
+        self.goto: list[dict[str, int]] = [dict()]
+        self.fail: list[int] = [0]
+        self.output: list[set[str]] = [set()]
+        for keyword in keywords:
+            self.add(keyword)
+        self.build()
+
+    def add(self, keyword: str):
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append(dict())
+                self.fail.append(0)
+                self.output.append(set())
+                self.goto[state][char] = next_state
+            state = next_state
+        self.output[state].add(keyword)
+
+    def build(self):
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and not char in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.goto[fail_state].get(char, 0)
+                self.output[next_state] |= self.output[self.fail[next_state]]
+
+    def search(self, text: str) -> set[str]:
+        matched: set[str] = set()
+        state = 0
+        for char in text:
+            while state and not char in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            if self.output[state]:
+                matched |= self.output[state]
+        return matched
+
+def get_list(spec: dict, key: str) -> list[str]:
+    value = spec.get(key)
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all([isinstance(item, str) for item in value]):
+        raise ValueError(key)
+    return value
+
+class SubscriptionFilter:
+    """
+    客户端添加推送时附带的过滤条件，各条件同时满足时才推送，
+    keywords与regex中任意一个匹配text即满足文本条件
+    """
+    def __init__(self, spec: dict) -> None:
+        if not isinstance(spec, dict):
+            raise ValueError("filter")
+        self.dyn_types = frozenset(get_list(spec, "dyn_type"))
+        self.subtypes = frozenset(get_list(spec, "subtype"))
+        self.followed_only: bool = None
+        if "followed_only" in spec:
+            self.followed_only = spec["followed_only"] in (True, "true", 1, "1")
+        self.keywords = frozenset([keyword.lower() for keyword in get_list(spec, "keywords") if keyword])
+        try:
+            self.patterns = [re.compile(pattern) for pattern in get_list(spec, "regex")]
+        except re.error:
+            raise ValueError("regex")
+
+    def match(self, msg: dict, matched_keywords: set[str]) -> bool:
+        if self.dyn_types and not msg.get("dyn_type") in self.dyn_types:
+            return False
+        if self.subtypes and not msg.get("subtype") in self.subtypes:
+            # profile消息中任意一个变化的字段满足即可
+            if msg.get("subtype") != "profile" or not self.subtypes & msg.get("diff", {}).keys():
+                return False
+        if not self.followed_only is None and msg.get("followed_only", False) != self.followed_only:
+            return False
+        if self.keywords or self.patterns:
+            if self.keywords & matched_keywords:
+                return True
+            text = msg.get("text") or ""
+            return any([pattern.search(text) for pattern in self.patterns])
+        return True
+
+def get_filter_key(typ: str, subtype: str, uid: str) -> str:
+    """推送对应的过滤条件的键，与push_config中的推送层级一致"""
+    if subtype:
+        return f"{typ}/{subtype}/{uid}"
+    return f"{typ}/{uid}"
+
+class FilterIndex:
+    """所有客户端的过滤条件，所有关键词编译为同一个自动机，过滤条件变化后在下次使用时重新编译"""
+    def __init__(self, push_config_dict: dict) -> None:
+        self.push_config_dict = push_config_dict
+        self.filters: dict[str, dict[str, SubscriptionFilter]] = dict()
+        self.automaton: Automaton = None
+        self.dirty = True
+
+    def invalidate(self):
+        self.dirty = True
+
+    def build(self):
+        self.filters = dict()
+        keywords: set[str] = set()
+        for key, client_dict in self.push_config_dict.get("filters", {}).items():
+            for client_name, spec in client_dict.items():
+                try:
+                    subscription_filter = SubscriptionFilter(spec)
+                except ValueError:
+                    logger.error(f"推送过滤条件无效,已忽略 key:{key} client_name:{client_name} filter:{spec}")
+                    continue
+                self.filters.setdefault(key, dict())[client_name] = subscription_filter
+                keywords |= subscription_filter.keywords
+        self.automaton = Automaton(list(keywords)) if keywords else None
+        self.dirty = False
+        logger.debug(f"推送过滤条件已编译 过滤条件数:{sum([len(client_dict) for client_dict in self.filters.values()])} 关键词数:{len(keywords)}")
+
+    def apply(self, msg: dict, key: str, client_names: set[str]) -> set[str]:
+        if self.dirty:
+            self.build()
+        client_dict = self.filters.get(key)
+        if not client_dict or not client_names:
+            return client_names
+        matched_keywords: set[str] = None
+        res = set()
+        for client_name in client_names:
+            subscription_filter = client_dict.get(client_name)
+            if subscription_filter is None:
+                res.add(client_name)
+                continue
+            if matched_keywords is None:
+                # 每条消息只扫描一次文本
+                if self.automaton is None:
+                    matched_keywords = set()
+                else:
+                    matched_keywords = self.automaton.search((msg.get("text") or "").lower())
+            if subscription_filter.match(msg, matched_keywords):
+                res.add(client_name)
+        return res
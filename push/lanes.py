@@ -0,0 +1,89 @@
+from __future__ import annotations
+import collections
+import time
+from typing import TYPE_CHECKING
+
+from push.stats import LatencyStat
+
+if TYPE_CHECKING:
+    from push.engine import Envelope
+
+LANES = ("high", "normal", "low")
+DEFAULT_LANE = "normal"
+
+class Lane:
+    def __init__(self, name: str, weight: int) -> None:
+        self.name = name
+        self.weight = max(weight, 1)
+        self.current = 0
+        self.queue: collections.deque[Envelope] = collections.deque()
+        self.wait_latency = LatencyStat()
+
+class LaneQueue:
+    """
+    按优先级分为多条通道的推送队列，出队时按权重平滑轮询，
+    高优先级的消息在积压时仍能及时推送，低优先级的消息也不会被饿死
+    """
+    def __init__(self, weights: dict[str, int]) -> None:
+        self.lanes = [Lane(name, weights.get(name, 1)) for name in LANES]
+        self.lane_dict = {lane.name: lane for lane in self.lanes}
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def append(self, envelope: Envelope, lane_name: str):
+        self.lane_dict.get(lane_name, self.lane_dict[DEFAULT_LANE]).queue.append(envelope)
+        self.size += 1
+
+    def appendleft(self, envelope: Envelope, lane_name: str):
+        """推送失败的消息放回通道头部，下次最先推送"""
+        self.lane_dict.get(lane_name, self.lane_dict[DEFAULT_LANE]).queue.appendleft(envelope)
+        self.size += 1
+
+    def popleft(self) -> Envelope:
+        best: Lane = None
+        total = 0
+        for lane in self.lanes:
+            if lane.queue:
+                lane.current += lane.weight
+                total += lane.weight
+                if best is None or lane.current > best.current:
+                    best = lane
+        if best is None:
+            raise IndexError("pop from an empty LaneQueue")
+        best.current -= total
+        envelope = best.queue.popleft()
+        self.size -= 1
+        best.wait_latency.add(time.time() - envelope.enqueue_time)
+        return envelope
+
+    def drop(self) -> Envelope:
+        """队列已满时丢弃优先级最低的通道中最早的消息"""
+        for lane in reversed(self.lanes):
+            if lane.queue:
+                self.size -= 1
+                return lane.queue.popleft()
+        raise IndexError("drop from an empty LaneQueue")
+
+    def get_all(self) -> list[Envelope]:
+        """队列中的所有消息，按进入队列的时间排序"""
+        return sorted([envelope for lane in self.lanes for envelope in lane.queue], key=lambda envelope: envelope.enqueue_time)
+
+    def clear(self):
+        for lane in self.lanes:
+            lane.queue.clear()
+            lane.current = 0
+        self.size = 0
+
+    def get_stats(self) -> dict:
+        return {
+            lane.name: {
+                "weight": lane.weight,
+                "queued": len(lane.queue),
+                "wait": lane.wait_latency.to_dict()
+            } for lane in self.lanes
+        }
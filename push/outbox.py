@@ -0,0 +1,200 @@
+from __future__ import annotations
+import json
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+from util.logger import init_logger
+
+logger = init_logger()
+
+SEGMENT_SUFFIX = ".log"
+OFFSETS_FILE = "offsets.json"
+# never：只写入操作系统缓存，进程崩溃不会丢失消息，断电或系统崩溃可能丢失最后几秒的消息 batch：每批写入后调用fsync
+FSYNC_POLICIES = ("never", "batch")
+
+class Outbox:
+    """
+    追加写入的分段消息日志，每条消息只写入一次并分配递增的offset，
+    每个客户端记录已确认推送的offset，重启或客户端恢复后从该位置继续推送，
+    offset在事件循环中分配，文件写入在单独的线程中批量进行
+    """
+    def __init__(self, path: str, segment_size: int, max_segments: int, fsync: str = "never") -> None:
+        self.path = path
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        if not fsync in FSYNC_POLICIES:
+            logger.error(f"消息发件箱的fsync配置{fsync}无效,使用never")
+            fsync = "never"
+        self.fsync = fsync
+        os.makedirs(self.path, exist_ok=True)
+        self.segments: list[int] = sorted([int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.path) if name.endswith(SEGMENT_SUFFIX)])
+        self.offsets: dict[str, int] = self.load_offsets()
+        self.next_offset = 0
+        if self.segments:
+            self.next_offset = self.segments[-1]
+            for offset, _ in self.read_segment(self.segments[-1]):
+                self.next_offset = offset + 1
+        else:
+            self.segments.append(0)
+        try:
+            self.segment_bytes = os.path.getsize(self.segment_path(self.segments[-1]))
+        except FileNotFoundError:
+            self.segment_bytes = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+        self.lock = threading.Lock()
+        # 等待写入的记录，元素为所在分段与记录内容
+        self.pending: list[tuple[int, bytes]] = []
+        self.scheduled = False
+        # 以下文件状态只在持有write_lock时访问
+        self.write_lock = threading.Lock()
+        self.file = None
+        self.file_base: int = None
+        logger.info(f"消息发件箱已加载 分段数:{len(self.segments)} 下一条消息offset:{self.next_offset}")
+
+    def segment_path(self, base_offset: int) -> str:
+        return os.path.join(self.path, f"{base_offset:020d}{SEGMENT_SUFFIX}")
+
+    def load_offsets(self) -> dict[str, int]:
+        try:
+            with open(os.path.join(self.path, OFFSETS_FILE), "r", encoding="UTF-8") as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return dict()
+        except:
+            logger.error(f"读取消息发件箱offset文件错误\n{traceback.format_exc()}")
+            return dict()
+
+    def save_offsets(self):
+        offsets_path = os.path.join(self.path, OFFSETS_FILE)
+        with open(offsets_path + ".tmp", "w", encoding="UTF-8") as f:
+            f.write(json.dumps(self.offsets))
+        os.replace(offsets_path + ".tmp", offsets_path)
+
+    def append(self, text: str) -> int:
+        """追加一条已序列化的消息，返回其offset，不等待写入完成"""
+        offset = self.next_offset
+        line = f'{{"offset":{offset},"msg":{text}}}\n'.encode("UTF-8")
+        self.next_offset += 1
+        self.segment_bytes += len(line)
+        with self.lock:
+            self.pending.append((self.segments[-1], line))
+            if not self.scheduled:
+                self.scheduled = True
+                self.executor.submit(self.write_pending)
+        if self.segment_bytes >= self.segment_size:
+            self.roll()
+        return offset
+
+    def write_pending(self):
+        """在写入线程中执行，积累的记录一次写入，读取发件箱前也会在事件循环中调用以读到最新的记录"""
+        with self.write_lock:
+            with self.lock:
+                rows = self.pending
+                self.pending = []
+                self.scheduled = False
+            if not rows:
+                return
+            try:
+                for base_offset, line in rows:
+                    if base_offset != self.file_base:
+                        self.close_file()
+                        self.file = open(self.segment_path(base_offset), "ab")
+                        self.file_base = base_offset
+                    self.file.write(line)
+                self.file.flush()
+                if self.fsync == "batch":
+                    os.fsync(self.file.fileno())
+            except:
+                logger.error(f"写入消息发件箱错误\n{traceback.format_exc()}")
+
+    def close_file(self):
+        if not self.file is None:
+            self.file.close()
+            self.file = None
+            self.file_base = None
+
+    def roll(self):
+        # 新分段的文件在写入第一条记录时创建
+        self.segments.append(self.next_offset)
+        self.segment_bytes = 0
+        while len(self.segments) > self.max_segments:
+            self.remove_segment(self.segments[0])
+
+    def read_segment(self, base_offset: int) -> Iterator[tuple[int, dict]]:
+        try:
+            f = open(self.segment_path(base_offset), "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程中断时可能残留不完整的最后一行
+                    logger.error(f"消息发件箱分段{base_offset}中存在无法解析的记录，已跳过")
+                    continue
+                yield (record["offset"], record["msg"])
+
+    def read(self, from_offset: int) -> Iterator[tuple[int, dict]]:
+        """从from_offset开始按顺序读取消息，读取期间新写入的消息也会被读取"""
+        offset = max(from_offset, self.segments[0])
+        while offset < self.next_offset:
+            self.write_pending()
+            base_offset = [base for base in self.segments if base <= offset][-1]
+            start_offset = offset
+            for record_offset, msg in self.read_segment(base_offset):
+                if record_offset < offset:
+                    continue
+                offset = record_offset + 1
+                yield (record_offset, msg)
+            if offset == start_offset:
+                next_segments = [base for base in self.segments if base > offset]
+                if not next_segments:
+                    break
+                offset = next_segments[0]
+
+    def get_committed(self, client_name: str) -> int:
+        """未记录的客户端从当前位置开始推送"""
+        if not client_name in self.offsets:
+            self.offsets[client_name] = self.next_offset - 1
+        return self.offsets[client_name]
+
+    def commit(self, client_name: str, offset: int):
+        self.offsets[client_name] = offset
+
+    def remove_segment(self, base_offset: int):
+        self.segments.remove(base_offset)
+        next_base = self.segments[0] if self.segments else self.next_offset
+        for client_name, offset in self.offsets.items():
+            if offset < next_base - 1:
+                logger.warning(f"消息发件箱分段数超出上限，client_name:{client_name}的{next_base - 1 - offset}条消息未推送即被删除")
+                self.offsets[client_name] = next_base - 1
+        # 在写入线程中删除，删除前该分段等待写入的记录已经写入
+        self.executor.submit(self.remove_file, base_offset)
+
+    def remove_file(self, base_offset: int):
+        with self.write_lock:
+            if self.file_base == base_offset:
+                self.close_file()
+            try:
+                os.remove(self.segment_path(base_offset))
+            except FileNotFoundError:
+                pass
+
+    def compact(self, client_names: list[str]):
+        """删除所有客户端均已确认推送的分段"""
+        if not client_names:
+            return
+        min_offset = min([self.get_committed(client_name) for client_name in client_names])
+        while len(self.segments) > 1 and self.segments[1] <= min_offset + 1:
+            self.remove_segment(self.segments[0])
+
+    def close(self):
+        self.executor.submit(self.write_pending)
+        self.executor.shutdown(wait=True)
+        with self.write_lock:
+            self.close_file()
+        self.save_offsets()
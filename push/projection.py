@@ -0,0 +1,49 @@
+from __future__ import annotations
+import json
+
+# 嵌套的消息对象，使用与外层消息相同的规则裁剪
+NESTED_KEYS = ("retweet", "root", "reply")
+# 客户端区分消息类型所需的字段，不会被裁剪
+REQUIRED_KEYS = ("type", "subtype")
+
+class Projection:
+    """
+    客户端在初始化时注册的消息字段裁剪规则，
+    键为消息类型type、type/subtype或*（所有类型），值为{"include": [...]}或{"exclude": [...]}，二者只能选择一个
+    """
+    def __init__(self, rules: dict) -> None:
+        self.rules: dict[str, tuple[bool, frozenset[str]]] = dict()
+        if not isinstance(rules, dict):
+            raise ValueError("projection")
+        for key, rule in rules.items():
+            if not isinstance(rule, dict) or len(rule) != 1:
+                raise ValueError("projection")
+            mode, fields = list(rule.items())[0]
+            if not mode in ("include", "exclude") or not isinstance(fields, list) or not all([isinstance(field, str) for field in fields]):
+                raise ValueError("projection")
+            self.rules[str(key)] = (mode == "include", frozenset(fields))
+        # 规则相同的客户端共享同一份裁剪与序列化结果
+        self.key = json.dumps(rules, sort_keys=True, ensure_ascii=False)
+
+    def get_rule(self, msg: dict, parent_rule: tuple[bool, frozenset[str]] = None) -> tuple[bool, frozenset[str]]:
+        msg_type = msg.get("type")
+        if msg_type is None:
+            return parent_rule
+        rule = self.rules.get(f"{msg_type}/{msg.get('subtype')}")
+        if rule is None:
+            rule = self.rules.get(msg_type, self.rules.get("*"))
+        return rule
+
+    def apply(self, msg: dict, parent_rule: tuple[bool, frozenset[str]] = None) -> dict:
+        """返回一个新的dict，不修改原消息"""
+        rule = self.get_rule(msg, parent_rule)
+        if rule is None:
+            return msg
+        is_include, fields = rule
+        res = dict()
+        for key, value in msg.items():
+            if key in REQUIRED_KEYS or (key in fields) == is_include:
+                if key in NESTED_KEYS and isinstance(value, dict):
+                    value = self.apply(value, rule)
+                res[key] = value
+        return res
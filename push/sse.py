@@ -0,0 +1,48 @@
+from __future__ import annotations
+import asyncio
+from aiohttp import web
+
+from push.websocket import WebsocketConnection
+
+class SSEConnection(WebsocketConnection):
+    """Server-Sent Events连接，只能由服务端向客户端推送，消息的id为推送序号，客户端重连时通过Last-Event-ID继续推送"""
+    def __init__(self, response: web.StreamResponse) -> None:
+        self.response = response
+        self.closed = asyncio.Event()
+
+    async def write(self, text: str):
+        try:
+            await self.response.write(text.encode("UTF-8"))
+        except:
+            self.closed.set()
+            raise
+
+    async def send(self, data: str):
+        await self.send_event(data)
+
+    async def send_event(self, data: str, event_id: int = None):
+        lines = [] if event_id is None else [f"id: {event_id}"]
+        lines.extend([f"data: {line}" for line in data.split("\n")])
+        await self.write("\n".join(lines) + "\n\n")
+
+    async def close(self):
+        self.closed.set()
+
+    @property
+    def open(self) -> bool:
+        return not self.closed.is_set()
+
+    async def __aiter__(self):
+        # 客户端无法通过SSE连接发送命令
+        await self.closed.wait()
+        return
+        yield
+
+    async def serve(self, keepalive: float, retry: int):
+        """保持连接直到客户端断开或服务关闭，定期发送注释行防止连接因空闲被代理断开"""
+        await self.write(f"retry: {retry}\n\n")
+        while self.open:
+            try:
+                await asyncio.wait_for(self.closed.wait(), keepalive)
+            except asyncio.TimeoutError:
+                await self.write(": keepalive\n\n")
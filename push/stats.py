@@ -0,0 +1,50 @@
+from __future__ import annotations
+import collections
+
+class LatencyStat:
+    """记录最近一段时间的耗时样本，用于统计平均值与分位数"""
+    def __init__(self, sample_size: int = 1000) -> None:
+        self.samples: collections.deque[float] = collections.deque(maxlen=sample_size)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p: float) -> float:
+        if not self.samples:
+            return 0.0
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50": round(self.percentile(0.5) * 1000, 3),
+            "p99": round(self.percentile(0.99) * 1000, 3),
+            "max": round(self.max * 1000, 3)
+        }
+
+class SerializeStat:
+    """统计消息序列化次数与复用次数，估算复用序列化结果节省的时间"""
+    def __init__(self) -> None:
+        self.encoded = 0
+        self.encode_time = 0.0
+        self.compress_time = 0.0
+        self.reused = 0
+
+    def to_dict(self) -> dict:
+        avg_time = (self.encode_time + self.compress_time) / self.encoded if self.encoded else 0.0
+        return {
+            "encoded": self.encoded,
+            "reused": self.reused,
+            "encode_time": round(self.encode_time * 1000, 3),
+            "compress_time": round(self.compress_time * 1000, 3),
+            "saved_time": round(avg_time * self.reused * 1000, 3)
+        }
@@ -0,0 +1,61 @@
+from __future__ import annotations
+import asyncio
+import struct
+
+from util.logger import init_logger
+
+logger = init_logger()
+
+UNIX_SCHEME = "unix://"
+
+def is_unix_url(url: str) -> bool:
+    return url.startswith(UNIX_SCHEME)
+
+def is_supported() -> bool:
+    """Windows下的asyncio不支持Unix domain socket"""
+    return hasattr(asyncio, "open_unix_connection")
+
+def parse_unix_url(url: str) -> list[str]:
+    """unix:///path/a.sock,unix:///path/b.sock 同一个客户端可以向多个socket推送"""
+    paths = []
+    for item in url.split(","):
+        item = item.strip()
+        if not is_unix_url(item) or len(item) == len(UNIX_SCHEME):
+            raise ValueError(url)
+        paths.append(item[len(UNIX_SCHEME):])
+    return paths
+
+class UnixSink:
+    """向本机Unix domain socket推送，每条消息为4字节大端序的长度加消息内容，断开后在下次推送时重新连接"""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.writer: asyncio.StreamWriter = None
+        self.lock = asyncio.Lock()
+
+    async def connect(self):
+        _, self.writer = await asyncio.open_unix_connection(self.path)
+        logger.info(f"已连接Unix domain socket:{self.path}")
+
+    async def write(self, payloads: list[bytes]):
+        if self.writer is None or self.writer.is_closing():
+            await self.connect()
+        self.writer.write(b"".join([struct.pack(">I", len(payload)) + payload for payload in payloads]))
+        await self.writer.drain()
+
+    async def send(self, payloads: list[bytes]):
+        async with self.lock:
+            try:
+                await self.write(payloads)
+            except (ConnectionError, BrokenPipeError):
+                # 连接可能已被对方关闭，重新连接后再发送一次
+                await self.close()
+                await self.write(payloads)
+
+    async def close(self):
+        if not self.writer is None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except:
+                pass
+            self.writer = None
@@ -0,0 +1,81 @@
+from __future__ import annotations
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Union
+import aiohttp
+import websockets
+from aiohttp import web
+
+class WebsocketConnection(ABC):
+    """对websockets与aiohttp两种Websocket连接的统一封装，send在发送缓冲区满时等待，即推送的背压"""
+    @abstractmethod
+    async def send(self, data: Union[str, bytes]):
+        ...
+
+    @abstractmethod
+    async def close(self):
+        ...
+
+    @property
+    @abstractmethod
+    def open(self) -> bool:
+        ...
+
+    @abstractmethod
+    def __aiter__(self):
+        ...
+
+class StandaloneConnection(WebsocketConnection):
+    """websockets.serve启动的独立Websocket服务中的连接"""
+    def __init__(self, websocket) -> None:
+        self.websocket = websocket
+
+    async def send(self, data: Union[str, bytes]):
+        await self.websocket.send(data)
+
+    async def close(self):
+        await self.websocket.close()
+
+    @property
+    def open(self) -> bool:
+        return self.websocket.open
+
+    async def __aiter__(self):
+        async for message in self.websocket:
+            yield message
+
+class AiohttpConnection(WebsocketConnection):
+    """由HTTP服务直接提供的Websocket连接"""
+    def __init__(self, websocket: web.WebSocketResponse) -> None:
+        self.websocket = websocket
+
+    async def send(self, data: Union[str, bytes]):
+        if isinstance(data, bytes):
+            await self.websocket.send_bytes(data)
+        else:
+            await self.websocket.send_str(data)
+
+    async def close(self):
+        await self.websocket.close()
+
+    @property
+    def open(self) -> bool:
+        return not self.websocket.closed
+
+    async def __aiter__(self):
+        async for message in self.websocket:
+            if message.type == aiohttp.WSMsgType.TEXT:
+                yield message.data
+            elif message.type == aiohttp.WSMsgType.BINARY:
+                yield message.data.decode("UTF-8")
+            elif message.type == aiohttp.WSMsgType.ERROR:
+                raise self.websocket.exception()
+
+async def broadcast(connections: list[WebsocketConnection], data: Union[str, bytes]):
+    """向多个连接发送同一份数据，发送缓冲区已满的连接将被跳过"""
+    standalone_list = [conn.websocket for conn in connections if isinstance(conn, StandaloneConnection)]
+    if standalone_list:
+        websockets.broadcast(standalone_list, data)
+    other_list = [conn for conn in connections if not isinstance(conn, StandaloneConnection) and conn.open]
+    if other_list:
+        await asyncio.gather(*[conn.send(data) for conn in other_list], return_exceptions=True)
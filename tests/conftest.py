@@ -0,0 +1,112 @@
+"""
+测试在临时目录中运行，不读取本地的config.ini，日志、数据库与发件箱也不写入仓库目录
+
+用法：python -m pytest tests
+"""
+from __future__ import annotations
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 必须在导入util.config与util.logger之前切换目录
+os.chdir(tempfile.mkdtemp(prefix="crawler_test_"))
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import util.config
+import util.store
+from util.journal import Journal
+from util.logger import init_logger
+
+@pytest.fixture(autouse=True)
+def config(tmp_path, monkeypatch) -> dict:
+    """每个测试使用空的配置与单独的工作目录，需要的配置项在测试中直接写入返回的dict"""
+    config_dict = dict()
+    monkeypatch.setattr(util.config, "config_dict", config_dict)
+    monkeypatch.chdir(tmp_path)
+    yield config_dict
+    util.store.close_store()
+
+@pytest.fixture
+def server(config, monkeypatch):
+    """main中的HTTP服务，所有爬虫均未开启，返回main模块，通过start_client启动"""
+    import main
+    config.update({
+        "server": {},
+        "weibo": {"enable": False},
+        "bili_dyn": {"enable": False},
+        "bili_live": {"enable": False}
+    })
+    monkeypatch.setattr(main, "logger", init_logger())
+    monkeypatch.setattr(main, "config_dict", config, raising=False)
+    monkeypatch.setattr(main, "push_config_dict", dict())
+    monkeypatch.setattr(main, "push_config_journal", Journal("push_config.json", 1000))
+    monkeypatch.setattr(main, "ws_conn_dict", dict())
+    monkeypatch.setattr(main, "delivery_engine", None)
+    return main
+
+async def start_client(main, start_engine: bool = True) -> TestClient:
+    """启动推送引擎与HTTP服务，测试结束时调用stop_client"""
+    from push.engine import DeliveryEngine
+    if start_engine:
+        main.delivery_engine = DeliveryEngine(main.push_config_dict, main.ws_conn_dict)
+        await main.delivery_engine.start()
+    app = web.Application()
+    app.add_routes(main.routes)
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    return client
+
+async def stop_client(main, client: TestClient):
+    await client.close()
+    if not main.delivery_engine is None:
+        await main.delivery_engine.stop()
+
+class Webhook:
+    """本地的模拟推送目标，记录收到的消息，fail为True时返回500"""
+    def __init__(self) -> None:
+        self.received: list[dict] = []
+        self.fail = False
+        self.delay = 0.0
+        self.runner: web.AppRunner = None
+        self.url: str = None
+
+    async def handler(self, req: web.Request):
+        if self.delay > 0:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            return web.Response(status=500)
+        self.received.append(await req.json())
+        return web.json_response({"code": 0})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/", self.handler)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def ids(self) -> list[str]:
+        return [msg["id"] for msg in self.received]
+
+def make_msg(i: int, uid: str = "1") -> dict:
+    return {"type": "weibo", "subtype": "weibo", "user": {"uid": uid}, "created_time": 2000000000, "id": str(i)}
+
+async def wait_until(predicate, timeout: float = 5) -> bool:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        if loop.time() >= deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
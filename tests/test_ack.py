@@ -0,0 +1,72 @@
+from __future__ import annotations
+import asyncio
+import json
+
+from conftest import make_msg, wait_until
+from push.engine import DeliveryEngine
+from push.sse import SSEConnection
+
+class FakeConnection:
+    """记录收到的消息序号的Websocket连接"""
+    def __init__(self) -> None:
+        self.open = True
+        self.seqs: list[int] = []
+
+    async def send(self, data):
+        self.seqs.append(json.loads(data)["seq"])
+
+def test_ack_resume_resends_before_new_messages():
+    async def main():
+        conn = FakeConnection()
+        push_config_dict = {"clients": {"w": "websocket"}, "client_options": {"w": {"ack": True, "window": 2}}, "weibo": {"1": {"w"}}}
+        engine = DeliveryEngine(push_config_dict, {"w": conn})
+        await engine.start()
+        for i in range(5):
+            await engine.put(make_msg(i))
+        assert await wait_until(lambda: conn.seqs == [1, 2])
+        engine.ack("w", 2)
+        assert await wait_until(lambda: conn.seqs == [1, 2, 3, 4])
+        # 已确认的序号2不会重发，重发的消息先于新消息发送
+        engine.resume("w", 1)
+        assert await wait_until(lambda: len(conn.seqs) == 6)
+        engine.ack("w", 4)
+        assert await wait_until(lambda: len(conn.seqs) == 7)
+        engine.ack("w", 5)
+        channel = engine.channels["w"]
+        assert conn.seqs == [1, 2, 3, 4, 3, 4, 5]
+        assert not channel.inflight and not channel.resend
+        assert channel.acked_seq == 5
+        await engine.stop()
+    asyncio.run(main())
+
+class FakeResponse:
+    def __init__(self) -> None:
+        self.events: list[str] = []
+
+    async def write(self, data: bytes):
+        self.events.append(data.decode("UTF-8"))
+
+def test_sse_reconnect_resends_after_last_event_id():
+    async def main():
+        ws_conn_dict = {}
+        engine = DeliveryEngine({"clients": {"s": "sse"}, "weibo": {"1": {"s"}}}, ws_conn_dict)
+        await engine.start()
+        response = FakeResponse()
+        ws_conn_dict["s"] = SSEConnection(response)
+        for i in range(5):
+            await engine.put(make_msg(i))
+        assert await wait_until(lambda: len(response.events) == 5)
+        # 客户端只收到了前两条消息，断线后带着Last-Event-ID重连
+        await ws_conn_dict["s"].close()
+        response = FakeResponse()
+        ws_conn_dict["s"] = SSEConnection(response)
+        engine.resume("s", 2)
+        assert await wait_until(lambda: len(response.events) == 3)
+        assert [event.split("\n")[0] for event in response.events] == ["id: 3", "id: 4", "id: 5"]
+        # 没有携带Last-Event-ID时从最后发送的消息之后继续
+        engine.resume("s")
+        await engine.put(make_msg(5))
+        assert await wait_until(lambda: len(response.events) == 4)
+        assert response.events[-1].startswith("id: 6\n")
+        await engine.stop()
+    asyncio.run(main())
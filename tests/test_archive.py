@@ -0,0 +1,105 @@
+from __future__ import annotations
+import asyncio
+import json
+
+from push.archive import Archive, get_day
+from conftest import make_msg, start_client, stop_client
+
+DAY = 86400
+
+def make_archive() -> Archive:
+    return Archive("archive", 0, 6)
+
+def query(archive: Archive, cursor: str = None, limit: int = 100, types: list[str] = [], uids: list[str] = [], start: int = 0, end: int = 2100000000) -> tuple[list[dict], str]:
+    texts, next_cursor = archive._query(types, [], uids, start, end, cursor, limit)
+    return ([json.loads(text) for text in texts], next_cursor)
+
+def test_round_trip_across_days():
+    archive = make_archive()
+    msgs = [make_msg(i) for i in range(4)]
+    msgs[2]["created_time"] += DAY
+    msgs[3]["created_time"] += DAY
+    msgs[3]["cookie"] = "secret"
+    msgs[3]["ua"] = "ua"
+    for msg in msgs:
+        archive.append(msg)
+    archive.close()
+    archive = make_archive()
+    assert archive.get_days() == [get_day(2000000000), get_day(2000000000 + DAY)]
+    res, next_cursor = query(archive)
+    # Cookie与UA不写入存档
+    del msgs[3]["cookie"]
+    del msgs[3]["ua"]
+    assert res == msgs
+    assert next_cursor is None
+    archive.close()
+
+def test_reuse_serialized_text():
+    archive = make_archive()
+    msg = make_msg(0)
+    archive.append(msg, json.dumps(msg, ensure_ascii=False, indent=1))
+    # 含Cookie的消息不能复用推送时的序列化结果
+    secret_msg = dict(make_msg(1), cookie="secret")
+    archive.append(secret_msg, json.dumps(secret_msg, ensure_ascii=False))
+    # 没有created_time的消息使用存档时间
+    archive.append({"type": "bili_live", "subtype": "status", "user": {"uid": "2"}})
+    archive.close()
+    archive = make_archive()
+    texts, _ = archive._query([], [], [], 0, 2100000000, None, 100)
+    assert texts[-2:] == [json.dumps(msg, ensure_ascii=False, indent=1), json.dumps(make_msg(1), ensure_ascii=False)]
+    assert json.loads(texts[0])["type"] == "bili_live"
+    archive.close()
+
+def test_query_pages_with_cursor():
+    archive = make_archive()
+    msgs = [make_msg(i, uid=str(i % 2)) for i in range(5)]
+    for i, msg in enumerate(msgs):
+        msg["created_time"] += i // 2 * DAY
+        archive.append(msg)
+    archive.flush()
+    # 跨天分页，每页从上一页最后一条之后开始
+    res, cursor = query(archive, limit=3)
+    assert [msg["id"] for msg in res] == ["0", "1", "2"]
+    assert cursor.split("_")[0] == str(msgs[2]["created_time"])
+    res, cursor = query(archive, cursor, limit=3)
+    assert [msg["id"] for msg in res] == ["3", "4"]
+    assert cursor is None
+    # 恰好取完时仍会返回cursor，下一页为空
+    res, cursor = query(archive, limit=5)
+    res, cursor = query(archive, cursor, limit=5)
+    assert res == [] and cursor is None
+    assert [msg["id"] for msg in query(archive, uids=["1"])[0]] == ["1", "3"]
+    assert [msg["id"] for msg in query(archive, start=msgs[2]["created_time"], end=msgs[3]["created_time"])[0]] == ["2", "3"]
+    assert query(archive, types=["bili_dyn"])[0] == []
+    archive.close()
+
+def test_history_endpoint(server):
+    async def main():
+        client = await start_client(server, False)
+        assert (await (await client.get("/history")).json())["code"] == 20
+        await client.close()
+        client = await start_client(server)
+        assert (await (await client.get("/history")).json())["code"] == 26
+        await stop_client(server, client)
+        server.config_dict["archive"] = {"enable": True, "path": "archive", "max_days": 0}
+        client = await start_client(server)
+        for params in ({"start": "a"}, {"end": "-1"}, {"limit": "0"}, {"limit": "1001"}, {"cursor": "1"}, {"cursor": "1_a"}):
+            assert (await (await client.get("/history", params=params)).json())["code"] == 25
+        for i in range(5):
+            msg = make_msg(i, uid=str(i % 2))
+            msg["created_time"] += i
+            await server.delivery_engine.put(msg)
+        params = {"uid": "0,1", "start": "2000000001", "end": "2000000004", "limit": "2"}
+        resp = await client.get("/history", params=params)
+        assert resp.headers["Content-Type"] == "application/x-ndjson"
+        assert [json.loads(line)["id"] for line in (await resp.text()).splitlines()] == ["1", "2"]
+        resp = await client.get("/history", params=dict(params, cursor=resp.headers["X-Next-Cursor"]))
+        assert [json.loads(line)["id"] for line in (await resp.text()).splitlines()] == ["3", "4"]
+        resp = await client.get("/history", params=dict(params, cursor=resp.headers["X-Next-Cursor"]))
+        assert await resp.text() == ""
+        assert not "X-Next-Cursor" in resp.headers
+        resp = await client.get("/history", params={"type": "weibo", "uid": "1", "end": "2100000000"})
+        assert [json.loads(line)["id"] for line in (await resp.text()).splitlines()] == ["1", "3"]
+        assert not "X-Next-Cursor" in resp.headers
+        await stop_client(server, client)
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+from __future__ import annotations
+import random
+
+from push import breaker as breaker_module
+from push.breaker import CircuitBreaker, get_backoff
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def make_breaker(monkeypatch) -> tuple[CircuitBreaker, Clock]:
+    clock = Clock()
+    monkeypatch.setattr(breaker_module.time, "monotonic", clock)
+    return (CircuitBreaker("http://a", 3, 10, 35), clock)
+
+def test_opens_after_threshold_and_closes_on_success(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch)
+    breaker.on_failure()
+    breaker.on_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.on_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    assert breaker.get_delay() == 10
+    clock.now += 10
+    # 断开时间结束后允许一次试探推送
+    assert breaker.allow() and breaker.state == "half_open"
+    assert breaker.get_delay() == 0
+    breaker.on_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+    assert breaker.to_dict()["opens"] == 1
+
+def test_half_open_failure_doubles_open_time_up_to_max(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch)
+    for _ in range(3):
+        breaker.on_failure()
+    open_times = []
+    for _ in range(4):
+        open_times.append(breaker.get_delay())
+        clock.now += breaker.get_delay()
+        assert breaker.allow()
+        # 试探推送失败一次即再次断开
+        breaker.on_failure()
+        assert breaker.state == "open"
+    assert open_times == [10, 20, 35, 35]
+    clock.now += breaker.get_delay()
+    breaker.allow()
+    breaker.on_success()
+    for _ in range(3):
+        breaker.on_failure()
+    # 恢复后重新从open_time开始
+    assert breaker.get_delay() == 10
+
+def test_backoff_grows_with_jitter(monkeypatch):
+    monkeypatch.setattr(random, "random", lambda: 1.0)
+    assert [get_backoff(attempt, 0.5, 3) for attempt in range(5)] == [0.5, 1, 2, 3, 3]
+    monkeypatch.setattr(random, "random", lambda: 0.0)
+    assert [get_backoff(attempt, 0.5, 3) for attempt in range(3)] == [0.25, 0.5, 1]
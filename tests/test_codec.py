@@ -0,0 +1,34 @@
+from __future__ import annotations
+import json
+
+import pytest
+
+from conftest import make_msg
+from push import codec
+
+MSG = {**make_msg(1), "text": "中文内容", "pics": ["a.jpg"], "retweet": {"id": "2", "text": None}}
+
+@pytest.mark.parametrize("encoding", codec.ENCODINGS)
+@pytest.mark.parametrize("compression", codec.COMPRESSIONS)
+def test_round_trip(encoding, compression):
+    if not codec.is_available(encoding):
+        pytest.skip(f"未安装{encoding}")
+    data = codec.compress(codec.encode(MSG, encoding), compression)
+    assert codec.decode(data, encoding, compression) == MSG
+
+@pytest.mark.parametrize("encoding", codec.ENCODINGS)
+def test_encode_array_reuses_encoded_messages(encoding):
+    if not codec.is_available(encoding):
+        pytest.skip(f"未安装{encoding}")
+    msgs = [make_msg(i) for i in range(3)]
+    data = codec.encode_array([codec.encode(msg, encoding) for msg in msgs], encoding)
+    assert codec.decode(data, encoding) == msgs
+
+def test_json_is_utf8_without_escapes():
+    assert codec.encode(MSG, "json") == json.dumps(MSG, ensure_ascii=False).encode("UTF-8")
+
+def test_seq_frame():
+    payload = codec.encode(MSG, "json")
+    frame = codec.pack_seq(2 ** 40, payload)
+    assert len(frame) == len(payload) + 8
+    assert codec.unpack_seq(frame) == (2 ** 40, payload)
@@ -0,0 +1,19 @@
+from __future__ import annotations
+import asyncio
+
+from conftest import Webhook, make_msg
+from push.engine import DeliveryEngine
+
+def test_http_delivery_in_order():
+    async def main():
+        webhook = Webhook()
+        await webhook.start()
+        engine = DeliveryEngine({"clients": {"c1": webhook.url}, "weibo": {"1": {"c1"}}}, {})
+        await engine.start()
+        for i in range(5):
+            await engine.put(make_msg(i))
+        assert await engine.drain(5)
+        await engine.stop()
+        await webhook.stop()
+        assert webhook.ids() == ["0", "1", "2", "3", "4"]
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+from __future__ import annotations
+import asyncio
+import os
+
+import pytest
+
+from conftest import start_client, stop_client
+from push.filter import Automaton, SubscriptionFilter, FilterIndex, get_filter_key
+
+def test_automaton_finds_overlapping_keywords():
+    automaton = Automaton(["he", "she", "his", "hers", "直播", "播放"])
+    assert automaton.search("ushers") == {"she", "he", "hers"}
+    assert automaton.search("开始直播放送") == {"直播", "播放"}
+    assert automaton.search("nothing") == set()
+
+def test_keywords_and_regex():
+    subscription_filter = SubscriptionFilter({"keywords": ["抽奖"], "regex": [r"^\[置顶\]"]})
+    automaton = Automaton(list(subscription_filter.keywords))
+    msg = {"type": "weibo", "subtype": "weibo", "text": "转发抽奖"}
+    assert subscription_filter.match(msg, automaton.search(msg["text"]))
+    msg = {"type": "weibo", "subtype": "weibo", "text": "[置顶]公告"}
+    assert subscription_filter.match(msg, automaton.search(msg["text"]))
+    msg = {"type": "weibo", "subtype": "weibo", "text": "日常"}
+    assert not subscription_filter.match(msg, automaton.search(msg["text"]))
+
+def test_dyn_type_subtype_and_followed_only():
+    subscription_filter = SubscriptionFilter({"dyn_type": ["DYNAMIC_TYPE_AV"], "followed_only": False})
+    assert subscription_filter.match({"type": "bili_dyn", "subtype": "dynamic", "dyn_type": "DYNAMIC_TYPE_AV"}, set())
+    assert not subscription_filter.match({"type": "bili_dyn", "subtype": "dynamic", "dyn_type": "DYNAMIC_TYPE_DRAW"}, set())
+    assert not subscription_filter.match({"type": "bili_dyn", "subtype": "dynamic", "dyn_type": "DYNAMIC_TYPE_AV", "followed_only": True}, set())
+    subscription_filter = SubscriptionFilter({"subtype": ["name"]})
+    assert subscription_filter.match({"type": "weibo", "subtype": "name"}, set())
+    # profile消息中任意一个变化的字段满足即可
+    assert subscription_filter.match({"type": "weibo", "subtype": "profile", "diff": {"name": {}, "desc": {}}}, set())
+    assert not subscription_filter.match({"type": "weibo", "subtype": "profile", "diff": {"desc": {}}}, set())
+
+@pytest.mark.parametrize("spec", [[], {"keywords": "a"}, {"regex": ["("]}, {"dyn_type": [1]}])
+def test_invalid_spec(spec):
+    with pytest.raises(ValueError):
+        SubscriptionFilter(spec)
+
+def test_index_filters_clients_case_insensitively():
+    key = get_filter_key("weibo", None, "1")
+    push_config_dict = {"filters": {key: {"c1": {"keywords": ["Live"]}, "c2": {"keywords": ["抽奖"]}}}}
+    index = FilterIndex(push_config_dict)
+    msg = {"type": "weibo", "subtype": "weibo", "text": "going LIVE now"}
+    assert index.apply(msg, key, {"c1", "c2", "c3"}) == {"c1", "c3"}
+    push_config_dict["filters"][key]["c2"] = {"keywords": ["now"]}
+    index.invalidate()
+    assert index.apply(msg, key, {"c1", "c2"}) == {"c1", "c2"}
+    assert index.apply(msg, get_filter_key("weibo", None, "2"), {"c1"}) == {"c1"}
+
+def read_journal() -> list[str]:
+    if not os.path.exists("push_config.json.journal"):
+        return []
+    with open("push_config.json.journal", "r", encoding="UTF-8") as f:
+        return f.read().splitlines()
+
+def test_add_keeps_filter_and_journals_only_on_success(server, monkeypatch):
+    server.config_dict["weibo"] = {"enable": True}
+    async def add_wb_user(uid, config):
+        if uid == "2":
+            return {"code": 8, "msg": "Add user failed"}
+        return {"code": 0, "msg": "Success"}
+    monkeypatch.setattr(server, "add_wb_user", add_wb_user)
+    async def main():
+        client = await start_client(server)
+        await client.post("/init", json={"client_name": "c1", "url": "http://127.0.0.1:1/"})
+        await client.post("/init", json={"client_name": "c2", "url": "http://127.0.0.1:1/"})
+        key = get_filter_key("weibo", None, "1")
+        resp = await client.post("/add", json={"type": "weibo", "uid": "1", "client_name": "c1", "filter": {"keywords": ["a"]}})
+        assert (await resp.json())["code"] == 0
+        assert server.push_config_dict["filters"][key] == {"c1": {"keywords": ["a"]}}
+        # 再次添加时不携带filter保留原有的过滤条件
+        resp = await client.post("/add", json={"type": "weibo", "uid": "1", "client_name": "c1"})
+        assert (await resp.json())["code"] == 0
+        await client.post("/add", json={"type": "weibo", "uid": "1", "client_name": "c2"})
+        assert server.push_config_dict["filters"][key] == {"c1": {"keywords": ["a"]}}
+        assert server.push_config_dict["weibo"]["1"] == {"c1", "c2"}
+        # 添加失败时不写入日志
+        journal_lines = read_journal()
+        resp = await client.post("/add", json={"type": "weibo", "uid": "2", "client_name": "c1"})
+        assert (await resp.json())["code"] == 8
+        resp = await client.post("/add", json={"type": "weibo", "uid": "3", "client_name": "c1", "filter": {"regex": ["("]}})
+        assert (await resp.json())["code"] == 23
+        assert read_journal() == journal_lines
+        resp = await client.post("/add", json={"type": "weibo", "uid": "1", "client_name": "c1", "filter": None})
+        assert (await resp.json())["code"] == 0
+        assert not key in server.push_config_dict["filters"]
+        await stop_client(server, client)
+    asyncio.run(main())
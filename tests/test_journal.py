@@ -0,0 +1,44 @@
+from __future__ import annotations
+import json
+import os
+
+from util.journal import Journal
+
+def read_lines(path: str) -> list[str]:
+    with open(path, "r", encoding="UTF-8") as f:
+        return f.read().splitlines()
+
+def test_replay_journal_over_snapshot():
+    with open("push_config.json", "w", encoding="UTF-8") as f:
+        f.write(json.dumps({"clients": {"c1": "http://a"}, "weibo": {"1": ["c1"]}}))
+    journal = Journal("push_config.json", 100)
+    data = journal.load()
+    data["weibo"]["2"] = {"c1"}
+    del data["weibo"]["1"]
+    data["clients"]["c2"] = "websocket"
+    journal.append(data, [["weibo", "2"], ["weibo", "1"], ["clients", "c2"]])
+    assert len(read_lines("push_config.json.journal")) == 3
+    # 未压缩时重启，快照加日志得到相同的结果
+    assert Journal("push_config.json", 100).load() == {
+        "clients": {"c1": "http://a", "c2": "websocket"},
+        "weibo": {"2": ["c1"]}
+    }
+
+def test_compact_rewrites_snapshot_and_truncates_journal():
+    journal = Journal("push_config.json", 2)
+    data = journal.load()
+    data["weibo"] = {"1": {"c1"}}
+    journal.append(data, [["weibo", "1"]])
+    assert not os.path.exists("push_config.json")
+    data["weibo"]["2"] = {"c2"}
+    journal.append(data, [["weibo", "2"]])
+    assert read_lines("push_config.json.journal") == []
+    with open("push_config.json", "r", encoding="UTF-8") as f:
+        assert json.loads(f.read()) == {"weibo": {"1": ["c1"], "2": ["c2"]}}
+    journal.close(data)
+
+def test_incomplete_last_line_is_skipped():
+    with open("push_config.json.journal", "w", encoding="UTF-8") as f:
+        f.write(json.dumps({"path": ["clients", "c1"], "value": "http://a"}) + "\n")
+        f.write('{"path": ["clients", "c2"], "val')
+    assert Journal("push_config.json", 100).load() == {"clients": {"c1": "http://a"}}
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from conftest import make_msg
+from push.engine import Envelope
+from push.lanes import LaneQueue
+from push.stats import SerializeStat
+
+def make_queue(counts: dict[str, int]) -> LaneQueue:
+    queue = LaneQueue({"high": 8, "normal": 3, "low": 1})
+    stat = SerializeStat()
+    for lane_name, count in counts.items():
+        for i in range(count):
+            queue.append(Envelope(make_msg(f"{lane_name}{i}"), stat), lane_name)
+    return queue
+
+def pop_lanes(queue: LaneQueue, count: int) -> list[str]:
+    return [queue.popleft().msg["id"].rstrip("0123456789") for _ in range(count)]
+
+def test_weighted_round_robin():
+    queue = make_queue({"high": 100, "normal": 100, "low": 100})
+    lanes = pop_lanes(queue, 24)
+    # 每轮12条中按8:3:1出队，且高优先级的消息分散在整轮中
+    assert lanes.count("high") == 16 and lanes.count("normal") == 6 and lanes.count("low") == 2
+    assert lanes[:12].count("low") == 1
+    assert len(queue) == 276
+
+def test_low_lane_is_not_starved():
+    queue = make_queue({"high": 1000, "low": 5})
+    lanes = pop_lanes(queue, 18)
+    assert lanes.count("low") == 2
+    assert "low" in lanes[:9]
+
+def test_empty_lanes_do_not_take_turns():
+    # 高优先级通道为空时其余通道按3:1出队
+    queue = make_queue({"normal": 6, "low": 6})
+    assert pop_lanes(queue, 8) == ["normal", "normal", "low", "normal", "normal", "normal", "low", "normal"]
+    assert pop_lanes(queue, 4) == ["low"] * 4
+    assert not queue
+
+def test_order_within_lane_and_requeue_to_head():
+    queue = make_queue({"normal": 3})
+    first = queue.popleft()
+    assert first.msg["id"] == "normal0"
+    queue.appendleft(first, "normal")
+    assert [queue.popleft().msg["id"] for _ in range(3)] == ["normal0", "normal1", "normal2"]
+
+def test_drop_takes_oldest_of_lowest_lane():
+    queue = make_queue({"high": 2, "low": 2})
+    assert queue.drop().msg["id"] == "low0"
+    assert len(queue) == 3
+    assert [envelope.msg["id"] for envelope in queue.get_all()] == ["high0", "high1", "low1"]
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import asyncio
+
+import pytest
+
+from crawler.bili_live import bili_live
+from util.record import LiveRecord
+from conftest import start_client, stop_client
+
+@pytest.fixture
+def live_server(server, monkeypatch):
+    server.config_dict["bili_live"] = {"enable": True}
+    monkeypatch.setattr(bili_live, "live_record_dict", {"user": {
+        "1": LiveRecord(user={"name": "a", "status": "1"}),
+        "2": LiveRecord(user={"name": "b", "status": "0"}),
+        "3": LiveRecord()
+    }})
+    monkeypatch.setattr(bili_live, "status_version", 0)
+    return server
+
+def test_query_params(server, live_server):
+    async def main():
+        client = await start_client(server, False)
+        resp = await client.get("/live/status")
+        assert resp.headers["Cache-Control"] == "no-cache"
+        # 尚未抓取到直播状态的用户不返回
+        assert (await resp.json())["data"] == {"1": {"name": "a", "status": "1"}, "2": {"name": "b", "status": "0"}}
+        assert (await (await client.get("/live/status", params={"uid": "2,3,4"})).json())["data"] == {"2": {"name": "b", "status": "0"}}
+        for live in ("true", "1"):
+            assert list((await (await client.get("/live/status", params={"live": live})).json())["data"].keys()) == ["1"]
+        assert (await (await client.get("/live/status", params={"live": "yes"})).json())["code"] == 27
+        server.config_dict["bili_live"]["enable"] = False
+        assert (await (await client.get("/live/status")).json())["code"] == 28
+        await stop_client(server, client)
+    asyncio.run(main())
+
+def test_etag_and_not_modified(server, live_server):
+    async def main():
+        client = await start_client(server, False)
+        resp = await client.get("/live/status")
+        etag = resp.headers["ETag"]
+        assert etag == f'"{bili_live.status_epoch}-0"'
+        # 直播状态没有变化时返回304，ETag不变，不同的查询参数共用同一个ETag
+        for params in ({}, {"uid": "1"}, {"live": "true"}):
+            resp = await client.get("/live/status", params=params, headers={"If-None-Match": etag})
+            assert resp.status == 304
+            assert resp.headers["ETag"] == etag
+            assert await resp.read() == b""
+        resp = await client.get("/live/status", headers={"If-None-Match": f'"other", {etag}'})
+        assert resp.status == 304
+        # 字段没有变化的更新不改变ETag
+        record = bili_live.live_record_dict["user"]["1"]
+        msg_list = []
+        bili_live.update_user(record, "bili_live", {"uid": "1", "name": "a", "status": "1"}, msg_list)
+        assert msg_list == []
+        assert (await client.get("/live/status", headers={"If-None-Match": etag})).status == 304
+        # 直播状态变化后旧的ETag失效
+        bili_live.update_user(record, "bili_live", {"uid": "1", "name": "a", "status": "0"}, msg_list)
+        resp = await client.get("/live/status", headers={"If-None-Match": etag})
+        assert resp.status == 200
+        assert (await resp.json())["data"]["1"]["status"] == "0"
+        new_etag = resp.headers["ETag"]
+        assert new_etag != etag
+        assert (await client.get("/live/status", headers={"If-None-Match": new_etag})).status == 304
+        # 删除用户同样改变ETag
+        await bili_live.remove_live_user("2", {})
+        resp = await client.get("/live/status", headers={"If-None-Match": new_etag})
+        assert resp.status == 200
+        assert list((await resp.json())["data"].keys()) == ["1"]
+        await stop_client(server, client)
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+
+from conftest import Webhook, make_msg, wait_until
+from push.engine import DeliveryEngine
+from push.outbox import Outbox
+
+def test_outbox_catches_up_after_restart(config):
+    config["push"] = {"retries": 0, "breaker_threshold": 100}
+    config["outbox"] = {"enable": True, "path": "outbox", "retry_interval": 60}
+    async def main():
+        webhook = Webhook()
+        await webhook.start()
+        webhook.fail = True
+        push_config_dict = {"clients": {"c1": webhook.url}, "weibo": {"1": {"c1"}}}
+        engine = DeliveryEngine(push_config_dict, {})
+        await engine.start()
+        for i in range(3):
+            await engine.put(make_msg(i))
+        assert await wait_until(lambda: engine.channels["c1"].offline)
+        await engine.stop()
+        # 重启后从发件箱中未确认的位置重新推送
+        webhook.fail = False
+        engine = DeliveryEngine(push_config_dict, {})
+        await engine.start()
+        assert await wait_until(lambda: len(webhook.received) == 3)
+        await engine.stop()
+        await webhook.stop()
+        assert webhook.ids() == ["0", "1", "2"]
+    asyncio.run(main())
+
+def test_append_assigns_offsets_and_reads_unwritten_records():
+    outbox = Outbox("outbox", 1024 * 1024, 4)
+    offsets = [outbox.append(json.dumps(make_msg(i))) for i in range(3)]
+    assert offsets == [0, 1, 2]
+    # 读取时等待写入的记录也会被读到
+    assert [msg["id"] for _, msg in outbox.read(1)] == ["1", "2"]
+    outbox.close()
+    outbox = Outbox("outbox", 1024 * 1024, 4)
+    assert outbox.next_offset == 3
+    assert [offset for offset, _ in outbox.read(0)] == [0, 1, 2]
+    outbox.close()
+
+def test_segments_roll_and_oldest_is_removed():
+    outbox = Outbox("outbox", 200, 2)
+    for i in range(10):
+        outbox.append(json.dumps(make_msg(i)))
+    assert len(outbox.segments) == 2
+    outbox.close()
+    # 最早的分段已删除，新的空分段在写入第一条记录时才创建
+    assert len([name for name in os.listdir("outbox") if name.endswith(".log")]) == 1
+    outbox = Outbox("outbox", 200, 2)
+    assert 0 < outbox.segments[0] < 10
+    assert [msg["id"] for _, msg in outbox.read(0)] == [str(i) for i in range(outbox.segments[0], 10)]
+    assert outbox.next_offset == 10
+    outbox.close()
+
+def test_fsync_after_each_batch(monkeypatch):
+    fsync_list = []
+    monkeypatch.setattr(os, "fsync", lambda fd: fsync_list.append(fd))
+    outbox = Outbox("outbox", 1024 * 1024, 4, "batch")
+    for i in range(100):
+        outbox.append(json.dumps(make_msg(i)))
+    outbox.close()
+    assert 0 < len(fsync_list) < 100
+    fsync_list.clear()
+    outbox = Outbox("outbox", 1024 * 1024, 4)
+    outbox.append(json.dumps(make_msg(100)))
+    outbox.close()
+    assert fsync_list == []
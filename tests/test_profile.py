@@ -0,0 +1,73 @@
+from __future__ import annotations
+import asyncio
+
+import pytest
+
+from conftest import Webhook
+from crawler.bili_dynamic import bili_dynamic
+from crawler.bili_live import bili_live
+from crawler.embed import Hub, Subscription
+from crawler.weibo import weibo
+from push.engine import DeliveryEngine
+
+@pytest.mark.parametrize("module", [weibo, bili_dynamic, bili_live])
+def test_changed_fields_are_aggregated(module):
+    record = {}
+    msg_list = []
+    module.update_user(record, "t", {"uid": "1", "name": "a", "desc": "x"}, msg_list)
+    assert msg_list == []
+    module.update_user(record, "t", {"uid": "1", "name": "a", "desc": "x"}, msg_list)
+    assert msg_list == []
+    module.update_user(record, "t", {"uid": "1", "name": "b", "desc": "y"}, msg_list)
+    assert msg_list == [{
+        "type": "t",
+        "subtype": "profile",
+        "user": {"uid": "1", "name": "b", "desc": "y"},
+        "diff": {"name": {"pre": "a", "now": "b"}, "desc": {"pre": "x", "now": "y"}}
+    }]
+    assert record["user"] == {"name": "b", "desc": "y"}
+
+PROFILE_MSG = {
+    "type": "bili_live",
+    "subtype": "profile",
+    "user": {"uid": "1", "name": "a"},
+    "diff": {"status": {"pre": "0", "now": "1"}, "title": {"pre": "x", "now": "y"}}
+}
+
+def test_legacy_clients_receive_one_message_per_field():
+    async def main():
+        legacy = Webhook()
+        aggregate = Webhook()
+        await legacy.start()
+        await aggregate.start()
+        push_config_dict = {
+            "clients": {"legacy": legacy.url, "aggregate": aggregate.url},
+            "client_options": {"legacy": {"profile": "legacy"}, "aggregate": {"profile": "aggregate"}},
+            "bili_live": {"1": {"legacy", "aggregate"}}
+        }
+        engine = DeliveryEngine(push_config_dict, {})
+        await engine.start()
+        await engine.put(PROFILE_MSG)
+        assert await engine.drain(5)
+        await engine.stop()
+        await legacy.stop()
+        await aggregate.stop()
+        assert aggregate.received == [PROFILE_MSG]
+        assert legacy.received == [
+            {"type": "bili_live", "subtype": "status", "user": {"uid": "1", "name": "a"}, "pre": "0", "now": "1"},
+            {"type": "bili_live", "subtype": "title", "user": {"uid": "1", "name": "a"}, "pre": "x", "now": "y"}
+        ]
+    asyncio.run(main())
+
+def test_library_subscriptions_choose_profile_mode():
+    async def main():
+        hub = Hub({})
+        legacy = Subscription(None, None, None, 10)
+        status_only = Subscription(["bili_live"], ["status"], ["1"], 10)
+        aggregate = Subscription(None, None, None, 10, "aggregate")
+        hub.subscriptions |= {legacy, status_only, aggregate}
+        await hub.put(PROFILE_MSG)
+        assert [legacy.queue.get_nowait()["subtype"] for _ in range(legacy.queue.qsize())] == ["status", "title"]
+        assert status_only.queue.qsize() == 1 and status_only.queue.get_nowait()["now"] == "1"
+        assert aggregate.queue.get_nowait() is PROFILE_MSG
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import pytest
+
+from push.projection import Projection
+
+MSG = {
+    "type": "weibo",
+    "subtype": "weibo",
+    "id": "1",
+    "text": "正文",
+    "pics": ["a.jpg"],
+    "user": {"uid": "1", "name": "a"},
+    "retweet": {"type": "weibo", "subtype": "weibo", "id": "2", "text": "转发", "pics": ["b.jpg"]}
+}
+
+def test_include_keeps_required_keys_and_applies_to_nested():
+    projection = Projection({"weibo": {"include": ["id", "text", "retweet"]}})
+    assert projection.apply(MSG) == {
+        "type": "weibo",
+        "subtype": "weibo",
+        "id": "1",
+        "text": "正文",
+        "retweet": {"type": "weibo", "subtype": "weibo", "id": "2", "text": "转发"}
+    }
+
+def test_exclude_and_rule_priority():
+    projection = Projection({
+        "*": {"exclude": ["user"]},
+        "weibo": {"exclude": ["pics"]},
+        "weibo/comment": {"include": ["text"]}
+    })
+    res = projection.apply(MSG)
+    assert not "pics" in res and not "pics" in res["retweet"]
+    assert res["user"] == MSG["user"]
+    assert projection.apply({"type": "weibo", "subtype": "comment", "text": "评论", "id": "3"}) == {"type": "weibo", "subtype": "comment", "text": "评论"}
+    assert projection.apply({"type": "bili_live", "subtype": "status", "user": {}, "now": "1"}) == {"type": "bili_live", "subtype": "status", "now": "1"}
+
+def test_nested_without_type_uses_parent_rule():
+    projection = Projection({"bili_dyn": {"exclude": ["pics"]}})
+    msg = {"type": "bili_dyn", "subtype": "dynamic", "pics": [], "root": {"id": "2", "pics": []}}
+    assert projection.apply(msg) == {"type": "bili_dyn", "subtype": "dynamic", "root": {"id": "2"}}
+    # 不修改原消息，没有匹配规则的消息原样返回
+    assert msg["root"]["pics"] == []
+    assert projection.apply(MSG) is MSG
+
+def test_same_rules_share_key():
+    assert Projection({"a": {"include": ["x"]}, "b": {"exclude": []}}).key == Projection({"b": {"exclude": []}, "a": {"include": ["x"]}}).key
+
+@pytest.mark.parametrize("rules", [
+    [],
+    {"weibo": {"include": ["id"], "exclude": ["text"]}},
+    {"weibo": {"only": ["id"]}},
+    {"weibo": {"include": "id"}},
+    {"weibo": {"include": [1]}}
+])
+def test_invalid_rules(rules):
+    with pytest.raises(ValueError):
+        Projection(rules)
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+import pytest
+
+from util.record import WeiboRecord
+
+def test_record_behaves_like_dict():
+    record = WeiboRecord(last_wb_time=1, unknown=2)
+    assert record == {"last_wb_time": 1, "unknown": 2}
+    assert len(record) == 2
+    assert "last_wb_time" in record and "user" not in record
+    assert record.get("user") is None
+    with pytest.raises(KeyError):
+        record["user"]
+    del record["last_wb_time"]
+    assert dict(record.items()) == {"unknown": 2}
+    with pytest.raises(KeyError):
+        del record["last_wb_time"]
+
+def test_unset_field_differs_from_none():
+    assert WeiboRecord(user=None) != WeiboRecord()
+    assert WeiboRecord(user=None) == {"user": None}
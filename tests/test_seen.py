@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from util.seen import SeenSet
+from util.store import get_store, close_store
+
+def test_is_new_against_watermark():
+    seen = SeenSet("weibo/weibo", 10)
+    watermark = seen.warm_since
+    assert not seen.is_new("a", watermark - 1, watermark)
+    assert seen.is_new("a", watermark + 1, watermark)
+    # 与水位线同一秒的消息以ID是否已推送判断
+    assert seen.is_new("b", watermark, watermark)
+    seen.add("b")
+    assert not seen.is_new("b", watermark, watermark)
+
+def test_watermark_before_warm_since_is_not_trusted():
+    seen = SeenSet("weibo/weibo", 10)
+    watermark = seen.warm_since - 100
+    # 开始记录ID之前同一秒的消息可能已经推送过
+    assert not seen.is_new("a", watermark, watermark)
+    assert seen.is_new("a", watermark + 1, watermark)
+
+def test_ids_persist_with_lru_eviction():
+    seen = SeenSet("bili_dyn/dynamic", 2)
+    for item_id in ("a", "b", "c"):
+        seen.add(item_id)
+    warm_since = seen.warm_since
+    close_store()
+    seen = SeenSet("bili_dyn/dynamic", 2)
+    assert list(seen.ids.keys()) == ["b", "c"]
+    assert seen.warm_since == warm_since
+    assert get_store().query("SELECT COUNT(*) FROM seen") == [(2,)]
+
+def test_discard_undoes_add():
+    seen = SeenSet("weibo/weibo", 10)
+    watermark = seen.warm_since
+    seen.add("a")
+    seen.add("b")
+    # 解析失败时取消标记，下次获取时重新作为新消息处理
+    seen.discard("a")
+    seen.discard("c")
+    assert seen.is_new("a", watermark, watermark)
+    close_store()
+    seen = SeenSet("weibo/weibo", 10)
+    assert list(seen.ids.keys()) == ["b"]
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from conftest import make_msg
+from push import codec
+from push.engine import Envelope
+from push.stats import SerializeStat
+
+def test_message_is_serialized_once_for_all_clients():
+    stat = SerializeStat()
+    envelope = Envelope(make_msg(1), stat)
+    text = envelope.text
+    body = envelope.body
+    frame = envelope.frame(3)
+    payload = envelope.payload("json", "none")
+    assert body == text.encode("UTF-8") and payload is body
+    assert frame == '{"seq":3,"msg":' + text + '}'
+    # body与frame内部复用text不重复计数，每次外部调用只计一次
+    assert stat.encoded == 1
+    assert stat.reused == 3
+
+def test_compressed_payload_counts_each_encoding_once():
+    stat = SerializeStat()
+    envelope = Envelope(make_msg(1), stat)
+    payload = envelope.payload("json", "gzip")
+    assert codec.decompress(payload, "gzip") == envelope.get_body()
+    assert stat.encoded == 2 and stat.reused == 0
+    assert envelope.payload("json", "gzip") is payload
+    assert envelope.payload("json", "none") is envelope.get_body()
+    assert stat.encoded == 2 and stat.reused == 2
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 启动时加入一个在bare except中空转的协程，模拟爬虫协程，信号在协程内部抛出的异常会被其吞掉
+SCRIPT = f"""
+import asyncio
+import sys
+import time
+sys.path.insert(0, {REPO_PATH!r})
+from aiohttp import web
+import main
+
+async def spin():
+    while True:
+        try:
+            start_time = time.time()
+            while time.time() - start_time < 0.05:
+                pass
+        except:
+            pass
+        await asyncio.sleep(0)
+
+async def start_spin(app):
+    app["listeners"]["spin"] = asyncio.create_task(spin())
+
+run_app = web.run_app
+def run_app_with_spin(app, **kwargs):
+    app.on_startup.append(start_spin)
+    run_app(app, **kwargs)
+web.run_app = run_app_with_spin
+main.main()
+"""
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Windows不支持SIGTERM")
+@pytest.mark.parametrize("signum", [signal.SIGTERM, signal.SIGINT])
+def test_signal_runs_shutdown_tasks(tmp_path, signum):
+    port = get_free_port()
+    with open(tmp_path / "config.ini", "w", encoding="UTF-8") as f:
+        f.write(f"[server]\nhost = 127.0.0.1\nport = {port}\nshutdown_timeout = 2\n[websocket]\nenable = false\n[cookie_update]\nenable = false\n[weibo]\nenable = false\n[bili_dyn]\nenable = false\n[bili_live]\nenable = false\n")
+    proc = subprocess.Popen([sys.executable, "-c", SCRIPT], cwd=tmp_path)
+    try:
+        deadline = time.time() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), 0.1).close()
+                break
+            except OSError:
+                assert time.time() < deadline
+                time.sleep(0.05)
+        proc.send_signal(signum)
+        assert proc.wait(10) == 0
+    finally:
+        proc.kill()
+    with open(tmp_path / "logs" / "crawler.log", encoding="UTF-8") as f:
+        log = f.read()
+    assert "Crawler退出" in log
+    assert "已保存运行状态" in log
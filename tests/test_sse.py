@@ -0,0 +1,65 @@
+from __future__ import annotations
+import asyncio
+import json
+
+from aiohttp import ClientResponse
+
+from conftest import make_msg, start_client, stop_client, wait_until
+
+async def read_event(resp: ClientResponse) -> dict[str, str]:
+    """读取一个事件，返回各字段的值"""
+    lines = (await asyncio.wait_for(resp.content.readuntil(b"\n\n"), 5)).decode("UTF-8").strip("\n").split("\n")
+    return dict([line.split(": ", 1) for line in lines])
+
+def test_stream_events_and_resume_with_last_event_id(server):
+    server.config_dict["server"] = {"sse_keepalive": 0.05, "sse_retry": 1000}
+    async def main():
+        client = await start_client(server)
+        resp = await client.get("/stream", params={"client_name": "s"})
+        assert resp.headers["Content-Type"] == "text/event-stream"
+        assert await read_event(resp) == {"retry": "1000"}
+        server.push_config_dict["weibo"] = {"1": {"s"}}
+        for i in range(5):
+            await server.delivery_engine.put(make_msg(i))
+        events = [await read_event(resp) for _ in range(5)]
+        assert [event["id"] for event in events] == ["1", "2", "3", "4", "5"]
+        assert [json.loads(event["data"]) for event in events] == [make_msg(i) for i in range(5)]
+        # 连接中的客户端名称不能重复使用
+        assert (await (await client.get("/stream", params={"client_name": "s"})).json())["code"] == 13
+        resp.close()
+        assert await wait_until(lambda: not "s" in server.ws_conn_dict)
+        # 断开期间的消息暂存在队列中，重连后先重发Last-Event-ID之后的消息
+        await server.delivery_engine.put(make_msg(5))
+        resp = await client.get("/stream", params={"client_name": "s"}, headers={"Last-Event-ID": "3"})
+        await read_event(resp)
+        events = [await read_event(resp) for _ in range(3)]
+        assert [event["id"] for event in events] == ["4", "5", "6"]
+        assert [json.loads(event["data"])["id"] for event in events] == ["3", "4", "5"]
+        resp.close()
+        await stop_client(server, client)
+    asyncio.run(main())
+
+def test_keepalive_comment(server):
+    server.config_dict["server"] = {"sse_keepalive": 0.05}
+    async def main():
+        client = await start_client(server)
+        resp = await client.get("/stream", params={"client_name": "s", "last_event_id": "0"})
+        await read_event(resp)
+        assert await asyncio.wait_for(resp.content.readuntil(b"\n\n"), 5) == b": keepalive\n\n"
+        resp.close()
+        await stop_client(server, client)
+    asyncio.run(main())
+
+def test_stream_errors(server):
+    async def main():
+        client = await start_client(server)
+        assert (await (await client.get("/stream")).json())["code"] == 1
+        resp = await client.get("/stream", params={"client_name": "s"}, headers={"Last-Event-ID": "abc"})
+        assert (await resp.json())["code"] == 21
+        assert (await (await client.get("/stream", params={"client_name": "s", "overflow": "x"})).json())["code"] == 19
+        await stop_client(server, client)
+        server.delivery_engine = None
+        client = await start_client(server, False)
+        assert (await (await client.get("/stream", params={"client_name": "s"})).json())["code"] == 20
+        await stop_client(server, client)
+    asyncio.run(main())
@@ -0,0 +1,22 @@
+from __future__ import annotations
+import asyncio
+
+from conftest import start_client, stop_client
+
+def test_initialized_client_is_listed_before_first_message(server):
+    async def main():
+        client = await start_client(server)
+        resp = await client.post("/init", json={"client_name": "c1", "url": "http://127.0.0.1:1/", "queue_size": 10})
+        assert (await resp.json())["code"] == 0
+        data = (await (await client.get("/stats")).json())["data"]
+        assert data["clients"]["c1"]["queued"] == 0
+        assert data["clients"]["c1"]["delivered"] == 0
+        await stop_client(server, client)
+    asyncio.run(main())
+
+def test_stats_without_engine(server):
+    async def main():
+        client = await start_client(server, False)
+        assert (await (await client.get("/stats")).json())["code"] == 20
+        await stop_client(server, client)
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+from __future__ import annotations
+import json
+import os
+
+import pytest
+
+from crawler.bili_dynamic import bili_dynamic
+from crawler.weibo import weibo
+from util.record import WeiboRecord, DynRecord, LiveRecord
+from util.store import StateStore, get_store, close_store
+
+def reopen(typ: str, record_class=WeiboRecord) -> dict:
+    close_store()
+    return get_store().get_table(typ, None, record_class).load()
+
+def test_migrate_legacy_record_json():
+    with open("record.json", "w", encoding="UTF-8") as f:
+        f.write(json.dumps({"user": {"1": {"last_wb_time": 10, "user": {"name": "a"}}, "2": {}}}))
+    records = get_store().get_table("weibo", "record.json", WeiboRecord).load()
+    assert records == {"1": WeiboRecord(last_wb_time=10, user={"name": "a"}), "2": WeiboRecord()}
+    assert not os.path.exists("record.json")
+    assert os.path.exists("record.json.bak")
+    # 没有任何字段的用户也会保存
+    assert reopen("weibo") == records
+
+def test_save_only_given_uids():
+    table = get_store().get_table("weibo", None, WeiboRecord)
+    records = table.load()
+    records["1"] = WeiboRecord(last_wb_time=1, cmt_config={"last_wb_cmt_time": 1})
+    records["2"] = WeiboRecord(last_wb_time=2)
+    table.save(records)
+    # 原地修改嵌套的dict也能被检测到
+    records["1"]["cmt_config"]["last_wb_cmt_time"] = 5
+    records["2"]["last_wb_time"] = 9
+    table.save(records, ["1"])
+    assert reopen("weibo") == {
+        "1": WeiboRecord(last_wb_time=1, cmt_config={"last_wb_cmt_time": 5}),
+        "2": WeiboRecord(last_wb_time=2)
+    }
+
+def test_delete_user_and_field():
+    table = get_store().get_table("bili_live", None, LiveRecord)
+    records = table.load()
+    records["1"] = LiveRecord(user={"name": "a"}, update_time=1)
+    records["2"] = LiveRecord()
+    table.save(records)
+    del records["1"]["update_time"]
+    del records["2"]
+    table.save(records, ["1", "2"])
+    assert reopen("bili_live", LiveRecord) == {"1": LiveRecord(user={"name": "a"})}
+
+def test_pending_changes_are_flushed_on_close(tmp_path):
+    store = StateStore(str(tmp_path / "meta.db"))
+    store.enqueue("meta", {("a",): "1", ("b",): "2"})
+    store.enqueue("meta", {("b",): None})
+    store.close()
+    store = StateStore(str(tmp_path / "meta.db"))
+    assert store.query("SELECT key, value FROM meta") == [("a", "1")]
+    store.close()
+
+@pytest.mark.parametrize("module, typ, record_class, time_key", [
+    (weibo, "weibo", WeiboRecord, "last_wb_time"),
+    (bili_dynamic, "bili_dyn", DynRecord, "last_dyn_time")
+])
+def test_times_reset_on_load_are_saved(monkeypatch, module, typ, record_class, time_key):
+    table = get_store().get_table(typ, None, record_class)
+    records = table.load()
+    records["1"] = record_class(**{time_key: "invalid"})
+    records["2"] = record_class(**{time_key: 100})
+    table.save(records)
+    close_store()
+    name = "wb" if typ == "weibo" else "dyn"
+    monkeypatch.setattr(module, "record_path", "record.json")
+    monkeypatch.setattr(module, f"{name}_record_dict", None)
+    monkeypatch.setattr(module, f"{name}_record_table", None)
+    getattr(module, f"load_{name}_record")()
+    reset_time = getattr(module, f"{name}_record_dict")["user"]["1"][time_key]
+    assert type(reset_time) == int
+    assert reopen(typ, record_class) == {"1": record_class(**{time_key: reset_time}), "2": record_class(**{time_key: 100})}
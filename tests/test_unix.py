@@ -0,0 +1,65 @@
+from __future__ import annotations
+import asyncio
+import json
+import struct
+
+import pytest
+
+from conftest import make_msg, wait_until
+from push import unix
+from push.engine import DeliveryEngine
+
+pytestmark = pytest.mark.skipif(not unix.is_supported(), reason="不支持Unix domain socket")
+
+class UnixServer:
+    """按长度前缀读取消息的本地Unix domain socket服务"""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.received: list[dict] = []
+        self.server: asyncio.AbstractServer = None
+
+    async def handler(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                length = struct.unpack(">I", await reader.readexactly(4))[0]
+                self.received.append(json.loads(await reader.readexactly(length)))
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_unix_server(self.handler, self.path)
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def ids(self) -> list[str]:
+        return [msg["id"] for msg in self.received]
+
+def test_parse_unix_url():
+    assert unix.parse_unix_url("unix:///run/a.sock, unix://b.sock") == ["/run/a.sock", "b.sock"]
+    for url in ("unix://", "unix:///a.sock,http://b"):
+        with pytest.raises(ValueError):
+            unix.parse_unix_url(url)
+
+def test_only_failed_socket_is_retried(config):
+    config["push"] = {"retries": 0, "breaker_threshold": 1, "breaker_open_time": 0.2}
+    async def main():
+        server_a = UnixServer("a.sock")
+        server_b = UnixServer("b.sock")
+        await server_a.start()
+        engine = DeliveryEngine({"clients": {"c1": "unix://a.sock,unix://b.sock"}, "weibo": {"1": {"c1"}}}, {})
+        await engine.start()
+        await engine.put(make_msg(0))
+        assert await wait_until(lambda: engine.is_parked("c1"))
+        # b.sock恢复后只向b.sock重新发送，a.sock不会重复收到
+        await server_b.start()
+        await engine.put(make_msg(1))
+        assert await wait_until(lambda: len(server_b.received) == 2)
+        assert await engine.drain(5)
+        await engine.stop()
+        await server_a.stop()
+        await server_b.stop()
+        assert server_a.ids() == ["0", "1"]
+        assert server_b.ids() == ["0", "1"]
+    asyncio.run(main())
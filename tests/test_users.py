@@ -0,0 +1,57 @@
+from __future__ import annotations
+import asyncio
+
+import pytest
+
+from crawler.bili_dynamic import bili_dynamic
+from crawler.bili_live import bili_live
+from crawler.weibo import weibo
+from util.record import WeiboRecord, DynRecord, LiveRecord
+from conftest import start_client, stop_client
+
+@pytest.fixture
+def users_server(server, monkeypatch):
+    """开启微博与B站直播，B站动态未开启"""
+    server.config_dict["weibo"]["enable"] = True
+    server.config_dict["bili_live"]["enable"] = True
+    monkeypatch.setattr(weibo, "wb_record_dict", {"user": {
+        "1": WeiboRecord(user={"name": "a"}, update_time=10),
+        "2": WeiboRecord(last_wb_time=1)
+    }})
+    monkeypatch.setattr(bili_dynamic, "dyn_record_dict", {"user": {"1": DynRecord(user={"name": "b"}, update_time=20)}})
+    monkeypatch.setattr(bili_live, "live_record_dict", {"user": {"1": LiveRecord(user={"name": "c", "status": "1"}, update_time=30)}})
+    monkeypatch.setattr(bili_live, "status_time_dict", {"1": 40})
+    return server
+
+def test_get_and_post(server, users_server):
+    async def main():
+        client = await start_client(server, False)
+        expected = {
+            "weibo": {"1": {"user": {"name": "a"}, "update_time": 10}},
+            # 直播状态的更新时间优先使用内存中最后一次查询到的时间
+            "bili_live": {"1": {"user": {"name": "c", "status": "1"}, "update_time": 40}}
+        }
+        # 未开启的爬虫类型、没有用户信息或未添加的用户不返回
+        resp = await (await client.get("/users", params={"uid": "1,2,3"})).json()
+        assert resp == {"code": 0, "msg": "Success", "data": expected}
+        resp = await (await client.post("/users", json={"uid": ["1", "2", "3"]})).json()
+        assert resp["data"] == expected
+        resp = await (await client.get("/users", params={"type": "bili_live,bili_dyn", "uid": "1"})).json()
+        assert resp["data"] == {"bili_live": expected["bili_live"]}
+        resp = await (await client.post("/users", json={"type": ["weibo"], "uid": "1,2"})).json()
+        assert resp["data"] == {"weibo": expected["weibo"]}
+        await stop_client(server, client)
+    asyncio.run(main())
+
+def test_invalid_query(server, users_server, monkeypatch):
+    monkeypatch.setattr(server, "MAX_USERS_QUERY", 3)
+    async def main():
+        client = await start_client(server, False)
+        for params in ({}, {"uid": ","}, {"uid": "1,2,3,4"}, {"type": "weibo,twitter", "uid": "1"}, {"type": ",", "uid": "1"}, {"uid": "1,abc"}, {"uid": "-1"}):
+            assert (await (await client.get("/users", params=params)).json())["code"] == 29
+        for params in ({"uid": [1]}, {"uid": {"1": 1}}, {"type": 1, "uid": "1"}, {"type": ["weibo"], "uid": ["1", None]}):
+            assert (await (await client.post("/users", json=params)).json())["code"] == 29
+        assert (await (await client.post("/users", data="uid=1")).json())["code"] == -1
+        assert (await (await client.post("/users", json=["1"])).json())["code"] == -1
+        await stop_client(server, client)
+    asyncio.run(main())
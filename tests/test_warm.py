@@ -0,0 +1,105 @@
+from __future__ import annotations
+import asyncio
+import time
+
+import pytest
+
+import util.warm as warm
+from conftest import Webhook, make_msg
+from push.engine import DeliveryEngine
+from util.store import close_store
+
+@pytest.fixture(autouse=True)
+def reset_warm(monkeypatch):
+    monkeypatch.setattr(warm, "saved_dict", None)
+    monkeypatch.setattr(warm, "provider_dict", dict())
+    monkeypatch.setattr(warm, "poll_time_dict", dict())
+
+def restart(monkeypatch):
+    close_store()
+    monkeypatch.setattr(warm, "saved_dict", None)
+    monkeypatch.setattr(warm, "provider_dict", dict())
+    monkeypatch.setattr(warm, "poll_time_dict", dict())
+
+def test_state_is_restored_after_restart(monkeypatch):
+    assert warm.get_saved("push/unsent") is None
+    warm.register("push/unsent", lambda: {"c1": [{"id": "1"}]})
+    warm.set_poll_time("weibo")
+    warm.save_state()
+    restart(monkeypatch)
+    assert warm.get_saved("push/unsent") == {"c1": [{"id": "1"}]}
+    assert warm.get_saved("poll_time")["weibo"] <= time.time()
+
+def test_failed_provider_does_not_block_others(monkeypatch):
+    warm.register("broken", lambda: 1 / 0)
+    warm.register("ok", lambda: [1, 2])
+    warm.save_state()
+    restart(monkeypatch)
+    assert warm.get_saved("broken") is None
+    assert warm.get_saved("ok") == [1, 2]
+
+def test_poll_time_of_other_listeners_is_kept(monkeypatch):
+    warm.set_poll_time("weibo")
+    warm.save_state()
+    restart(monkeypatch)
+    weibo_time = warm.get_saved("poll_time")["weibo"]
+    # 本次运行未抓取的监听保留上次的抓取时间
+    warm.set_poll_time("bili_dyn")
+    warm.save_state()
+    restart(monkeypatch)
+    assert warm.get_saved("poll_time")["weibo"] == weibo_time
+    assert "bili_dyn" in warm.get_saved("poll_time")
+
+def test_wait_poll_delays_recent_listener(monkeypatch):
+    warm.set_poll_time("weibo")
+    warm.save_state()
+    restart(monkeypatch)
+    delay_list = []
+    async def sleep(delay):
+        delay_list.append(delay)
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    asyncio.run(warm.wait_poll("weibo", 30))
+    asyncio.run(warm.wait_poll("bili_live", 30))
+    assert 28 < delay_list[0] <= 30
+    assert delay_list[1] == 1
+
+def test_failed_delivery_is_requeued_not_dropped(config):
+    config["push"] = {"retries": 0, "breaker_threshold": 1, "breaker_open_time": 60}
+    async def main():
+        engine = DeliveryEngine({"clients": {"dead": "http://127.0.0.1:1/"}, "weibo": {"1": {"dead"}}}, {})
+        await engine.start()
+        for i in range(3):
+            await engine.put(make_msg(i))
+        # 推送目标熔断后不再等待，也不视为推送完毕
+        assert not await engine.drain(5)
+        await engine.stop_channels()
+        channel = engine.channels["dead"]
+        assert channel.failed == 0
+        assert channel.requeued >= 1
+        assert [msg["id"] for msg in engine.get_unsent()["dead"]] == ["0", "1", "2"]
+        await engine.stop()
+    asyncio.run(main())
+
+def test_unsent_messages_are_restored(config):
+    config["push"] = {"retries": 0, "breaker_threshold": 1, "breaker_open_time": 60}
+    async def main():
+        webhook = Webhook()
+        await webhook.start()
+        push_config_dict = {"clients": {"c1": "http://127.0.0.1:1/"}, "weibo": {"1": {"c1"}}}
+        engine = DeliveryEngine(push_config_dict, {})
+        await engine.start()
+        for i in range(3):
+            await engine.put(make_msg(i))
+        await engine.drain(5)
+        await engine.stop_channels()
+        unsent_dict = engine.get_unsent()
+        await engine.stop()
+        push_config_dict["clients"]["c1"] = webhook.url
+        engine = DeliveryEngine(push_config_dict, {})
+        await engine.start()
+        await engine.restore(unsent_dict)
+        assert await engine.drain(5)
+        await engine.stop()
+        await webhook.stop()
+        assert webhook.ids() == ["0", "1", "2"]
+    asyncio.run(main())
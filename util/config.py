@@ -52,13 +52,13 @@ def load_config() -> None:
                 elif(value == "false"):
                     value = False
                 config_dict[name][key] = value
-        if(config_dict["bili_dyn"]["enable"]):
+        if(config_dict.get("bili_dyn", {}).get("enable", False)):
             bili_cookie_process()
 
-def get_value(section: str, key: str):
+def get_value(section: str, key: str, default = None):
     global config_dict
     if not section in config_dict or not key in config_dict[section]:
-        return None
+        return default
     else:
         return config_dict[section][key]
 
@@ -0,0 +1,101 @@
+from __future__ import annotations
+import json
+import os
+import traceback
+from typing import Any
+
+from util.logger import init_logger
+
+logger = init_logger()
+
+JOURNAL_SUFFIX = ".journal"
+
+def get_path(data: dict, path: list[str]) -> Any:
+    for key in path:
+        if not type(data) == dict or not key in data:
+            return None
+        data = data[key]
+    return data
+
+def set_path(data: dict, path: list[str], value: Any):
+    """value为None时删除该键"""
+    for key in path[:-1]:
+        if value is None and not key in data:
+            return
+        data = data.setdefault(key, dict())
+    if value is None:
+        data.pop(path[-1], None)
+    else:
+        data[path[-1]] = value
+
+def to_json(value: Any):
+    if isinstance(value, set):
+        return sorted(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class Journal:
+    """
+    快照加追加写入的修改日志，每次修改只追加被修改的键的最新值，
+    日志达到compact_size条后将完整内容写入新的快照并原子替换，然后清空日志，
+    启动时读取快照并按顺序重放日志，同一个键重放多次的结果与最后一次相同
+    """
+    def __init__(self, snapshot_path: str, compact_size: int) -> None:
+        self.snapshot_path = snapshot_path
+        self.journal_path = snapshot_path + JOURNAL_SUFFIX
+        self.compact_size = max(compact_size, 1)
+        self.entries = 0
+        self.file = None
+
+    def load(self) -> dict:
+        try:
+            with open(self.snapshot_path, "r", encoding="UTF-8") as f:
+                data = json.loads(f.read())
+        except FileNotFoundError:
+            data = dict()
+        try:
+            with open(self.journal_path, "r", encoding="UTF-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 进程中断时可能残留不完整的最后一行
+                        logger.error(f"修改日志{self.journal_path}中存在无法解析的记录，已跳过")
+                        continue
+                    set_path(data, entry["path"], entry["value"])
+                    self.entries += 1
+        except FileNotFoundError:
+            pass
+        if self.entries > 0:
+            logger.info(f"已从{self.journal_path}重放{self.entries}条修改")
+        return data
+
+    def append(self, data: dict, paths: list[list[str]]):
+        if self.file is None:
+            self.file = open(self.journal_path, "a", encoding="UTF-8")
+        self.file.write("".join([json.dumps({"path": path, "value": get_path(data, path)}, ensure_ascii=False, default=to_json) + "\n" for path in paths]))
+        self.file.flush()
+        self.entries += len(paths)
+        if self.entries >= self.compact_size:
+            self.compact(data)
+
+    def compact(self, data: dict):
+        try:
+            with open(self.snapshot_path + ".tmp", "w", encoding="UTF-8") as f:
+                f.write(json.dumps(data, ensure_ascii=False, default=to_json))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(self.snapshot_path + ".tmp", self.snapshot_path)
+            # 快照替换后才清空日志，中途退出时重放旧日志的结果与快照相同
+            if not self.file is None:
+                self.file.close()
+            self.file = open(self.journal_path, "w", encoding="UTF-8")
+            self.entries = 0
+        except:
+            logger.error(f"压缩修改日志{self.journal_path}错误\n{traceback.format_exc()}")
+
+    def close(self, data: dict):
+        if self.entries > 0:
+            self.compact(data)
+        if not self.file is None:
+            self.file.close()
+            self.file = None
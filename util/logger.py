@@ -20,7 +20,7 @@ def init_logger() -> logging.Logger:
         return logger
     except NameError:
         config_dict = util.config.get_config_dict()
-        is_debug = config_dict["logger"]["debug"]
+        is_debug = config_dict.get("logger", {}).get("debug", False)
         os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
         logger = logging.getLogger(LOGGER_NAME)
         handler = TimedRotatingFileHandler(LOG_PATH, when="midnight", interval=1, encoding="UTF-8")
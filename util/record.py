@@ -0,0 +1,123 @@
+from __future__ import annotations
+import sys
+from typing import Any, Iterator
+
+# 未设置的字段
+MISSING = object()
+
+class UserRecord:
+    """
+    使用__slots__保存的用户记录，比dict占用更少的内存，同时支持原有的dict操作（record["user"]、in、get、del等），
+    FIELDS以外的字段保存在extra中，未设置的字段视为不存在
+    """
+    __slots__ = ("extra",)
+    FIELDS: tuple[str, ...] = ()
+
+    def __init__(self, **fields) -> None:
+        self.extra: dict[str, Any] = None
+        for key, value in fields.items():
+            self[key] = value
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.FIELDS:
+            value = getattr(self, key, MISSING)
+        elif self.extra is None:
+            value = MISSING
+        else:
+            value = self.extra.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = dict()
+            self.extra[key] = value
+
+    def __delitem__(self, key: str):
+        if key in self.FIELDS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        else:
+            if self.extra is None:
+                raise KeyError(key)
+            del self.extra[key]
+
+    def __contains__(self, key: str) -> bool:
+        if key in self.FIELDS:
+            return hasattr(self, key)
+        return not self.extra is None and key in self.extra
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        if not self.extra is None:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        count = 0 if self.extra is None else len(self.extra)
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                count += 1
+        return count
+
+    def __eq__(self, other) -> bool:
+        if type(other) == type(self):
+            for key in self.FIELDS:
+                if getattr(self, key, MISSING) != getattr(other, key, MISSING):
+                    return False
+            return (self.extra or {}) == (other.extra or {})
+        if isinstance(other, (UserRecord, dict)):
+            if len(self) != len(other):
+                return False
+            for key, value in self.items():
+                if other.get(key, MISSING) != value:
+                    return False
+            return True
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()})"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self.FIELDS:
+            return getattr(self, key, default)
+        if self.extra is None:
+            return default
+        return self.extra.get(key, default)
+
+    def keys(self) -> Iterator[str]:
+        return iter(self)
+
+    def items(self) -> Iterator[tuple[str, Any]]:
+        for key in self.FIELDS:
+            value = getattr(self, key, MISSING)
+            if not value is MISSING:
+                yield (key, value)
+        if not self.extra is None:
+            yield from self.extra.items()
+
+    def to_dict(self) -> dict[str, Any]:
+        return dict(self.items())
+
+class WeiboRecord(UserRecord):
+    __slots__ = ("last_wb_time", "update_time", "user", "cmt_config")
+    FIELDS = __slots__
+
+class DynRecord(UserRecord):
+    __slots__ = ("last_dyn_time", "update_time", "user", "cmt_config")
+    FIELDS = __slots__
+
+class LiveRecord(UserRecord):
+    __slots__ = ("update_time", "user")
+    FIELDS = __slots__
+
+def intern_uid(uid: str) -> str:
+    """同一个UID在各爬虫的记录与推送配置中共用同一个字符串对象"""
+    return sys.intern(str(uid))
@@ -0,0 +1,66 @@
+from __future__ import annotations
+import time
+from collections import OrderedDict
+
+from util.logger import init_logger
+from util.config import get_value
+from util.store import get_store
+
+logger = init_logger()
+
+class SeenSet:
+    """
+    一种消息（如weibo/comment）已推送的ID，按LRU保留最近的capacity个，新增与淘汰都写入数据库，
+    与各用户的时间水位线配合使用：早于水位线的一定不是新消息，与水位线同一秒的以ID是否已推送判断
+    """
+    def __init__(self, kind: str, capacity: int) -> None:
+        self.kind = kind
+        self.capacity = max(capacity, 1)
+        self.store = get_store()
+        self.ids: OrderedDict[str, None] = OrderedDict()
+        rows = self.store.query("SELECT id FROM seen WHERE kind = ? ORDER BY time DESC LIMIT ?", (kind, self.capacity))
+        for (item_id,) in reversed(rows):
+            self.ids[item_id] = None
+        # 开始记录ID的时间，此前设置的水位线所在的那一秒推送过哪些消息是未知的
+        rows = self.store.query("SELECT value FROM meta WHERE key = ?", (f"seen_warm_since/{kind}",))
+        if rows:
+            self.warm_since = int(rows[0][0])
+        else:
+            self.warm_since = int(time.time())
+            self.store.enqueue("meta", {(f"seen_warm_since/{kind}",): str(self.warm_since)})
+        logger.debug(f"已加载{kind}的{len(self.ids)}条已推送ID")
+
+    def is_new(self, item_id: str, created_time: int, watermark: int) -> bool:
+        if created_time < watermark:
+            return False
+        if item_id in self.ids:
+            self.ids.move_to_end(item_id)
+            return False
+        # 水位线在开始记录ID之前设置时，同一秒的消息可能已经推送过
+        return created_time > watermark or watermark >= self.warm_since
+
+    def add(self, item_id: str):
+        if item_id in self.ids:
+            self.ids.move_to_end(item_id)
+            return
+        self.ids[item_id] = None
+        changes = {(self.kind, item_id): time.time()}
+        while len(self.ids) > self.capacity:
+            changes[(self.kind, self.ids.popitem(last=False)[0])] = None
+        self.store.enqueue("seen", changes)
+
+    def discard(self, item_id: str):
+        """取消add，用于标记为已推送后消息解析失败的情况"""
+        if not item_id in self.ids:
+            return
+        del self.ids[item_id]
+        self.store.enqueue("seen", {(self.kind, item_id): None})
+
+seen_dict: dict[str, SeenSet] = dict()
+
+def get_seen(typ: str, subtype: str) -> SeenSet:
+    """同一种消息的所有监听协程共用一个SeenSet"""
+    kind = f"{typ}/{subtype}"
+    if not kind in seen_dict:
+        seen_dict[kind] = SeenSet(kind, get_value("store", "seen_capacity", 10000))
+    return seen_dict[kind]
@@ -0,0 +1,191 @@
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable
+
+from util.logger import init_logger
+from util.config import get_value
+from util.record import UserRecord, intern_uid
+
+logger = init_logger()
+
+# 每个用户都有一行field为空的记录，使没有任何字段的用户也能保存
+USER_FIELD = ""
+# 各表写入与删除一行的语句，写入的参数为键加值，删除的参数为键
+TABLE_SQL = {
+    "record": (
+        "INSERT OR REPLACE INTO record (type, uid, field, value) VALUES (?, ?, ?, ?)",
+        "DELETE FROM record WHERE type = ? AND uid = ? AND field = ?"
+    ),
+    "seen": (
+        "INSERT OR REPLACE INTO seen (kind, id, time) VALUES (?, ?, ?)",
+        "DELETE FROM seen WHERE kind = ? AND id = ?"
+    ),
+    "meta": (
+        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+        "DELETE FROM meta WHERE key = ?"
+    )
+}
+
+class StateStore:
+    """
+    爬虫记录的SQLite存储，开启WAL模式，每个用户的每个字段为一行，
+    只写入变化的行，所有写入在单独的线程中按批次以事务提交，不阻塞事件循环
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # sqlite3的连接只能在创建它的线程中使用，所有读写都交给同一个线程执行
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state_store")
+        self.conn: sqlite3.Connection = None
+        self.lock = threading.Lock()
+        # 各表待写入的行，键为该表的主键，值为None表示删除，同一行多次修改只写入最后一次
+        self.pending: dict[str, dict[tuple, Any]] = dict()
+        self.scheduled = False
+        self.tables: dict[str, RecordTable] = dict()
+        self.executor.submit(self.connect).result()
+
+    def connect(self):
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS record (type TEXT NOT NULL, uid TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (type, uid, field)) WITHOUT ROWID")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seen (kind TEXT NOT NULL, id TEXT NOT NULL, time REAL NOT NULL, PRIMARY KEY (kind, id)) WITHOUT ROWID")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.commit()
+        logger.info(f"爬虫记录数据库已打开:{self.path}")
+
+    def get_table(self, typ: str, legacy_path: str = None, record_class: type[UserRecord] = dict) -> RecordTable:
+        if not typ in self.tables:
+            self.tables[typ] = RecordTable(self, typ, legacy_path, record_class)
+        return self.tables[typ]
+
+    def query(self, sql: str, params: tuple = ()) -> list[tuple]:
+        """只在启动时加载数据使用，会等待之前的写入完成"""
+        return self.executor.submit(lambda: self.conn.execute(sql, params).fetchall()).result()
+
+    def enqueue(self, table: str, changes: dict[tuple, Any]):
+        with self.lock:
+            self.pending.setdefault(table, dict()).update(changes)
+            if self.scheduled or not changes:
+                return
+            self.scheduled = True
+        self.executor.submit(self.flush)
+
+    def flush(self):
+        """在存储线程中执行，将积累的修改在一个事务中写入"""
+        with self.lock:
+            pending = self.pending
+            self.pending = dict()
+            self.scheduled = False
+        if not pending:
+            return
+        try:
+            with self.conn:
+                for table, changes in pending.items():
+                    upsert_sql, delete_sql = TABLE_SQL[table]
+                    self.conn.executemany(upsert_sql, [(*key, value) for key, value in changes.items() if not value is None])
+                    self.conn.executemany(delete_sql, [key for key, value in changes.items() if value is None])
+        except:
+            logger.error(f"写入爬虫记录数据库错误\n{traceback.format_exc()}")
+            # 保留未写入的修改，下次保存时重试，期间产生的更新的修改优先
+            with self.lock:
+                for table, changes in pending.items():
+                    for key, value in changes.items():
+                        self.pending.setdefault(table, dict()).setdefault(key, value)
+
+    def close(self):
+        """写入所有未保存的修改并关闭数据库"""
+        self.executor.submit(self.flush)
+        self.executor.submit(self.conn.close)
+        self.executor.shutdown(wait=True)
+        logger.info("爬虫记录数据库已关闭")
+
+class RecordTable:
+    """
+    一种爬虫的用户记录，load返回与原record.json中user字段相同结构的dict，
+    save时只比较调用方传入的用户的各字段，只有变化的字段会写入数据库
+    """
+    def __init__(self, store: StateStore, typ: str, legacy_path: str = None, record_class: type[UserRecord] = dict) -> None:
+        self.store = store
+        self.typ = typ
+        self.legacy_path = legacy_path
+        self.record_class = record_class
+        # 各用户上次保存的各字段的副本，用于比较字段是否变化
+        self.saved: dict[str, dict[str, Any]] = dict()
+
+    def load(self) -> dict[str, dict]:
+        rows = self.store.query("SELECT uid, field, value FROM record WHERE type = ?", (self.typ,))
+        if not rows and not self.legacy_path is None and os.path.exists(self.legacy_path):
+            return self.migrate()
+        records: dict[str, UserRecord] = dict()
+        for uid, field, value in rows:
+            uid = intern_uid(uid)
+            if not uid in records:
+                records[uid] = self.record_class()
+                self.saved[uid] = dict()
+            if field != USER_FIELD:
+                records[uid][field] = json.loads(value)
+                self.saved[uid][field] = json.loads(value)
+        return records
+
+    def migrate(self) -> dict[str, dict]:
+        """从原有的record.json导入，导入完成后将其重命名为record.json.bak，只会执行一次"""
+        with open(self.legacy_path, "r", encoding="UTF-8") as f:
+            records = {intern_uid(uid): self.record_class(**record) for uid, record in json.loads(f.read())["user"].items()}
+        self.save(records)
+        self.store.executor.submit(self.store.flush).result()
+        os.replace(self.legacy_path, self.legacy_path + ".bak")
+        logger.info(f"已将{self.typ}的{len(records)}个用户记录从{self.legacy_path}导入数据库")
+        return records
+
+    def save(self, records: dict[str, dict], uids: Iterable[str] = None):
+        """uids为记录可能发生变化（包括添加与删除）的用户，为None时比较全部用户"""
+        if uids is None:
+            uids = set(records.keys()) | set(self.saved.keys())
+        changes: dict[tuple[str, str, str], str] = dict()
+        for uid in uids:
+            record = records.get(uid, None)
+            saved_fields = self.saved.get(uid, None)
+            if record is None:
+                if not saved_fields is None:
+                    for field in list(saved_fields.keys()) + [USER_FIELD]:
+                        changes[(self.typ, uid, field)] = None
+                    del self.saved[uid]
+                continue
+            if saved_fields is None:
+                saved_fields = self.saved[uid] = dict()
+                changes[(self.typ, uid, USER_FIELD)] = "null"
+            for field, value in record.items():
+                if field in saved_fields and saved_fields[field] == value:
+                    continue
+                text = json.dumps(value, ensure_ascii=False)
+                # 保存副本而非引用，记录中的dict会被原地修改
+                saved_fields[field] = json.loads(text)
+                changes[(self.typ, uid, field)] = text
+            if len(saved_fields) > len(record):
+                for field in [field for field in saved_fields if not field in record]:
+                    del saved_fields[field]
+                    changes[(self.typ, uid, field)] = None
+        if changes:
+            self.store.enqueue("record", changes)
+
+store: StateStore = None
+
+def get_store() -> StateStore:
+    global store
+    if store is None:
+        store = StateStore(get_value("store", "path", "state.db"))
+    return store
+
+def close_store():
+    global store
+    if not store is None:
+        store.close()
+        store = None
@@ -0,0 +1,60 @@
+from __future__ import annotations
+import asyncio
+import json
+import time
+import traceback
+from typing import Any, Callable
+
+from util.logger import init_logger
+from util.store import get_store
+
+logger = init_logger()
+
+WARM_KEY = "warm_state"
+
+# 上次退出时保存的状态，只在启动时读取一次
+saved_dict: dict[str, Any] = None
+# 退出时保存的各项状态，值为返回可JSON序列化的对象的函数
+provider_dict: dict[str, Callable[[], Any]] = dict()
+poll_time_dict: dict[str, float] = dict()
+
+def get_saved(key: str, default: Any = None) -> Any:
+    global saved_dict
+    if saved_dict is None:
+        saved_dict = dict()
+        try:
+            rows = get_store().query("SELECT value FROM meta WHERE key = ?", (WARM_KEY,))
+            if rows:
+                saved_dict = json.loads(rows[0][0])
+                logger.info(f"已读取{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(saved_dict.get('saved_time', 0)))}退出时保存的运行状态")
+        except:
+            logger.error(f"读取上次退出时保存的运行状态错误\n{traceback.format_exc()}")
+    return saved_dict.get(key, default)
+
+def register(key: str, provider: Callable[[], Any]):
+    provider_dict[key] = provider
+
+def set_poll_time(name: str):
+    poll_time_dict[name] = time.time()
+
+async def wait_poll(name: str, interval: float):
+    """上次退出前最后一次抓取距今不足interval时，等到间隔结束再开始抓取，避免重启后立即集中抓取"""
+    delay = min(get_saved("poll_time", {}).get(name, 0) + interval - time.time(), interval)
+    if delay > 1:
+        logger.info(f"{name}距上次抓取不足{interval}秒,{delay:.0f}秒后开始抓取")
+        await asyncio.sleep(delay)
+    else:
+        await asyncio.sleep(1)
+
+def save_state():
+    """在退出时调用，写入由数据库线程完成，关闭数据库前会等待写入结束"""
+    state = dict()
+    for key, provider in provider_dict.items():
+        try:
+            state[key] = provider()
+        except:
+            logger.error(f"保存运行状态{key}错误\n{traceback.format_exc()}")
+    state["poll_time"] = {**get_saved("poll_time", {}), **poll_time_dict}
+    state["saved_time"] = time.time()
+    get_store().enqueue("meta", {(WARM_KEY,): json.dumps(state, ensure_ascii=False)})
+    logger.info("已保存运行状态")